@@ -21,9 +21,9 @@ from skoolkit import read_bin_file, VERSION
 from skoolkit.snapshot import write_z80v3
 
 def run(infile, outfile, options):
-    ram = list(read_bin_file(infile, 49152))
+    ram = read_bin_file(infile, 49152)
     org = options.org or 65536 - len(ram)
-    ram = [0] * (org - 16384) + ram + [0] * (65536 - org - len(ram))
+    ram = bytearray(org - 16384) + ram + bytearray(65536 - org - len(ram))
     if options.start is None:
         start = org
     else:
@@ -28,6 +28,7 @@ COMMANDS = {
         'DefbSize': (8, 'defb_size'),
         'DefbZfill': (0, 'zfill'),
         'DefmSize': (66, 'defm_width'),
+        'Jobs': (1, 'jobs'),
         'LineWidth': (79, 'line_width'),
         'ListRefs': (1, 'write_refs'),
         'Text': (0, 'text'),
@@ -48,8 +49,12 @@ COMMANDS = {
         'AsmLabels': (0, 'asm_labels'),
         'AsmOnePage': (0, 'asm_one_page'),
         'Base': (0, 'base'),
+        'CacheDir': ('', 'cache_dir'),
         'Case': (0, 'case'),
         'CreateLabels': (0, 'create_labels'),
+        'ImageJobs': (1, 'image_jobs'),
+        'Incremental': (0, 'incremental'),
+        'Jobs': (1, 'jobs'),
         'JoinCss': ('', 'single_css'),
         'OutputDir': ('.', 'output_dir'),
         'Quiet': (0, 'quiet'),
@@ -60,6 +65,7 @@ COMMANDS = {
     },
     'skool2asm': {
         'Base': (0, 'base'),
+        'CacheDir': ('', 'cache_dir'),
         'Case': (0, 'case'),
         'CreateLabels': (0, 'create_labels'),
         'Quiet': (0, 'quiet'),
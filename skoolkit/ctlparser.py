@@ -275,10 +275,19 @@ class CtlParser:
                 else:
                     break
 
-    def get_blocks(self):
+    def get_blocks(self, start=None, end=None):
+        if start is None:
+            block_addresses = sorted(self._ctls)
+            sub_addresses = sorted(self._subctls)
+        else:
+            # Create only the blocks from 'start' up to 'end' (which must be
+            # the address of a block or the end of the last block)
+            addresses = range(start, end)
+            block_addresses = [a for a in addresses if a in self._ctls] + [end]
+            sub_addresses = [a for a in addresses if a in self._subctls]
+
         # Create top-level blocks
         blocks = []
-        block_addresses = sorted(self._ctls)
         for i, address in enumerate(block_addresses[:-1]):
             block = Block(self._ctls[address], address)
             block.end = block_addresses[i + 1]
@@ -293,11 +302,14 @@ class CtlParser:
             blocks.append(block)
 
         # Create sub-blocks
-        for sub_address in sorted(self._subctls):
-            for block in blocks:
-                if block.start <= sub_address < block.end:
-                    block.add_block(self._subctls[sub_address], sub_address)
-                    break
+        i = 0
+        for sub_address in sub_addresses:
+            while i < len(blocks) and blocks[i].end <= sub_address:
+                i += 1
+            if i == len(blocks):
+                break
+            if blocks[i].start <= sub_address:
+                blocks[i].add_block(self._subctls[sub_address], sub_address)
 
         # Set sub-block end addresses
         for block in blocks:
@@ -17,14 +17,24 @@
 from skoolkit.z80 import convert_case
 
 class Instruction:
-    def __init__(self, address, operation, data):
+    __slots__ = ('address', 'operation', 'snapshot', 'length', 'referrers', 'entry', 'ctl', 'comment', 'asm_directives')
+
+    def __init__(self, address, operation, snapshot, length):
         self.address = address
         self.operation = operation
-        self.bytes = data
+        # The instruction's bytes are not copied, but read from the snapshot
+        # when required
+        self.snapshot = snapshot
+        self.length = length
         self.referrers = []
         self.entry = None
         self.ctl = None
         self.comment = None
+        self.asm_directives = None
+
+    @property
+    def bytes(self):
+        return self.snapshot[self.address:self.address + self.length]
 
     def add_referrer(self, entry):
         if not self.ctl:
@@ -33,7 +43,7 @@ class Instruction:
             self.referrers.append(entry)
 
     def size(self):
-        return len(self.bytes)
+        return self.length
 
 class Disassembler:
     ops = {}
@@ -95,12 +105,30 @@ class Disassembler:
             if address + length <= 65536:
                 if self.asm_lower:
                     operation = convert_case(operation)
-                instructions.append(Instruction(address, operation, self.snapshot[address:address + length]))
+                instructions.append(Instruction(address, operation, self.snapshot, length))
             else:
                 instructions.append(self.defb_line(address, self.snapshot[address:65536]))
             address += length
         return instructions
 
+    def instruction_length(self, address):
+        length = self.op_lengths[self.snapshot[address]]
+        if not length:
+            if self.snapshot[address] == 237:
+                length = self.ed_lengths[self.snapshot[(address + 1) & 65535]]
+            else:
+                length = self.dd_lengths[self.snapshot[(address + 1) & 65535]]
+        return min(length, 65536 - address)
+
+    def lengths(self, start, end=65536):
+        lengths = []
+        address = start
+        while address < end:
+            length = self.instruction_length(address)
+            lengths.append(length)
+            address += length
+        return lengths
+
     def defb_range(self, start, end, sublengths):
         if sublengths[0][0] or end - start <= self.defb_size:
             return [self.defb_line(start, self.snapshot[start:end], sublengths)]
@@ -143,7 +171,7 @@ class Disassembler:
             defw_dir = 'DEFW {}'.format(self._defw_items(data, sublengths))
             if self.asm_lower:
                 defw_dir = convert_case(defw_dir)
-            instructions.append(Instruction(address, defw_dir, data))
+            instructions.append(Instruction(address, defw_dir, self.snapshot, len(data)))
         return instructions
 
     def defm_range(self, start, end, sublengths):
@@ -153,7 +181,7 @@ class Disassembler:
             defm_dir = 'DEFM {}'.format(item_str)
             if self.asm_lower:
                 defm_dir = convert_case(defm_dir)
-            return [Instruction(start, defm_dir, data)]
+            return [Instruction(start, defm_dir, self.snapshot, end - start)]
         instructions = []
         msg = []
         for i in range(start, end):
@@ -175,10 +203,10 @@ class Disassembler:
         defs_dir = 'DEFS {}'.format(','.join(items))
         if self.asm_lower:
             defs_dir = convert_case(defs_dir)
-        return Instruction(start, defs_dir, self.snapshot[start:end])
+        return Instruction(start, defs_dir, self.snapshot, end - start)
 
     def ignore(self, start, end):
-        return [Instruction(start, '', self.snapshot[start:end])]
+        return [Instruction(start, '', self.snapshot, end - start)]
 
     def get_message(self, data):
         message = ''
@@ -305,13 +333,13 @@ class Disassembler:
         return self.defb(a, 4)
 
     def defb_line(self, address, data, sublengths=((None, None),)):
-        return Instruction(address, self.defb_dir(data, sublengths), data)
+        return Instruction(address, self.defb_dir(data, sublengths), self.snapshot, len(data))
 
     def defm_line(self, address, data):
         defm_dir = 'DEFM "{}"'.format(self.get_message(data))
         if self.asm_lower:
             defm_dir = convert_case(defm_dir)
-        return Instruction(address, defm_dir, data)
+        return Instruction(address, defm_dir, self.snapshot, len(data))
 
     def defm_lines(self, address, data):
         lines = []
@@ -1015,3 +1043,30 @@ class Disassembler:
     after_DDCB[238] = index, 'SET 5,(IX{0})'
     after_DDCB[246] = index, 'SET 6,(IX{0})'
     after_DDCB[254] = index, 'SET 7,(IX{0})'
+
+def _get_lengths(table, default, offset=0):
+    decoder_lengths = {
+        Disassembler.no_arg: 1,
+        Disassembler.byte_arg: 2,
+        Disassembler.word_arg: 3,
+        Disassembler.jr_arg: 2,
+        Disassembler.rst_arg: 1,
+        Disassembler.cb_arg: 2,
+        Disassembler.dd_arg: 0,
+        Disassembler.ed_arg: 0,
+        Disassembler.fd_arg: 0,
+        Disassembler.index: 2,
+        Disassembler.index_arg: 3,
+        Disassembler.defb4: 4 - offset,
+        Disassembler.ddcb_arg: 4 - offset
+    }
+    lengths = bytearray([default] * 256)
+    for opcode, (decoder, template) in table.items():
+        lengths[opcode] = decoder_lengths[decoder] + offset
+    return bytes(lengths)
+
+# Instruction lengths by opcode (0 for the DD, ED and FD prefixes), by opcode
+# after ED, and by opcode after DD or FD
+Disassembler.op_lengths = _get_lengths(Disassembler.ops, 0)
+Disassembler.ed_lengths = _get_lengths(Disassembler.after_ED, 2, 1)
+Disassembler.dd_lengths = _get_lengths(Disassembler.after_DD, 1, 1)
@@ -19,7 +19,6 @@ GIF89A = (71, 73, 70, 56, 57, 97)
 AEB = (33, 255, 11, 78, 69, 84, 83, 67, 65, 80, 69, 50, 46, 48, 3, 1, 0, 0, 0)
 GIF_TRAILER = 59
 
-BINSTR = [['{:0{}b}'.format(n, width) for n in range(2 ** width)] for width in range(13)]
 BITS8 = [[(n >> m) & 1 for m in (7, 6, 5, 4, 3, 2, 1, 0)] for n in range(256)]
 
 class GifWriter:
@@ -30,7 +29,7 @@ class GifWriter:
         self.aeb = bytearray(AEB)
         self.gif_trailer = bytearray((GIF_TRAILER,))
 
-    def write_image(self, frames, img_file, palette, attr_map, has_trans, flash_rect):
+    def write_image(self, frames, img_file, palette, attr_map, has_trans, flash_rect, offsets=None):
         frame = frames[0]
         width, height = frame.width, frame.height
         transparent = self.transparency and has_trans
@@ -76,10 +75,11 @@ class GifWriter:
                 img_file.write(self._image_descriptor(f2_w, f2_h, f2_x, f2_y))
                 img_file.write(self._build_image_data(f2_frame, min_code_size))
         else:
-            for frame in frames:
+            for i, frame in enumerate(frames):
                 frame.attr_map = attr_map
+                x_offset, y_offset = offsets[i] if offsets else (0, 0)
                 img_file.write(self._gce(frame.delay, transparent))
-                img_file.write(self._image_descriptor(frame.width, frame.height))
+                img_file.write(self._image_descriptor(frame.width, frame.height, x_offset, y_offset))
                 img_file.write(self._build_image_data(frame, min_code_size))
 
         # GIF trailer
@@ -185,70 +185,67 @@ class GifWriter:
         return ''.join(pixels)
 
     def _compress(self, pixels, min_code_size):
-        # Initialise the dictionary
-        init_d = {chr(i): i for i in range(1 << min_code_size)}
-
-        # Add initial (dummy) STOP and CLEAR codes
+        # The dictionary maps (prefix code, pixel) pairs - packed into a single
+        # integer - to codes; it starts out empty because the code for a
+        # single pixel is the pixel value itself
+        d = {}
         clear_code = 1 << min_code_size
-        stop_code = clear_code + 1
-        init_d[clear_code] = 0
-        init_d[stop_code] = 0
-
-        d = init_d.copy()
-        d_size = len(d) - 1
+        first_code = clear_code + 2
+        next_code = first_code
         code_size = min_code_size + 1
         d_limit = 1 << code_size
-        output = []
-        bit_buf = BINSTR[code_size][clear_code]
-        i = 0
-        num_p = len(pixels)
-        while 1:
-            # Check for max dictionary length
-            if d_size == 4095:
-                # Output a CLEAR code
-                bit_buf = BINSTR[-1][clear_code] + bit_buf
-                # Initialise the dictionary and reset the code size
-                d = init_d.copy()
+
+        # Output bits are accumulated (least significant first) in an integer
+        # and flushed to the output 32 bits at a time
+        output = bytearray()
+        bit_buf = clear_code
+        num_bits = code_size
+
+        data = pixels.encode('latin-1')
+        prefix = data[0]
+        for pixel in data[1:]:
+            key = (prefix << 8) + pixel
+            code = d.get(key)
+            if code is not None:
+                prefix = code
+                continue
+
+            # Output the code for the longest substring already in the
+            # dictionary
+            bit_buf += prefix << num_bits
+            num_bits += code_size
+            if num_bits > 31:
+                output.extend((bit_buf & 0xFFFFFFFF).to_bytes(4, 'little'))
+                bit_buf >>= 32
+                num_bits -= 32
+
+            # Add the code for the new substring
+            if next_code == d_limit:
+                code_size += 1
+                d_limit <<= 1
+            d[key] = next_code
+            if next_code == 4095:
+                # Output a CLEAR code, and then initialise the dictionary and
+                # reset the code size
+                bit_buf += clear_code << num_bits
+                num_bits += 12
+                d = {}
+                next_code = first_code
                 code_size = min_code_size + 1
                 d_limit = 1 << code_size
-
-            # Find the next substring not yet in the dictionary
-            new_substr = ''
-            while i < num_p:
-                new_substr += pixels[i]
-                if new_substr in d:
-                    substr = new_substr
-                    i += 1
-                else:
-                    break
-            bit_buf = BINSTR[code_size][d[substr]] + bit_buf
-
-            k = len(bit_buf)
-            if k > 1023:
-                # Flush full bytes in the bit buffer to the output
-                while k > 31:
-                    value = int(bit_buf[k - 32:k], 2)
-                    output.extend((value & 255, (value >> 8) & 255, (value >> 16) & 255, value >> 24))
-                    k -= 32
-                bit_buf = bit_buf[:k]
-
-            if new_substr not in d:
-                d_size = len(d)
-                if d_size == d_limit:
-                    code_size += 1
-                    d_limit *= 2
-                # Add the code for the new substring
-                d[new_substr] = d_size
             else:
-                break
+                next_code += 1
+            prefix = pixel
 
-        # Output the STOP code
-        bit_buf = BINSTR[code_size][stop_code] + bit_buf
+        # Output the code for the last substring and then the STOP code
+        bit_buf += (prefix + ((clear_code + 1) << code_size)) << num_bits
+        num_bits += 2 * code_size
 
         # Flush any remaining bits from the buffer
-        while bit_buf:
-            output.append(int(bit_buf[-8:], 2))
-            bit_buf = bit_buf[:-8]
+        while num_bits > 0:
+            output.append(bit_buf & 255)
+            bit_buf >>= 8
+            num_bits -= 8
 
         return output
 
@@ -271,7 +271,7 @@ def build_udg(snapshot, addr, attr, step, inc, flip, rotate, mask, mask_addr, ma
     udg_bytes = [(snapshot[addr + n * step] + inc) % 256 for n in range(8)]
     mask_bytes = None
     if mask and mask_addr is not None:
-        mask_bytes = snapshot[mask_addr:mask_addr + 8 * mask_step:mask_step]
+        mask_bytes = list(snapshot[mask_addr:mask_addr + 8 * mask_step:mask_step])
     udg = Udg(attr, udg_bytes, mask_bytes)
     udg.flip(flip)
     udg.rotate(rotate)
@@ -281,7 +281,7 @@ def font_udgs(snapshot, address, attr, message):
     udgs = []
     for c in message:
         a = address + 8 * (ord(c) - 32)
-        udgs.append(Udg(attr, snapshot[a:a + 8]))
+        udgs.append(Udg(attr, list(snapshot[a:a + 8])))
     return [udgs]
 
 def scr_udgs(snapshot, x, y, w, h, df_addr=16384, af_addr=22528):
@@ -291,5 +291,5 @@ def scr_udgs(snapshot, x, y, w, h, df_addr=16384, af_addr=22528):
     for r in range(y, y + height):
         attr_addr = af_addr + 32 * r + x
         addr = df_addr + 2048 * (r // 8) + 32 * (r % 8) + x
-        scr_udgs.append([Udg(snapshot[attr_addr + i], snapshot[addr + i:addr + i + 2048:256]) for i in range(width)])
+        scr_udgs.append([Udg(snapshot[attr_addr + i], list(snapshot[addr + i:addr + i + 2048:256])) for i in range(width)])
     return scr_udgs
@@ -18,7 +18,10 @@
 Defines the :class:`ImageWriter` class.
 """
 
+from collections import OrderedDict
+
 from skoolkit.gifwriter import GifWriter
+from skoolkit.graphics import Frame
 from skoolkit.pngwriter import PngWriter
 
 TRANSPARENT = 'TRANSPARENT'
@@ -45,6 +48,7 @@ GIF_TRANSPARENCY = 'GIFTransparency'
 PNG_ALPHA = 'PNGAlpha'
 PNG_COMPRESSION_LEVEL = 'PNGCompressionLevel'
 PNG_ENABLE_ANIMATION = 'PNGEnableAnimation'
+TILE_CACHE_SIZE = 'TileCacheSize'
 
 PNG_FORMAT = 'png'
 GIF_FORMAT = 'gif'
@@ -84,8 +88,9 @@ class ImageWriter:
             1: OrAndMask(),
             2: AndOrMask()
         }
+        self.tile_cache = TileCache(self.options[TILE_CACHE_SIZE])
         self.writers = {
-            PNG_FORMAT: PngWriter(self.options[PNG_ALPHA] & 255, self.options[PNG_COMPRESSION_LEVEL], self.masks),
+            PNG_FORMAT: PngWriter(self.options[PNG_ALPHA] & 255, self.options[PNG_COMPRESSION_LEVEL], self.masks, self.tile_cache),
             GIF_FORMAT: GifWriter(self.options[GIF_TRANSPARENCY], self.masks)
         }
 
@@ -101,7 +106,63 @@ class ImageWriter:
             attrs.update(frame.attrs)
             has_trans = has_trans or frame.has_trans
         palette, attr_map = self._get_palette(colours, attrs, has_trans)
-        self.writers[img_format].write_image(frames, img_file, palette, attr_map, has_trans, frames[0].flash_rect)
+        offsets = None
+        if len(frames) > 1:
+            frames, offsets = self._get_delta_frames(frames)
+        self.writers[img_format].write_image(frames, img_file, palette, attr_map, has_trans, frames[0].flash_rect, offsets)
+
+    def _get_delta_frames(self, frames):
+        # Replace each frame after the first with a frame that covers only the
+        # part of it that differs from the previous frame (if the two frames
+        # have the same geometry), and compute the offset of each frame
+        delta_frames = [frames[0]]
+        offsets = [(0, 0)]
+        for prev_frame, frame in zip(frames, frames[1:]):
+            delta_frame, offset = self._get_delta_frame(prev_frame, frame)
+            if delta_frame is not frame:
+                self._get_colours(delta_frame)
+            delta_frames.append(delta_frame)
+            offsets.append(offset)
+        return delta_frames, offsets
+
+    def _get_delta_frame(self, prev_frame, frame):
+        geometry = (frame.scale, frame.mask, frame.x, frame.y, frame.width, frame.height)
+        if (prev_frame.scale, prev_frame.mask, prev_frame.x, prev_frame.y, prev_frame.width, prev_frame.height) != geometry:
+            return frame, (0, 0)
+        udgs, prev_udgs = frame.udgs, prev_frame.udgs
+        if [len(row) for row in udgs] != [len(row) for row in prev_udgs]:
+            return frame, (0, 0)
+
+        # Find the rows and columns of the tiles that have changed
+        rows = [i for i, row in enumerate(udgs) if row != prev_udgs[i]]
+        cols = [j for j in range(len(udgs[0])) if any([udgs[i][j] != prev_udgs[i][j] for i in rows])]
+        scale = frame.scale
+        inc = 8 * scale
+
+        if not frame.cropped:
+            if rows:
+                r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+            else:
+                # Nothing has changed, but the frame (and its delay) must
+                # still be present, so use the top-left tile
+                r0, r1, c0, c1 = 0, 1, 0, 1
+            if r1 - r0 == len(udgs) and c1 - c0 == len(udgs[0]):
+                return frame, (0, 0)
+            delta_udgs = [row[c0:c1] for row in udgs[r0:r1]]
+            return Frame(delta_udgs, scale, frame.mask, delay=frame.delay), (c0 * inc, r0 * inc)
+
+        x0, y0 = frame.x, frame.y
+        x1, y1 = x0 + frame.width, y0 + frame.height
+        if rows:
+            dx0, dx1 = max(x0, cols[0] * inc), min(x1, (cols[-1] + 1) * inc)
+            dy0, dy1 = max(y0, rows[0] * inc), min(y1, (rows[-1] + 1) * inc)
+        if not rows or dx0 >= dx1 or dy0 >= dy1:
+            # Nothing has changed in the visible part of the frame, so use
+            # the top-left pixel
+            dx0, dx1, dy0, dy1 = x0, x0 + 1, y0, y0 + 1
+        if (dx0, dx1, dy0, dy1) == (x0, x1, y0, y1):
+            return frame, (0, 0)
+        return Frame(udgs, scale, frame.mask, dx0, dy0, dx1 - dx0, dy1 - dy0, frame.delay), (dx0 - x0, dy0 - y0)
 
     def select_format(self, frames):
         if frames and self.default_animation_format != self.default_format:
@@ -141,7 +202,8 @@ class ImageWriter:
             PNG_ENABLE_ANIMATION: 1,
             PNG_ALPHA: 255,
             GIF_ENABLE_ANIMATION: 1,
-            GIF_TRANSPARENCY: 0
+            GIF_TRANSPARENCY: 0,
+            TILE_CACHE_SIZE: 4096
         }
 
     def _create_colours(self, palette):
@@ -190,6 +252,7 @@ class ImageWriter:
 
     def _get_colours(self, frame, use_flash=False):
         udg_array = frame.udgs
+        tile_cache = self.tile_cache if self.tile_cache.size > 0 else None
         null_mask = frame.mask == 0
         scale = frame.scale
         mask = self.masks[frame.mask]
@@ -221,11 +284,22 @@ class ImageWriter:
                 has_non_trans = False
                 if udg_whole:
                     # Uncropped UDG
-                    for i in range(8):
-                        pixels = mask.apply(udg, i, paper, ink, None)
-                        has_trans, has_non_trans = self._check_pixels(colours, pixels, ink, paper, has_trans, has_non_trans)
-                        if ink in colours and paper in colours and has_non_trans and (null_mask or has_trans):
-                            break
+                    tile = None
+                    if tile_cache:
+                        key = (attr & 127, frame.mask, tuple(udg.data), udg.mask and tuple(udg.mask))
+                        tile = tile_cache.get(key)
+                    if tile is None:
+                        tile_colours = set()
+                        tile_has_trans = False
+                        for i in range(8):
+                            pixels = mask.apply(udg, i, paper, ink, None)
+                            tile_has_trans, has_non_trans = self._check_pixels(tile_colours, pixels, ink, paper, tile_has_trans, has_non_trans)
+                        tile = (frozenset(tile_colours), tile_has_trans, has_non_trans)
+                        if tile_cache:
+                            tile_cache.put(key, tile)
+                    colours.update(tile[0])
+                    has_trans = has_trans or tile[1]
+                    has_non_trans = tile[2]
                 else:
                     # Cropped UDG
                     min_k = max(0, (x0 - x) // scale)
@@ -286,6 +360,29 @@ class ImageWriter:
 
         return palette, attr_map
 
+class TileCache:
+    # A bounded cache of the results of analysing and rasterising tiles, from
+    # which the least recently used entry is discarded when it is full
+    def __init__(self, size):
+        self.size = size
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        if len(self._entries) > self.size:
+            self._entries.popitem(False)
+        return value
+
 class NoMask:
     def apply(self, udg, row, paper, ink, trans):
         udg_byte = udg.data[row]
@@ -27,7 +27,6 @@ FCTL = (102, 99, 84, 76)
 IDAT = (73, 68, 65, 84)
 FDAT = (102, 100, 65, 84)
 IEND_CHUNK = (0, 0, 0, 0, 73, 69, 78, 68, 174, 66, 96, 130)
-CRC_MASK = 4294967295
 
 BITS4 = [[int(d) for d in '{:04b}'.format(n)] for n in range(16)]
 BIT_PAIRS = [[((n << m) & 128) // 64 + ((n << m) & 8) // 8 for m in range(4)] for n in range(256)]
@@ -48,22 +47,36 @@ def _get_bytes(depth, scale):
             bd_bytes[scale].append(tuple([int(b[i:i + 8], 2) for i in range(0, len(b), 8)]))
     return bd_bytes[scale]
 
+# For each bit depth, translation tables that shift a colour index into each
+# pixel position (from the left) in a byte
+PACK_TABLES = {d: [bytes([(v << (8 - d * (n + 1))) & 255 for v in range(256)]) for n in range(8 // d)] for d in (1, 2, 4)}
+
+def _pack(pixels, bit_depth):
+    # Pack a row of colour indexes (one per byte) into a filtered scanline by
+    # shifting the indexes for each pixel position into place and combining
+    # them as integers
+    tables = PACK_TABLES[bit_depth]
+    num_tables = len(tables)
+    value = 0
+    for n, table in enumerate(tables):
+        value |= int.from_bytes(pixels[n::num_tables].translate(table), 'big')
+    return b'\0' + value.to_bytes(len(pixels) // num_tables, 'big')
+
 class PngWriter:
-    def __init__(self, alpha=255, compression_level=9, masks=None):
+    def __init__(self, alpha=255, compression_level=9, masks=None, tile_cache=None):
         self.alpha = alpha
         self.compression_level = compression_level
         self.masks = masks
-        self._create_crc_table()
+        self.tile_cache = tile_cache
         self._create_png_method_dict()
         self.trns = list(TRNS)
         self.png_signature = bytearray(PNG_SIGNATURE)
         self.actl_chunk = bytearray(ACTL_CHUNK)
-        self.idat = bytearray(IDAT)
-        self.fdat = bytearray(FDAT)
-        self.fdat2 = bytearray(FDAT + (0, 0, 0, 2))
+        self.idat = bytes(IDAT)
+        self.fdat2 = bytes(FDAT + (0, 0, 0, 2))
         self.iend_chunk = bytearray(IEND_CHUNK)
 
-    def write_image(self, frames, img_file, palette, attr_map, has_trans, flash_rect):
+    def write_image(self, frames, img_file, palette, attr_map, has_trans, flash_rect, offsets=None):
         bit_depth, palette_size = self._get_bit_depth(palette)
         frame1 = frames[0]
         width, height = frame1.width, frame1.height
@@ -95,35 +108,25 @@ class PngWriter:
             self._write_fctl_chunk(img_file, seq_num, frame1.delay, width, height)
 
         # IDAT
-        self._write_img_data_chunk(img_file, self.idat + frame1_data)
+        self._write_img_data_chunk(img_file, self.idat, frame1_data)
 
         # fcTL and fdAT
         if len(frames) == 1 and flash_rect:
             f2_x_offset, f2_y_offset, f2_width, f2_height = flash_rect
             self._write_fctl_chunk(img_file, 1, frame1.delay, f2_width, f2_height, f2_x_offset, f2_y_offset)
-            self._write_img_data_chunk(img_file, self.fdat2 + frame2_data)
-        for frame in frames[1:]:
+            self._write_img_data_chunk(img_file, self.fdat2, frame2_data)
+        for i, frame in enumerate(frames[1:], 1):
             frame_data = self._build_image_data(frame, palette_size, bit_depth, attr_map)[0]
             seq_num += 1
-            self._write_fctl_chunk(img_file, seq_num, frame.delay, frame.width, frame.height)
+            x_offset, y_offset = offsets[i] if offsets else (0, 0)
+            self._write_fctl_chunk(img_file, seq_num, frame.delay, frame.width, frame.height, x_offset, y_offset)
             seq_num += 1
-            fdat = self.fdat + bytearray(self._to_bytes(seq_num))
-            self._write_img_data_chunk(img_file, fdat + frame_data)
+            fdat = bytes(FDAT + self._to_bytes(seq_num))
+            self._write_img_data_chunk(img_file, fdat, frame_data)
 
         # IEND
         img_file.write(self.iend_chunk)
 
-    def _create_crc_table(self):
-        self.crc_table = []
-        for i in range(256):
-            c = i
-            for k in range(8):
-                if c & 1:
-                    c = 3988292384 ^ (c >> 1)
-                else:
-                    c = c >> 1
-            self.crc_table.append(c)
-
     def _create_png_method_dict(self):
         # The PNG method dictionary is keyed on:
         #   bit_depth: 0 (1 colour), 1 (2 colours), 2 or 4
@@ -229,33 +232,57 @@ class PngWriter:
 
         return frame1, frame2
 
-    def _get_crc(self, byte_list):
-        crc = CRC_MASK
-        for b in byte_list:
-            crc = self.crc_table[(crc ^ b) & 255] ^ (crc >> 8)
-        return self._to_bytes(crc ^ CRC_MASK)
-
     def _write_chunk(self, img_file, chunk_data):
-        img_file.write(bytearray(self._to_bytes(len(chunk_data) - 4))) # length
-        img_file.write(bytearray(chunk_data))
-        img_file.write(bytearray(self._get_crc(chunk_data))) # CRC
-
-    def _write_img_data_chunk(self, img_file, img_data):
-        img_file.write(bytearray(self._to_bytes(len(img_data) - 4))) # length
+        chunk_data = bytes(chunk_data)
+        img_file.write(bytes(self._to_bytes(len(chunk_data) - 4))) # length
+        img_file.write(chunk_data)
+        img_file.write(bytes(self._to_bytes(zlib.crc32(chunk_data)))) # CRC
+
+    def _write_img_data_chunk(self, img_file, chunk_type, img_data):
+        # The chunk type (and sequence number, if any) and the compressed image
+        # data are written separately, and the CRC is computed over them
+        # incrementally, to avoid copying the image data
+        img_file.write(bytes(self._to_bytes(len(chunk_type) + len(img_data) - 4))) # length
+        img_file.write(chunk_type)
         img_file.write(img_data)
-        img_file.write(bytearray(self._get_crc(img_data))) # CRC
+        img_file.write(bytes(self._to_bytes(zlib.crc32(img_data, zlib.crc32(chunk_type))))) # CRC
 
     def _scan_frame(self, frame, scan_udg_f, *args):
         compressor = zlib.compressobj(self.compression_level)
         img_data = bytearray()
         scale = frame.scale
+        tile_cache = self.tile_cache if self.tile_cache and self.tile_cache.size > 0 else None
+        attr_map = frame.attr_map
+        # The scanlines of a tile depend on the scan method, the scale, the
+        # mask type, the palette indexes of its paper and ink, and its contents
+        prefix = (scan_udg_f.__name__, scale, frame.mask)
         for row in frame.udgs:
             scanlines = (
                 bytearray((0,)), bytearray((0,)), bytearray((0,)), bytearray((0,)),
                 bytearray((0,)), bytearray((0,)), bytearray((0,)), bytearray((0,))
             )
+            s0, s1, s2, s3, s4, s5, s6, s7 = scanlines
             for udg in row:
-                scan_udg_f(udg, scanlines, *args)
+                tile = None
+                if tile_cache:
+                    key = prefix + (attr_map[udg.attr & 127], tuple(udg.data), udg.mask and tuple(udg.mask))
+                    tile = tile_cache.get(key)
+                if tile is None:
+                    tile = (
+                        bytearray(), bytearray(), bytearray(), bytearray(),
+                        bytearray(), bytearray(), bytearray(), bytearray()
+                    )
+                    scan_udg_f(udg, tile, *args)
+                    if tile_cache:
+                        tile_cache.put(key, tile)
+                s0.extend(tile[0])
+                s1.extend(tile[1])
+                s2.extend(tile[2])
+                s3.extend(tile[3])
+                s4.extend(tile[4])
+                s5.extend(tile[5])
+                s6.extend(tile[6])
+                s7.extend(tile[7])
             img_data.extend(compressor.compress(scanlines[0] * scale))
             img_data.extend(compressor.compress(scanlines[1] * scale))
             img_data.extend(compressor.compress(scanlines[2] * scale))
@@ -281,51 +308,22 @@ class PngWriter:
         c0, c1 = x0 // inc, (x0 + width) // inc + 1
         p0 = x0 % inc
         p1 = p0 + width
-        bd4 = bit_depth == 4
-        if bd4:
-            pixels = (
-                (0,) * scale, (1,) * scale, (2,) * scale, (3,) * scale,
-                (4,) * scale, (5,) * scale, (6,) * scale, (7,) * scale,
-                (8,) * scale, (9,) * scale, (10,) * scale, (11,) * scale,
-                (12,) * scale, (13,) * scale, (14,) * scale, (15,) * scale
-            )
-            padding = (0,) * (width & 1)
-        else:
-            pixels = ('0' * scale, '1' * scale, '2' * scale, '3' * scale)
-            digits = 8 // bit_depth
-            zero = '0' * digits
-            padding = '0' * (-width & (digits - 1))
-            base = 2 ** bit_depth
+        pixels = [bytes((i,)) * scale for i in range(16)]
         trans = pixels[0]
+        padding = bytes(-width % (8 // bit_depth))
 
         k0, k1 = (y0 % inc) // scale, min(8, 1 + (y1 - inc * r0 - 1) // scale)
         y = scale * (y0 // scale)
         rows = min(y - y0 + scale, height)
         for row in frame.udgs[r0:r1]:
-            scanlines = (
-                bytearray((0,)), bytearray((0,)), bytearray((0,)), bytearray((0,)),
-                bytearray((0,)), bytearray((0,)), bytearray((0,)), bytearray((0,))
-            )
+            scanlines = [b'\0'] * 8
             pixel_rows = ([], [], [], [], [], [], [], [])
             for udg in row[c0:c1]:
                 paper, ink = attrs[udg.attr & 127]
                 for k in range(k0, k1):
-                    b = mask.apply(udg, k, pixels[paper], pixels[ink], trans)
-                    p = pixel_rows[k]
-                    if bd4:
-                        for px in b:
-                            p.extend(px)
-                    else:
-                        p.extend(b)
+                    pixel_rows[k].extend(mask.apply(udg, k, pixels[paper], pixels[ink], trans))
             for i in range(k0, k1):
-                p = pixel_rows[i]
-                if bd4:
-                    p = p[p0:p1]
-                    p.extend(padding)
-                    scanlines[i].extend([p[j] * 16 + p[j + 1] for j in range(0, len(p), 2)])
-                else:
-                    r = ''.join(p)[p0:p1] + padding
-                    scanlines[i].extend([int(r[n:n + digits], base) for n in range(0, len(r), digits)])
+                scanlines[i] = _pack(b''.join(pixel_rows[i])[p0:p1] + padding, bit_depth)
             img_data.extend(compressor.compress(scanlines[k0] * rows))
             y += (k1 - k0) * scale
             if k1 > k0 + 1:
@@ -500,8 +498,13 @@ class PngWriter:
         return self._scan_frame(frame, self._scan_udg_bd1_at, mask, frame.attr_map, pixels, bits)
 
     def _build_image_data_bd0(self, frame, *args):
-        # 1 colour (i.e. blank), full size; placing the integer value in
-        # brackets means it is evaluated before 'multiplying' the tuple (and is
-        # therefore quicker)
-        scanlines = bytearray((0,) * ((1 + frame.width // 8) * frame.height))
-        return zlib.compress(scanlines, self.compression_level)
+        # 1 colour (i.e. blank), full size; the scanlines are fed to the
+        # compressor 64 at a time, so that the whole image is never held in
+        # memory
+        compressor = zlib.compressobj(self.compression_level)
+        img_data = bytearray()
+        scanline = bytes(1 + frame.width // 8)
+        for y in range(0, frame.height, 64):
+            img_data.extend(compressor.compress(scanline * min(64, frame.height - y)))
+        img_data.extend(compressor.flush())
+        return img_data
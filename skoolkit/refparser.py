@@ -101,6 +101,12 @@ class RefParser:
                 dictionaries.append((section_id, self._get_dictionary(lines)))
         return dictionaries
 
+    def get_all_sections(self):
+        """Return a list of 2-tuples of the form ``(name, lines)``, one for
+        each section, in the order in which the sections were defined.
+        """
+        return [(name, lines[:]) for name, lines in self._sections.items()]
+
     def get_section(self, section_name, paragraphs=False, lines=False, trim=True):
         """Return the contents of a section.
 
@@ -25,6 +25,8 @@ class SftParsingError(SkoolKitError):
     pass
 
 class InstructionLine:
+    __slots__ = ('ctl', 'address', 'operation', 'comment_index', 'comment')
+
     def __init__(self, ctl=None, address=None, operation=None, comment_index=-1, comment=None):
         self.ctl = ctl
         self.address = address
@@ -17,11 +17,12 @@
 import argparse
 import os.path
 import time
+from functools import partial
 
 from skoolkit import info, get_class, show_package_dir, VERSION
 from skoolkit.config import get_config, update_options
 from skoolkit.skoolasm import AsmWriter
-from skoolkit.skoolparser import SkoolParser, CASE_LOWER, CASE_UPPER, BASE_10, BASE_16
+from skoolkit.skoolparser import SkoolParser, parse_skool, CASE_LOWER, CASE_UPPER, BASE_10, BASE_16
 
 def clock(quiet, prefix, operation, *args, **kwargs):
     go = time.time()
@@ -37,9 +38,14 @@ def run(skoolfile, options):
         fname = 'stdin'
     else:
         fname = skoolfile
-    parser = clock(options.quiet, 'Parsed {}'.format(fname), SkoolParser, skoolfile,
-                   options.case, options.base, options.asm_mode, options.warn, options.fix_mode,
-                   False, options.create_labels, True, options.start, options.end)
+    if options.cache_dir:
+        parse = partial(parse_skool, cache_dir=options.cache_dir)
+    else:
+        parse = SkoolParser
+    parser = clock(options.quiet, 'Parsed {}'.format(fname), parse, skoolfile,
+                   case=options.case, base=options.base, asm_mode=options.asm_mode, warnings=options.warn,
+                   fix_mode=options.fix_mode, html=False, create_labels=options.create_labels, asm_labels=True,
+                   min_address=options.start, max_address=options.end)
 
     # Write the ASM file
     cls_name = options.writer or parser.asm_writer_class
@@ -74,6 +80,8 @@ def main(args):
     group = parser.add_argument_group('Options')
     group.add_argument('-c', '--create-labels', dest='create_labels', action='store_const', const=1, default=config['CreateLabels'],
                        help="Create default labels for unlabelled instructions")
+    group.add_argument('--cache-dir', dest='cache_dir', metavar='DIR', default=config['CacheDir'],
+                       help="Cache the parsed skool file in this directory")
     group.add_argument('-D', '--decimal', dest='base', action='store_const', const=BASE_10, default=config['Base'],
                        help="Write the disassembly in decimal")
     group.add_argument('-E', '--end', dest='end', metavar='ADDR', type=int, default=65536,
@@ -28,7 +28,7 @@ class BinWriter:
     def __init__(self, skoolfile, asm_mode=0, fix_mode=0):
         self.asm_mode = asm_mode
         self.fix_mode = fix_mode
-        self.snapshot = [0] * 65536
+        self.snapshot = bytearray(65536)
         self.base_address = len(self.snapshot)
         self.end_address = 0
         self.stack = []
@@ -129,7 +129,7 @@ class BinWriter:
             end_address = end
         data = self.snapshot[base_address:end_address]
         with open_file(binfile, 'wb') as f:
-            f.write(bytearray(data))
+            f.write(data)
         if binfile == '-':
             binfile = 'stdout'
         info("Wrote {}: start={}, end={}, size={}".format(binfile, base_address, end_address, len(data)))
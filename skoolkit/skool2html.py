@@ -21,13 +21,14 @@ import shutil
 import time
 import argparse
 from io import StringIO
+from functools import partial
 
 from skoolkit import (defaults, SkoolKitError, find_file, show_package_dir,
                       write, write_line, get_class, normpath, PACKAGE_DIR, VERSION)
 from skoolkit.config import get_config, update_options
 from skoolkit.refparser import RefParser
 from skoolkit.skoolhtml import FileInfo
-from skoolkit.skoolparser import SkoolParser, CASE_UPPER, CASE_LOWER, BASE_10, BASE_16
+from skoolkit.skoolparser import SkoolParser, parse_skool, CASE_UPPER, CASE_LOWER, BASE_10, BASE_16
 
 SEARCH_DIRS = (
     '',
@@ -234,9 +235,13 @@ def process_file(infile, topdir, options):
         fname = 'skool file from standard input'
     else:
         fname = skoolfile_f
-    skool_parser = clock(SkoolParser, 'Parsing {}'.format(fname), skoolfile_f, case=options.case, base=options.base,
+    if options.cache_dir:
+        parse = partial(parse_skool, cache_dir=options.cache_dir)
+    else:
+        parse = SkoolParser
+    skool_parser = clock(parse, 'Parsing {}'.format(fname), skoolfile_f, case=options.case, base=options.base,
                          html=True, create_labels=options.create_labels, asm_labels=options.asm_labels)
-    file_info = FileInfo(topdir, game_dir, options.new_images)
+    file_info = FileInfo(topdir, game_dir, options.new_images, options.incremental)
     html_writer = html_writer_class(skool_parser, ref_parser, file_info)
 
     # Check that the specified pages exist
@@ -246,9 +251,36 @@ def process_file(infile, topdir, options):
             raise SkoolKitError('Invalid page ID: {0}'.format(page_id))
     pages = pages or all_page_ids
 
-    write_disassembly(html_writer, options.files, ref_search_dir, extra_search_dirs, pages, options.themes, options.single_css)
+    write_disassembly(html_writer, options.files, ref_search_dir, extra_search_dirs, pages, options.themes, options.single_css, options.jobs, options.image_jobs)
+
+def finish_images(writers):
+    for writer in writers:
+        writer.finish_images()
+
+def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages, css_themes, single_css, jobs=1, image_jobs=1):
+    writers = [html_writer]
+    html_writer.set_image_jobs(image_jobs)
+    try:
+        _write_files(writers, files, search_dir, extra_search_dirs, pages, css_themes, single_css, jobs, image_jobs)
+    finally:
+        # Stop any image encoding processes that are still running (which
+        # happens only if an error occurred while writing the files)
+        for writer in writers:
+            writer.close_images()
 
-def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages, css_themes, single_css):
+    if show_timings:
+        hits = sum([w.expand_cache_hits for w in writers])
+        misses = sum([w.expand_cache_misses for w in writers])
+        notify('  Macro expansion cache: {} hits, {} misses'.format(hits, misses))
+        encoded = sum([w.images_encoded for w in writers])
+        copied = sum([w.images_copied for w in writers])
+        notify('  Image files: {} encoded, {} copied'.format(encoded, copied))
+        hits = sum([w.tile_cache_hits for w in writers])
+        misses = sum([w.tile_cache_misses for w in writers])
+        notify('  Image tile cache: {} hits, {} misses'.format(hits, misses))
+
+def _write_files(writers, files, search_dir, extra_search_dirs, pages, css_themes, single_css, jobs, image_jobs):
+    html_writer = writers[0]
     game_dir = html_writer.file_info.game_dir
     paths = html_writer.paths
     game_vars = html_writer.game_vars
@@ -279,7 +311,7 @@ def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages,
             message = 'Writing {}'.format(normpath(game_dir, paths['AsmSinglePage']))
         else:
             message = 'Writing disassembly files in {}'.format(normpath(game_dir, html_writer.code_path))
-        clock(html_writer.write_asm_entries, '  ' + message)
+        clock(html_writer.write_asm_entries, '  ' + message, jobs)
 
     # Write the memory map files
     if 'm' in files:
@@ -301,6 +333,7 @@ def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages,
                 raise SkoolKitError('{}: file not found'.format(normpath(code['Source'])))
             skool2_parser = clock(html_writer.parser.clone, '  Parsing {0}'.format(skoolfile), skoolfile)
             html_writer2 = html_writer.clone(skool2_parser, code_id)
+            writers.append(html_writer2)
             map_name = code['IndexPageId']
             map_path = paths[map_name]
             asm_path = paths[code['CodePathId']]
@@ -309,12 +342,16 @@ def write_disassembly(html_writer, files, search_dir, extra_search_dirs, pages,
                 message = 'Writing {}'.format(normpath(game_dir, paths[code['AsmSinglePageId']]))
             else:
                 message = 'Writing disassembly files in {}'.format(normpath(game_dir, asm_path))
-            clock(html_writer2.write_entries, '    ' + message, asm_path, map_path)
+            clock(html_writer2.write_entries, '    ' + message, asm_path, map_path, jobs)
 
     # Write index.html
     if 'i' in files:
         clock(html_writer.write_index, '  Writing {}'.format(normpath(game_dir, paths['GameIndex'])))
 
+    # Wait for any image files that are being written in the background
+    if image_jobs > 1:
+        clock(finish_images, '  Finishing image files', writers)
+
 def run(files, options):
     if options.output_dir == '.':
         topdir = ''
@@ -346,16 +383,24 @@ def main(args):
                             "option may be used multiple times")
     group.add_argument('-C', '--create-labels', dest='create_labels', action='store_const', const=1, default=config['CreateLabels'],
                        help="Create default labels for unlabelled instructions")
+    group.add_argument('--cache-dir', dest='cache_dir', metavar='DIR', default=config['CacheDir'],
+                       help="Cache the parsed skool file in this directory")
     group.add_argument('-d', '--output-dir', dest='output_dir', metavar='DIR', default=config['OutputDir'],
                        help="Write files in this directory (default is '.')")
     group.add_argument('-D', '--decimal', dest='base', action='store_const', const=BASE_10, default=config['Base'],
                        help="Write the disassembly in decimal")
     group.add_argument('-H', '--hex', dest='base', action='store_const', const=BASE_16, default=config['Base'],
                        help="Write the disassembly in hexadecimal")
+    group.add_argument('--image-jobs', dest='image_jobs', metavar='N', type=int, default=config['ImageJobs'],
+                       help="Encode image files using N background processes\n(default: 1, i.e. no background processes)")
+    group.add_argument('--incremental', dest='incremental', action='store_const', const=1, default=config['Incremental'],
+                       help="Rewrite only those disassembly files whose inputs have\nchanged since the last build")
     group.add_argument('-I', '--ini', dest='params', metavar='p=v', action='append', default=[],
                        help="Set the value of the configuration parameter 'p' to\n'v'; this option may be used multiple times")
     group.add_argument('-j', '--join-css', dest='single_css', metavar='NAME', default=config['JoinCss'],
                        help="Concatenate CSS files into a single file with this name")
+    group.add_argument('--jobs', dest='jobs', metavar='N', type=int, default=config['Jobs'],
+                       help="Write disassembly files using N processes (default: 1)")
     group.add_argument('-l', '--lower', dest='case', action='store_const', const=CASE_LOWER, default=config['Case'],
                        help="Write the disassembly in lower case")
     group.add_argument('-o', '--rebuild-images', dest='new_images', action='store_const', const=1, default=config['RebuildImages'],
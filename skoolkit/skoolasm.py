@@ -17,7 +17,8 @@
 import re
 
 from skoolkit import skoolmacro, SkoolKitError, SkoolParsingError, warn, write_text, wrap
-from skoolkit.skoolmacro import MacroParsingError, UnsupportedMacroError
+from skoolkit.skoolmacro import (MacroParsingError, UnsupportedMacroError, PURE_MACROS, SNAPSHOT_MACROS,
+                                 RE_MACRO)
 from skoolkit.skoolparser import (TableParser, ListParser, BASE_16, CASE_LOWER,
                                   TABLE_MARKER, TABLE_END_MARKER, LIST_MARKER, LIST_END_MARKER)
 
@@ -26,6 +27,9 @@ UDGTABLE_MARKER = '#UDGTABLE'
 DEF_INSTRUCTION_WIDTH = 23
 
 class AsmWriter:
+    # The skool macros whose expansions may be cached
+    pure_macros = PURE_MACROS
+
     def __init__(self, parser, properties):
         self.parser = parser
         self.show_warnings = self._get_int_property(properties, 'warnings', 1)
@@ -87,8 +91,12 @@ class AsmWriter:
 
         self.handle_unsupported_macros = self._get_int_property(properties, 'handle-unsupported-macros', 0)
 
-        self.snapshot = self.parser.snapshot
-        self._snapshots = [(self.snapshot, '')]
+        self._snapshot = self.parser.snapshot
+        self._snapshot_id = self._last_snapshot_id = 0
+        self._snapshots = [(None, '', 0, None)]
+        self._snapshot_exposed = False
+        self._expansions = {}
+        self._warned = False
 
         self.list_parser = ListParser()
 
@@ -121,6 +129,7 @@ class AsmWriter:
             return default
 
     def warn(self, s):
+        self._warned = True
         if self.show_warnings:
             warn(s)
 
@@ -181,7 +190,12 @@ class AsmWriter:
         :meth:`~skoolkit.skoolasm.AsmWriter.push_snapshot`)."""
         if len(self._snapshots) < 2:
             raise SkoolKitError("Cannot pop snapshot when snapshot stack is empty")
-        self.snapshot = self._snapshots.pop()[0]
+        snapshot, name, self._snapshot_id, undo = self._snapshots.pop()
+        if undo is None:
+            self._snapshot = snapshot
+        else:
+            for addr_range, data in reversed(undo):
+                self._snapshot[addr_range] = data
 
     def push_snapshot(self, name=''):
         """Save the current memory snapshot for later retrieval (by
@@ -190,7 +204,41 @@ class AsmWriter:
 
         :param name: An optional name for the snapshot.
         """
-        self._snapshots.append((self.snapshot[:], name))
+        if self._snapshot_exposed:
+            self._snapshots.append((self._snapshot[:], name, self._snapshot_id, None))
+        else:
+            # Instead of copying the snapshot, record the bytes that #POKES
+            # overwrites, so that pop_snapshot() can put them back
+            self._snapshots.append((None, name, self._snapshot_id, []))
+
+    @property
+    def snapshot(self):
+        self._expose_snapshot()
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, value):
+        self._expose_snapshot()
+        self._snapshot = value
+
+    def _expose_snapshot(self):
+        # Once a reference to the snapshot has been handed out via the
+        # 'snapshot' attribute, it may be used to modify the snapshot at any
+        # time, so every undo log on the stack is replaced by a full copy,
+        # and every subsequent push_snapshot() makes a full copy
+        if not self._snapshot_exposed:
+            self._snapshot_exposed = True
+            snapshot = self._snapshot
+            for i in range(len(self._snapshots) - 1, 0, -1):
+                saved, name, snapshot_id, undo = self._snapshots[i]
+                snapshot = snapshot[:]
+                for addr_range, data in reversed(undo):
+                    snapshot[addr_range] = data
+                self._snapshots[i] = (snapshot, name, snapshot_id, None)
+
+    def _snapshot_modified(self):
+        self._last_snapshot_id += 1
+        self._snapshot_id = self._last_snapshot_id
 
     def needs_cwd(self):
         return False
@@ -243,10 +291,11 @@ class AsmWriter:
         return skoolmacro.parse_n(text, index, self.base == BASE_16, self.lower)
 
     def expand_peek(self, text, index):
-        return skoolmacro.parse_peek(text, index, self.snapshot)
+        return skoolmacro.parse_peek(text, index, self._snapshot)
 
     def expand_pokes(self, text, index):
-        return skoolmacro.parse_pokes(text, index, self.snapshot)
+        self._snapshot_modified()
+        return skoolmacro.parse_pokes(text, index, self._snapshot, self._snapshots[-1][3])
 
     def expand_pops(self, text, index):
         return skoolmacro.parse_pops(text, index, self)
@@ -298,7 +347,23 @@ class AsmWriter:
     # API
     def expand(self, text):
         """Return `text` with skool macros expanded."""
-        return skoolmacro.expand_macros(self, text).strip()
+        if text.find('#') < 0:
+            return text.strip()
+
+        key = (text, self._snapshot_id)
+        if key in self._expansions:
+            return self._expansions[key]
+        warned = self._warned
+        self._warned = False
+        snapshot_id = self._snapshot_id
+        expanded = skoolmacro.expand_macros(self, text).strip()
+        impure = set(RE_MACRO.findall(text)) - self.pure_macros
+        if impure - SNAPSHOT_MACROS:
+            self._snapshot_modified()
+        elif not (impure or self._warned or snapshot_id != self._snapshot_id):
+            self._expansions[key] = expanded
+        self._warned |= warned
+        return expanded
 
     def find_markers(self, block_indexes, text, marker, end_marker):
         index = 0
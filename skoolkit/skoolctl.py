@@ -581,6 +581,9 @@ class FakeInstruction:
         self.bases = ''
 
 class Instruction:
+    __slots__ = ('ctl', 'address', 'operation', 'mid_block_comment', 'comment', 'asm_directives',
+                 'ignoreua', 'ignoremrcua', 'inst_ctl', 'bases', 'size', 'length')
+
     def __init__(self, ctl, address, operation, preserve_base):
         self.ctl = ctl
         self.address = address
@@ -18,19 +18,29 @@
 Defines the :class:`FileInfo` and :class:`HtmlWriter` classes.
 """
 
+import hashlib
+import json
+import multiprocessing
 import posixpath
 import os.path
+import pickle
+from queue import Empty
 from os.path import isfile, isdir, basename
 from collections import defaultdict
 import re
+import shutil
+import sys
+import tempfile
 from io import StringIO
+from string import Formatter
 
-from skoolkit import skoolmacro, SkoolKitError, warn, parse_int
+from skoolkit import skoolmacro, SkoolKitError, VERSION, warn, parse_int
 from skoolkit.defaults import REF_FILE
 from skoolkit.graphics import Frame, adjust_udgs, build_udg, font_udgs, scr_udgs
 from skoolkit.image import ImageWriter
 from skoolkit.refparser import RefParser
-from skoolkit.skoolmacro import MacroParsingError, get_macros, expand_macros
+from skoolkit.skoolmacro import (MacroParsingError, get_macros, expand_macros, PURE_MACROS,
+                                 SNAPSHOT_MACROS, RE_MACRO)
 from skoolkit.skoolparser import TableParser, ListParser, BASE_16, CASE_LOWER
 
 #: The ID of the main disassembly.
@@ -52,9 +62,31 @@ DEF_IMG_PATH = 'UDGImagePath'
 # Default memory map entry types
 DEF_MEMORY_MAP_ENTRY_TYPES = 'bcgstuw'
 
+# The counters that are reported by skool2html.py -t (and collected from the
+# processes that write entries in parallel)
+STATS = ('expand_cache_hits', 'expand_cache_misses', 'images_encoded', 'images_copied', 'tile_cache_hits', 'tile_cache_misses')
+
+# The file (in the game directory) in which to record the inputs that
+# produced each disassembly page
+MANIFEST = '.skoolkit-manifest'
+
 def join(*path_components):
     return '/'.join([c for c in path_components if c.replace('/', '')])
 
+# The image writer used by a process in an HtmlWriter's image encoding pool
+_pool_image_writer = None
+
+def _init_image_worker(image_writer):
+    global _pool_image_writer
+    _pool_image_writer = image_writer
+
+def _write_image_file(path, frames, img_format):
+    tile_cache = _pool_image_writer.tile_cache
+    hits, misses = tile_cache.hits, tile_cache.misses
+    with open(path, 'wb') as f:
+        _pool_image_writer.write_image(pickle.loads(frames), f, img_format)
+    return tile_cache.hits - hits, tile_cache.misses - misses
+
 class HtmlWriter:
     """Converts a skool file and its associated ref files to HTML.
 
@@ -66,6 +98,9 @@ class HtmlWriter:
     :param file_info: The `FileInfo` object to use.
     :param code_id: The ID of the disassembly.
     """
+    # The skool macros whose expansions may be cached
+    pure_macros = PURE_MACROS
+
     def __init__(self, skool_parser, ref_parser, file_info=None, code_id=MAIN_CODE_ID):
         self.parser = skool_parser
         self.ref_parser = ref_parser
@@ -86,10 +121,28 @@ class HtmlWriter:
         self.image_writer = ImageWriter(colours, iw_options)
         self.default_image_format = self.image_writer.default_format
         self.frames = {}
-
-        self.snapshot = self.parser.snapshot
-        self._snapshots = [(self.snapshot, '')]
+        self._image_sources = {}
+        self._image_digests = {}
+        self.images_encoded = self.images_copied = 0
+        self._image_jobs = 1
+        self._image_pool = None
+        self._pending_images = {}
+        self._image_copies = []
+        self._shared_state_used = False
+        self._images_used = set()
+        self._entry_images = {}
+
+        self._snapshot = self.parser.snapshot
+        self._snapshot_id = self._last_snapshot_id = 0
+        self._snapshots = [(None, '', 0, None)]
+        self._snapshot_exposed = False
+        self._expansions = {}
+        self._warned = False
+        self.skoolkit = {}
+        self.expand_cache_hits = self.expand_cache_misses = 0
         self.asm_entry_dicts = {}
+        self.volatile_entry_dicts = set()
+        self.entry_dict_images = {}
         self.map_entry_dicts = {}
         self.nonexistent_entry_dict = defaultdict(lambda: '', exists=0)
         self.memory_map = [e for e in self.parser.memory_map if e.ctl != 'i']
@@ -213,7 +266,7 @@ class HtmlWriter:
         self.templates = {}
         for name, template in self.get_sections('Template'):
             self.templates[name] = template
-        self.skoolkit = {}
+        self._compiled_templates = {}
         self.stylesheets = {}
         self.javascript = {}
         self.logo = {}
@@ -242,17 +295,67 @@ class HtmlWriter:
     def case(self):
         return self.parser.case
 
+    @property
+    def tile_cache_hits(self):
+        return self.image_writer.tile_cache.hits
+
+    @tile_cache_hits.setter
+    def tile_cache_hits(self, value):
+        self.image_writer.tile_cache.hits = value
+
+    @property
+    def tile_cache_misses(self):
+        return self.image_writer.tile_cache.misses
+
+    @tile_cache_misses.setter
+    def tile_cache_misses(self, value):
+        self.image_writer.tile_cache.misses = value
+
     def warn(self, s):
+        self._warned = True
         warn(s)
 
     def clone(self, skool_parser, code_id):
         the_clone = self.__class__(skool_parser, self.ref_parser, self.file_info, code_id)
         the_clone.set_style_sheet(self.game_vars['StyleSheet'])
+        the_clone.set_image_jobs(self._image_jobs)
         return the_clone
 
     def set_style_sheet(self, value):
         self.game_vars['StyleSheet'] = value
 
+    def set_image_jobs(self, jobs):
+        # If jobs > 1, image files are written in the background, and
+        # finish_images() must be called to wait for them to be completed
+        self._image_jobs = jobs
+
+    def finish_images(self):
+        pool, self._image_pool = self._image_pool, None
+        if pool:
+            pool.close()
+            try:
+                for result in self._pending_images.values():
+                    if result:
+                        hits, misses = result.get()
+                        self.tile_cache_hits += hits
+                        self.tile_cache_misses += misses
+            finally:
+                pool.join()
+        self._pending_images.clear()
+        for source, image_path in self._image_copies:
+            self.file_info.copy_file(source, image_path)
+        self._image_copies = []
+
+    def close_images(self):
+        # Stop the image encoding pool (if any) without waiting for pending
+        # image files to be completed
+        pool, self._image_pool = self._image_pool, None
+        if pool:
+            pool.terminate()
+            pool.join()
+        self._pending_images.clear()
+        self._image_copies = []
+
     # API
     def format_template(self, name, fields, default=None):
         """Format a template with a set of replacement fields.
@@ -265,6 +368,22 @@ class HtmlWriter:
                         otherwise.
         :return: The formatted string.
         """
+        if default is None:
+            key = (self.skoolkit.get('page_id'), name, None)
+        else:
+            key = (None, name, default)
+        render = self._compiled_templates.get(key)
+        if render is None:
+            render = self._compiled_templates[key] = self._compile_template(name, default)
+        fields.update(self.template_subs)
+        try:
+            return render(fields)
+        except KeyError as e:
+            raise SkoolKitError("Unknown field '{}' in '{}' template".format(e.args[0], name))
+
+    def _compile_template(self, name, default):
+        # Resolve any page-specific override of the named template, check its
+        # syntax, and return a function that renders it
         try:
             if default is None:
                 tname = '{}-{}'.format(self._get_page_id(), name)
@@ -273,11 +392,11 @@ class HtmlWriter:
                 template = self.templates.get(name, self.templates[default])
         except KeyError as e:
             raise SkoolKitError("'{}' template does not exist".format(e.args[0]))
-        fields.update(self.template_subs)
         try:
-            return template.format(**fields)
-        except KeyError as e:
-            raise SkoolKitError("Unknown field '{}' in '{}' template".format(e.args[0], name))
+            list(Formatter().parse(template))
+        except ValueError as e:
+            raise SkoolKitError("Invalid '{}' template: {}".format(name, e.args[0]))
+        return template.format_map
 
     def _expand_values(self, obj, *exceptions):
         if isinstance(obj, str):
@@ -447,7 +566,12 @@ class HtmlWriter:
         :meth:`~skoolkit.skoolhtml.HtmlWriter.push_snapshot`)."""
         if len(self._snapshots) < 2:
             raise SkoolKitError("Cannot pop snapshot when snapshot stack is empty")
-        self.snapshot = self._snapshots.pop()[0]
+        snapshot, name, self._snapshot_id, undo = self._snapshots.pop()
+        if undo is None:
+            self._snapshot = snapshot
+        else:
+            for addr_range, data in reversed(undo):
+                self._snapshot[addr_range] = data
 
     # API
     def push_snapshot(self, name=''):
@@ -457,7 +581,43 @@ class HtmlWriter:
 
         :param name: An optional name for the snapshot.
         """
-        self._snapshots.append((self.snapshot[:], name))
+        if self._snapshot_exposed:
+            self._snapshots.append((self._snapshot[:], name, self._snapshot_id, None))
+        else:
+            # Instead of copying the snapshot, record the bytes that #POKES
+            # overwrites, so that pop_snapshot() can put them back
+            self._snapshots.append((None, name, self._snapshot_id, []))
+
+    @property
+    def snapshot(self):
+        self._expose_snapshot()
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, value):
+        self._expose_snapshot()
+        self._snapshot = value
+
+    def _expose_snapshot(self):
+        # Once a reference to the snapshot has been handed out via the
+        # 'snapshot' attribute, it may be used to modify the snapshot at any
+        # time, so every undo log on the stack is replaced by a full copy,
+        # and every subsequent push_snapshot() makes a full copy
+        if not self._snapshot_exposed:
+            self._snapshot_exposed = True
+            snapshot = self._snapshot
+            for i in range(len(self._snapshots) - 1, 0, -1):
+                saved, name, snapshot_id, undo = self._snapshots[i]
+                snapshot = snapshot[:]
+                for addr_range, data in reversed(undo):
+                    snapshot[addr_range] = data
+                self._snapshots[i] = (snapshot, name, snapshot_id, None)
+
+    def _snapshot_modified(self):
+        # Give the snapshot a new ID so that cached macro expansions that
+        # depend on its previous contents are no longer used
+        self._last_snapshot_id += 1
+        self._snapshot_id = self._last_snapshot_id
 
     def get_page_ids(self):
         return self.page_ids
@@ -473,6 +633,9 @@ class HtmlWriter:
         :param image_path: The full path of the image file relative to the root
                            directory of the disassembly.
         """
+        self._images_used.add(image_path)
+        if image_path in self._pending_images:
+            return False
         return self.file_info.need_image(image_path)
 
     def file_exists(self, fname):
@@ -522,7 +685,7 @@ class HtmlWriter:
         :param df_addr: The display file address to use.
         :param af_addr: The attribute file address to use.
         """
-        return scr_udgs(self.snapshot, x, y, w, h, df_addr, af_addr)
+        return scr_udgs(self._snapshot, x, y, w, h, df_addr, af_addr)
 
     def _get_page_id(self):
         return self.skoolkit['page_id']
@@ -606,9 +769,24 @@ class HtmlWriter:
         entry = self.memory_map[index]
         address = entry.address
         if address not in self.asm_entry_dicts:
+            shared_state_used, images_used = self._shared_state_used, self._images_used
+            self._shared_state_used = False
+            self._images_used = set()
             entry_dict = self._get_entry_dict(cwd, entry)
             entry_dict['map_href'] = '{}#{}'.format(self.relpath(cwd, map_file), self.asm_anchor(entry.address))
             self.asm_entry_dicts[address] = entry_dict
+            self.entry_dict_images[address] = self._images_used
+            if self._shared_state_used:
+                self.volatile_entry_dicts.add(address)
+            self._shared_state_used |= shared_state_used
+            self._images_used = images_used
+        elif address in self.volatile_entry_dicts:
+            # Every page that uses this entry dictionary depends on the shared
+            # state used while creating it
+            self._shared_state_used = True
+        # Every page that uses this entry dictionary also uses the images it
+        # refers to
+        self._images_used.update(self.entry_dict_images[address])
         return self.asm_entry_dicts[address]
 
     def _format_contents_list_items(self, link_list):
@@ -815,6 +993,8 @@ class HtmlWriter:
         page_id = self._get_asm_page_id(self.code_id, entry.ctl)
         fname = join(cwd, self.asm_fname(entry.address))
         self._set_cwd(page_id, fname)
+        self._shared_state_used = False
+        self._images_used = self._entry_images[index] = set()
 
         subs = self._get_asm_entry(cwd, index, map_file)
 
@@ -842,15 +1022,207 @@ class HtmlWriter:
         subs = {'m_asm_entry': '\n'.join(asm_entries)}
         self.write_file(fname, self._format_page(cwd, subs, self.asm_single_page_template))
 
-    def write_entries(self, cwd, map_file):
+    def write_entries(self, cwd, map_file, jobs=1):
         if self.asm_single_page_template:
             self._write_asm_single_page(map_file)
-        else:
+            return
+        indexes = range(len(self.memory_map))
+        incremental = self.file_info.incremental
+        if incremental:
+            keys = self._get_entry_keys(cwd, map_file)
+            if not self.file_info.replace_images:
+                # With --rebuild-images, every page is rewritten, so that every
+                # image it uses is rewritten too
+                indexes = [i for i in indexes if self.file_info.get_file_key(keys[i][0]) != keys[i][1]]
+        volatile = None
+        if jobs > 1 and len(indexes) > 1:
+            self.finish_images()
+            volatile = self._write_entries_in_parallel(cwd, map_file, indexes, jobs)
+            if volatile and incremental:
+                # An unchanged page not written by the workers may depend on
+                # shared state left behind by a page that was, so write the
+                # pages serially instead
+                volatile = None
+        if volatile is None:
+            volatile = set()
+            targets = set(indexes)
+            written = []
             for i in range(len(self.memory_map)):
+                # In incremental mode, once a page has used shared state (such
+                # as the snapshot), every page after it is written, because it
+                # may depend on that state
+                if i in targets or (incremental and volatile):
+                    self.write_entry(cwd, i, map_file)
+                    written.append(i)
+                    if self._shared_state_used:
+                        volatile.add(i)
+            indexes = written
+        if incremental:
+            for i in indexes:
+                fname, key = keys[i]
+                if i in volatile:
+                    self.file_info.set_file_key(fname, None)
+                else:
+                    self.file_info.set_file_key(fname, key, self._entry_images[i])
+            self.file_info.save_manifest()
+
+    def _get_entry_keys(self, cwd, map_file):
+        # The key for an entry's page is a hash of everything that goes into
+        # it: the entry itself, its neighbours (for the prev/next links), and
+        # whatever any entry's page may refer to (the ref files, the snapshot,
+        # and the addresses and labels of every instruction). A page that
+        # modifies or uses state shared with other pages (the snapshot or named
+        # frames) gets no key, and so is always rebuilt (as is every page after
+        # it; see write_entries()).
+        page_key = hashlib.sha1(repr((
+            VERSION,
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.code_id,
+            cwd,
+            map_file,
+            self.file_info.game_dir,
+            sorted(self.game_vars.items()),
+            self.ref_parser.get_all_sections(),
+            [(e.address, e.asm_id, [(i.address, i.addr_str, i.asm_label) for i in e.instructions]) for e in self.parser.memory_map]
+        )).encode())
+        page_key.update(bytes(self._snapshot))
+
+        keys = []
+        for index, entry in enumerate(self.memory_map):
+            key = page_key.copy()
+            key.update(repr((
+                self._entry_summary(index - 1),
+                self._entry_summary(index),
+                self._entry_summary(index + 1),
+                entry.registers and [(r.prefix, r.name, r.contents) for r in entry.registers],
+                entry.end_comment,
+                sorted(entry.ignoreua.items()),
+                [r.address for r in entry.referrers],
+                [self._instruction_summary(i) for i in entry.instructions]
+            )).encode())
+            keys.append((join(cwd, self.asm_fname(entry.address)), key.hexdigest()))
+        return keys
+
+    def _entry_summary(self, index):
+        if 0 <= index < len(self.memory_map):
+            entry = self.memory_map[index]
+            return entry.address, entry.addr_str, entry.asm_id, entry.ctl, entry.size, entry.description, entry.details
+
+    def _instruction_summary(self, instruction):
+        if instruction.reference:
+            reference = (instruction.reference.address, instruction.reference.addr_str, instruction.reference.entry.address)
+        else:
+            reference = None
+        if instruction.comment:
+            comment = (instruction.comment.rowspan, instruction.comment.text)
+        else:
+            comment = None
+        return (instruction.address, instruction.addr_str, instruction.ctl, instruction.operation, instruction.asm_label,
+                instruction.mid_block_comment, comment, reference, [r.address for r in instruction.referrers])
+
+    def write_asm_entries(self, jobs=1):
+        self.write_entries(self.code_path, self.paths[P_MEMORY_MAP], jobs)
+
+    def _write_entries_in_parallel(self, cwd, map_file, indexes, jobs):
+        # Each worker process is forked with a copy of this writer and writes
+        # a contiguous run of entries. Rendering an entry may change the
+        # snapshot (via #POKES or #PUSHS), or fail because it uses a frame
+        # defined in an entry written by another worker; in either case (or if
+        # a worker dies without sending its results) the files written by the
+        # workers are discarded and None is returned so that the entries can
+        # be written serially instead. Otherwise any warnings printed by the
+        # workers are printed here, and the indexes of the entries that used
+        # shared state are returned.
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        context = multiprocessing.get_context('fork')
+        size = -(-len(indexes) // jobs)
+        chunks = [indexes[i:i + size] for i in range(0, len(indexes), size)]
+        queue = context.Queue()
+        stage_dir = tempfile.mkdtemp()
+        try:
+            workers = [context.Process(target=self._write_entry_chunk, args=(n, cwd, map_file, chunk, queue, stage_dir)) for n, chunk in enumerate(chunks)]
+            for worker in workers:
+                worker.start()
+            results = self._get_chunk_results(workers, queue)
+            for worker in workers:
+                worker.join()
+            if not all([r[1] for r in results]):
+                return None
+            # Each worker writes its image files in a staging directory. When
+            # two or more workers write an image file with the same name, the
+            # one that wrote the earliest entry wins, as it would if the
+            # entries were written serially.
+            volatile = set()
+            done = set()
+            for chunk_id, ok, images, frames, chunk_volatile, entry_images, stats, warnings in results:
+                self._entry_images.update(entry_images)
+                for image_path in sorted(images - done):
+                    self.file_info.commit_image(os.path.join(stage_dir, str(chunk_id)), image_path)
+                done.update(images)
+                self.file_info.images.update(images)
+                self.frames.update(frames)
+                volatile.update(chunk_volatile)
+                for name, value in zip(STATS, stats):
+                    setattr(self, name, getattr(self, name) + value)
+                sys.stderr.write(warnings)
+            return volatile
+        finally:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+    def _get_chunk_results(self, workers, queue):
+        # Wait for a result from each worker. A worker that has exited without
+        # sending a result (because it was killed, or its result could not be
+        # pickled) is treated as having failed.
+        results = {}
+        pending = set(range(len(workers)))
+        while pending:
+            try:
+                result = queue.get(timeout=0.1)
+                results[result[0]] = result
+                pending.discard(result[0])
+            except Empty:
+                exited = [n for n in pending if workers[n].exitcode is not None]
+                # Anything sent by a worker before it exited is readable now
+                while True:
+                    try:
+                        result = queue.get_nowait()
+                    except Empty:
+                        break
+                    results[result[0]] = result
+                    pending.discard(result[0])
+                for n in pending.intersection(exited):
+                    results[n] = (n, False, set(), {}, [], {}, [], '')
+                    pending.discard(n)
+        return [results[n] for n in sorted(results)]
+
+    def _write_entry_chunk(self, chunk_id, cwd, map_file, indexes, queue, stage_dir):
+        self._image_jobs = 1
+        self.file_info.stage_images(os.path.join(stage_dir, str(chunk_id)))
+        snapshot = self._snapshot[:]
+        num_snapshots = len(self._snapshots)
+        frames = self.frames.copy()
+        images = self.file_info.images.copy()
+        stats = [getattr(self, name) for name in STATS]
+        volatile = []
+        # Buffer any warnings, so that they are printed only if the files
+        # written by this worker are kept
+        sys.stderr = StringIO()
+        try:
+            for i in indexes:
                 self.write_entry(cwd, i, map_file)
-
-    def write_asm_entries(self):
-        self.write_entries(self.code_path, self.paths[P_MEMORY_MAP])
+                if self._shared_state_used:
+                    volatile.append(i)
+            ok = self._snapshot == snapshot and len(self._snapshots) == num_snapshots
+        except Exception:
+            ok = False
+        new_frames = {}
+        if ok:
+            new_frames = {name: frame for name, frame in self.frames.items() if frames.get(name) is not frame}
+        stats = [getattr(self, name) - value for name, value in zip(STATS, stats)]
+        entry_images = {i: self._entry_images[i] for i in indexes if i in self._entry_images}
+        queue.put((chunk_id, ok, self.file_info.images - images, new_frames, volatile, entry_images, stats, sys.stderr.getvalue()))
 
     def _should_write_map(self, map_details):
         if map_details.get('Write') == '0':
@@ -993,6 +1365,8 @@ class HtmlWriter:
         """
         if len(frames) == 1:
             self.frames[frames[0].name] = frames[0]
+            if frames[0].name:
+                self._shared_state_used = True
         image_path = self.image_path(fname, path_id, frames)
         if image_path:
             if self.need_image(image_path):
@@ -1034,11 +1408,70 @@ class HtmlWriter:
                        the image.
         """
         img_format = self._get_image_format(image_path)
-        f = self.file_info.open_file(image_path, mode='wb')
-        self.image_writer.write_image(frames, f, img_format)
-        f.close()
+        digest = self._image_digest(frames, img_format)
+        if image_path in self._pending_images:
+            self.finish_images()
+        source = self._image_sources.get(digest)
+        if source in self._pending_images and source != image_path:
+            # An identical image is being encoded in the background, so copy
+            # it when it's done
+            self._image_copies.append((source, image_path))
+            self._pending_images[image_path] = None
+            self.images_copied += 1
+        elif source and source != image_path and self.file_exists(source):
+            # An identical image has already been encoded, so copy it
+            self.file_info.copy_file(source, image_path)
+            self.images_copied += 1
+        else:
+            pool = self._get_image_pool()
+            if pool:
+                # The frames are pickled now because they may be modified
+                # (e.g. by a subsequent #UDGARRAY* macro) before the pool gets
+                # round to it
+                path = self.file_info.make_path(image_path)
+                task = (path, pickle.dumps(frames), img_format)
+                self._pending_images[image_path] = pool.apply_async(_write_image_file, task)
+            else:
+                f = self.file_info.open_image_file(image_path)
+                self.image_writer.write_image(frames, f, img_format)
+                f.close()
+            self.images_encoded += 1
+            old_digest = self._image_digests.pop(image_path, None)
+            if self._image_sources.get(old_digest) == image_path:
+                del self._image_sources[old_digest]
+            if digest:
+                self._image_sources[digest] = image_path
+                self._image_digests[image_path] = digest
         self.file_info.add_image(image_path)
 
+    def _get_image_pool(self):
+        # Image files are written by a pool of processes forked with a copy of
+        # the image writer, so that encoding can continue in the background
+        # while pages are being written
+        if self._image_pool is None and self._image_jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            self._image_pool = context.Pool(self._image_jobs, _init_image_worker, (self.image_writer,))
+        return self._image_pool
+
+    def _image_digest(self, frames, img_format):
+        # Compute a digest of everything that determines the contents of the
+        # image file: the format, and the tiles and geometry of each frame
+        digest = hashlib.sha1(img_format.encode())
+        try:
+            for frame in frames:
+                params = (frame.scale, frame.mask, frame.x, frame.y, frame.width, frame.height, frame.delay)
+                digest.update(repr(params).encode())
+                for row in frame.udgs:
+                    digest.update(bytes((len(row),)))
+                    for udg in row:
+                        mask = udg.mask or ()
+                        digest.update(bytes((udg.attr, len(udg.data), len(mask))))
+                        digest.update(bytes(udg.data))
+                        digest.update(bytes(mask))
+        except (TypeError, ValueError):
+            return None
+        return digest.hexdigest()
+
     def build_table(self, table):
         rows = []
         for row in table.rows:
@@ -1130,7 +1563,7 @@ class HtmlWriter:
     def expand_font(self, text, index, cwd):
         end, crop_rect, fname, frame, alt, params = skoolmacro.parse_font(text, index)
         message, addr, chars, attr, scale = params
-        udgs = lambda: font_udgs(self.snapshot, addr, attr, message[:chars])
+        udgs = lambda: font_udgs(self._snapshot, addr, attr, message[:chars])
         frames = [Frame(udgs, scale, 0, *crop_rect, name=frame)]
         return end, self.handle_image(frames, fname, cwd, alt, 'FontImagePath')
 
@@ -1185,15 +1618,19 @@ class HtmlWriter:
         return skoolmacro.parse_n(text, index, self.base == BASE_16, self.case == CASE_LOWER)
 
     def expand_peek(self, text, index, cwd):
-        return skoolmacro.parse_peek(text, index, self.snapshot)
+        return skoolmacro.parse_peek(text, index, self._snapshot)
 
     def expand_pokes(self, text, index, cwd):
-        return skoolmacro.parse_pokes(text, index, self.snapshot)
+        self._shared_state_used = True
+        self._snapshot_modified()
+        return skoolmacro.parse_pokes(text, index, self._snapshot, self._snapshots[-1][3])
 
     def expand_pops(self, text, index, cwd):
+        self._shared_state_used = True
         return skoolmacro.parse_pops(text, index, self)
 
     def expand_pushs(self, text, index, cwd):
+        self._shared_state_used = True
         return skoolmacro.parse_pushs(text, index, self)
 
     def expand_r(self, text, index, cwd):
@@ -1247,7 +1684,7 @@ class HtmlWriter:
     def expand_udg(self, text, index, cwd):
         end, crop_rect, fname, frame, alt, params = skoolmacro.parse_udg(text, index)
         addr, attr, scale, step, inc, flip, rotate, mask, mask_addr, mask_step = params
-        udgs = lambda: [[build_udg(self.snapshot, addr, attr, step, inc, flip, rotate, mask, mask_addr, mask_step)]]
+        udgs = lambda: [[build_udg(self._snapshot, addr, attr, step, inc, flip, rotate, mask, mask_addr, mask_step)]]
         if not fname and not frame:
             try:
                 fname = self.udg_fname_template.format(addr=addr, attr=attr, scale=scale)
@@ -1259,6 +1696,7 @@ class HtmlWriter:
         return end, self.handle_image(frames, fname, cwd, alt)
 
     def _expand_udgarray_with_frames(self, text, index, cwd):
+        self._shared_state_used = True
         end, fname, alt, frames = skoolmacro.parse_udgarray_with_frames(text, index, self.frames)
         return end, self.handle_image(frames, fname, cwd, alt)
 
@@ -1266,7 +1704,7 @@ class HtmlWriter:
         if index < len(text) and text[index] == '*':
             return self._expand_udgarray_with_frames(text, index, cwd)
 
-        end, crop_rect, fname, frame, alt, params = skoolmacro.parse_udgarray(text, index, self.snapshot)
+        end, crop_rect, fname, frame, alt, params = skoolmacro.parse_udgarray(text, index, self._snapshot)
         udg_array, scale, flip, rotate, mask = params
         udgs = lambda: adjust_udgs(udg_array, flip, rotate)
         frames = [Frame(udgs, scale, mask, *crop_rect, name=frame)]
@@ -1284,7 +1722,36 @@ class HtmlWriter:
         working directory, which is required by macros that create images or
         hyperlinks.
         """
-        return expand_macros(self, text, cwd)
+        if text.find('#') < 0:
+            return text
+
+        key = (text, cwd, self.skoolkit.get('page_id'), self._snapshot_id)
+        if key in self._expansions:
+            self.expand_cache_hits += 1
+            expanded, images = self._expansions[key]
+            self._images_used.update(images)
+            return expanded
+        self.expand_cache_misses += 1
+
+        # Only the expansion of text that contains nothing but pure macros,
+        # and that neither used shared state nor produced a warning, is cached
+        # (along with the paths of the images it refers to)
+        shared_state_used, warned, images_used = self._shared_state_used, self._warned, self._images_used
+        self._shared_state_used = self._warned = False
+        self._images_used = set()
+        snapshot_id = self._snapshot_id
+        expanded = expand_macros(self, text, cwd)
+        impure = set(RE_MACRO.findall(text)) - self.pure_macros
+        if impure - SNAPSHOT_MACROS:
+            # #CALL, #INCLUDE and custom macros may modify the snapshot
+            self._snapshot_modified()
+        elif not (impure or self._shared_state_used or self._warned or snapshot_id != self._snapshot_id):
+            self._expansions[key] = (expanded, self._images_used)
+        self._shared_state_used |= shared_state_used
+        self._warned |= warned
+        images_used.update(self._images_used)
+        self._images_used = images_used
+        return expanded
 
 class FileInfo:
     """Utility class for file-related operations.
@@ -1293,12 +1760,17 @@ class FileInfo:
     :param game_dir: The subdirectory of `topdir` in which to write all HTML
                      files and image files.
     :param replace_images: Whether existing images should be overwritten.
+    :param incremental: Whether to rebuild only those disassembly pages whose
+                        inputs have changed since they were last written.
     """
-    def __init__(self, topdir, game_dir, replace_images):
+    def __init__(self, topdir, game_dir, replace_images, incremental=False):
         self.game_dir = game_dir
         self.odir = join(topdir, game_dir)
         self.replace_images = replace_images
+        self.incremental = incremental
         self.images = set()
+        self._stage_dir = None
+        self._manifest = None
 
     def open_file(self, *names, mode='w'):
         path = self.odir
@@ -1314,5 +1786,72 @@ class FileInfo:
     def need_image(self, image_path):
         return (self.replace_images and image_path not in self.images) or not self.file_exists(image_path)
 
+    def stage_images(self, stage_dir):
+        # While a staging directory is set, image files are written there
+        # instead of in the output directory, and are moved into place by
+        # commit_image()
+        self._stage_dir = stage_dir
+
+    def commit_image(self, stage_dir, image_path):
+        staged = join(stage_dir, image_path)
+        if isfile(staged):
+            shutil.move(staged, self.make_path(image_path))
+
     def file_exists(self, fname):
+        if self._stage_dir and isfile(join(self._stage_dir, fname)):
+            return True
         return isfile(join(self.odir, fname))
+
+    def open_image_file(self, image_path):
+        return open(self._make_image_path(image_path), 'wb')
+
+    def _make_image_path(self, image_path):
+        path = join(self._stage_dir or self.odir, image_path)
+        if not isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return path
+
+    def make_path(self, fname):
+        path = join(self.odir, fname)
+        if not isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return path
+
+    def copy_file(self, source, dest):
+        if self._stage_dir and isfile(join(self._stage_dir, source)):
+            source_path = join(self._stage_dir, source)
+        else:
+            source_path = join(self.odir, source)
+        shutil.copyfile(source_path, self._make_image_path(dest))
+
+    def _load_manifest(self):
+        if self._manifest is None:
+            self._manifest = {}
+            if self.file_exists(MANIFEST):
+                try:
+                    with self.open_file(MANIFEST, mode='r') as f:
+                        self._manifest = json.load(f)
+                except ValueError:
+                    pass
+        return self._manifest
+
+    def get_file_key(self, fname):
+        # A file's key is returned only if the file and every image file it
+        # uses exist
+        if self.file_exists(fname):
+            try:
+                key, images = self._load_manifest().get(fname)
+            except (TypeError, ValueError):
+                return None
+            if all([self.file_exists(f) for f in images]):
+                return key
+
+    def set_file_key(self, fname, key, images=()):
+        if key is None:
+            self._load_manifest()[fname] = None
+        else:
+            self._load_manifest()[fname] = [key, sorted(images)]
+
+    def save_manifest(self):
+        with self.open_file(MANIFEST) as f:
+            json.dump(self._load_manifest(), f, sort_keys=True)
@@ -15,7 +15,9 @@
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
 from collections import defaultdict
+from functools import lru_cache
 import inspect
+import operator
 import re
 
 from skoolkit import VERSION, SkoolKitError, SkoolParsingError
@@ -37,8 +39,6 @@ DELIMITERS = {
     '{': '}'
 }
 
-AE_CHARS = frozenset(' !=+-*/<>&|^%$ABCDEFabcdef0123456789()')
-
 INTEGER = '(\d+|\$[0-9a-fA-F]+)'
 
 PARAM_NAME = '[a-z]+'
@@ -53,10 +53,12 @@ RE_EXPAND = re.compile('#[^A-Za-z0-9\s]')
 
 RE_FRAME_ID = re.compile('[^\s,;(]+')
 
-RE_HEX_INT = re.compile('\$([0-9a-fA-F]+)')
+RE_EXPR_TOKEN = re.compile(' *(?:(0[bB][01]+|[0-9]+(?:[eE][-+]?[0-9]+)?)|\$([0-9a-fA-F]+)|(\*\*|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^<>()])|([a-fA-F][0-9a-fA-F]*))')
 
 RE_MACRO = re.compile('#[A-Z]+')
 
+RE_MACRO_END = re.compile('#[A-Z]+$')
+
 RE_MACRO_METHOD = re.compile('expand_([a-z]+)$')
 
 RE_METHOD_NAME = re.compile('[a-zA-Z_][a-zA-Z0-9_]*')
@@ -69,6 +71,18 @@ RE_PARAM_NAME = re.compile('\s*{}\s*='.format(PARAM_NAME))
 
 RE_REGISTER = re.compile("(af?|f|bc?|c|de?|e|hl?|l)'?|i[xy][lh]?|i|pc|r|sp")
 
+# Macros whose output depends only on their parameters, the current working
+# directory and the contents of the memory snapshot, and whose expansions may
+# therefore be cached
+PURE_MACROS = frozenset((
+    '#CHR', '#D', '#EVAL', '#FONT', '#FOR', '#FOREACH', '#HTML', '#IF', '#LINK',
+    '#LIST', '#MAP', '#N', '#PEEK', '#R', '#REG', '#SCR', '#SPACE', '#TABLE',
+    '#UDG', '#UDGARRAY', '#UDGTABLE', '#VERSION'
+))
+
+# Macros that modify or replace the memory snapshot
+SNAPSHOT_MACROS = frozenset(('#POKES', '#POPS', '#PUSHS'))
+
 class UnsupportedMacroError(SkoolKitError):
     pass
 
@@ -119,7 +133,7 @@ def parse_ints(text, index=0, num=0, defaults=(), names=(), fields=None):
             params = _writer.expand(params, *_cwd)
         if fields:
             params = params.format(**fields)
-        return [end] + get_params(params, num, defaults, names, False)
+        return [end] + get_params(params, num, defaults, names)
     if names:
         match = RE_NAMED_PARAMS.match(text, index)
     elif num > 0:
@@ -320,15 +334,153 @@ def _parse_image_fname(text, index, fname=''):
             frame = fname
     return end, fname, frame, alt
 
-def evaluate(param, safe=False):
-    if safe or set(param) <= AE_CHARS:
-        try:
-            return int(eval(RE_HEX_INT.sub(r'int("\1",16)', param).replace('/', '//').replace('&&', ' and ').replace('||', ' or ')))
-        except:
-            pass
-    raise ValueError
+# A name (such as 'abc') in an arithmetic expression
+UNDEFINED = object()
+
+# Binary operators in arithmetic expressions, and their precedence (as in
+# Python, with '/' meaning floor division)
+BINARY_OPERATORS = {
+    '|': (1, operator.or_),
+    '^': (2, operator.xor),
+    '&': (3, operator.and_),
+    '<<': (4, operator.lshift),
+    '>>': (4, operator.rshift),
+    '+': (5, operator.add),
+    '-': (5, operator.sub),
+    '*': (6, operator.mul),
+    '/': (6, operator.floordiv),
+    '%': (6, operator.mod)
+}
+
+COMPARISON_OPERATORS = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne
+}
 
-def get_params(param_string, num=0, defaults=(), names=(), safe=True):
+def _tokenise(param):
+    tokens = []
+    index = 0
+    end = len(param.rstrip(' '))
+    while index < end:
+        match = RE_EXPR_TOKEN.match(param, index)
+        if not match:
+            raise ValueError
+        number, hex_num, op, name = match.groups()
+        if op:
+            tokens.append(op)
+        elif name:
+            tokens.append(UNDEFINED)
+        elif hex_num:
+            tokens.append(int(hex_num, 16))
+        elif number[1:2] in ('b', 'B'):
+            tokens.append(int(number[2:], 2))
+        elif 'e' in number or 'E' in number:
+            tokens.append(float(number))
+        elif number[0] == '0' and number.strip('0'):
+            # Leading zeros are not permitted in a non-zero decimal integer
+            raise ValueError
+        else:
+            tokens.append(int(number))
+        index = match.end()
+    tokens.append(None)
+    return tokens
+
+def _undefined():
+    raise NameError
+
+def _parse_atom(tokens, i):
+    token = tokens[i]
+    if token == '(':
+        node, i = _parse_or(tokens, i + 1)
+        if tokens[i] != ')':
+            raise ValueError
+        return node, i + 1
+    if token is UNDEFINED:
+        # A name is an error only if the expression needs its value
+        return _undefined, i + 1
+    if token is None or isinstance(token, str):
+        raise ValueError
+    return (lambda: token), i + 1
+
+def _parse_factor(tokens, i):
+    if tokens[i] in ('+', '-'):
+        op = operator.pos if tokens[i] == '+' else operator.neg
+        node, i = _parse_factor(tokens, i + 1)
+        return (lambda: op(node())), i
+    node, i = _parse_atom(tokens, i)
+    if tokens[i] == '**':
+        exponent, i = _parse_factor(tokens, i + 1)
+        return (lambda: node() ** exponent()), i
+    return node, i
+
+def _parse_binary(tokens, i, min_precedence=1):
+    node, i = _parse_factor(tokens, i)
+    while tokens[i] in BINARY_OPERATORS:
+        precedence, op = BINARY_OPERATORS[tokens[i]]
+        if precedence < min_precedence:
+            break
+        right, i = _parse_binary(tokens, i + 1, precedence + 1)
+        node = (lambda op, left, right: lambda: op(left(), right()))(op, node, right)
+    return node, i
+
+def _parse_comparison(tokens, i):
+    node, i = _parse_binary(tokens, i)
+    if tokens[i] not in COMPARISON_OPERATORS:
+        return node, i
+    operands = [node]
+    ops = []
+    while tokens[i] in COMPARISON_OPERATORS:
+        ops.append(COMPARISON_OPERATORS[tokens[i]])
+        node, i = _parse_binary(tokens, i + 1)
+        operands.append(node)
+
+    def compare():
+        # Comparisons are chained, as in Python
+        left = operands[0]()
+        for op, operand in zip(ops, operands[1:]):
+            right = operand()
+            if not op(left, right):
+                return False
+            left = right
+        return True
+
+    return compare, i
+
+def _parse_and(tokens, i):
+    node, i = _parse_comparison(tokens, i)
+    while tokens[i] == '&&':
+        right, i = _parse_comparison(tokens, i + 1)
+        node = (lambda left, right: lambda: left() and right())(node, right)
+    return node, i
+
+def _parse_or(tokens, i):
+    node, i = _parse_and(tokens, i)
+    while tokens[i] == '||':
+        right, i = _parse_and(tokens, i + 1)
+        node = (lambda left, right: lambda: left() or right())(node, right)
+    return node, i
+
+@lru_cache(maxsize=4096)
+def _evaluate(param):
+    # An expression contains no variables (replacement fields have already
+    # been substituted), so its value is cached along with its parse tree
+    tokens = _tokenise(param)
+    node, i = _parse_or(tokens, 0)
+    if tokens[i] is not None:
+        raise ValueError
+    return int(node())
+
+def evaluate(param):
+    try:
+        return _evaluate(param)
+    except Exception:
+        raise ValueError
+
+def get_params(param_string, num=0, defaults=(), names=()):
     params = []
     named_params = {}
     index = 0
@@ -359,7 +511,7 @@ def get_params(param_string, num=0, defaults=(), names=(), safe=True):
                 value = p
             if value:
                 try:
-                    param = evaluate(value, safe)
+                    param = evaluate(value)
                 except ValueError:
                     raise InvalidParameterError("Cannot parse integer '{}' in parameter string: '{}'".format(value, param_string))
                 if names and name:
@@ -416,8 +568,15 @@ def expand_macros(writer, text, *cwd):
     if text.find('#') < 0:
         return text
 
+    # Scan forward once, copying expanded text to the output buffer; text
+    # before the current position never needs to be rescanned, and a
+    # replacement string that contains another macro is expanded on its own
+    # (unless it may combine with what follows to form a macro or its
+    # parameters)
+    output = []
+    pos = 0
     while 1:
-        search = RE_MACRO.search(text)
+        search = RE_MACRO.search(text, pos)
         if not search:
             break
         marker = search.group()
@@ -425,9 +584,17 @@ def expand_macros(writer, text, *cwd):
             raise SkoolParsingError('Found unknown macro: {}'.format(marker))
         start, index = search.span()
 
-        while RE_EXPAND.match(text, index):
-            end, expr = parse_strings(text, index + 1, 1)
-            text = text[:index] + expand_macros(writer, expr, *cwd) + text[end:]
+        if RE_EXPAND.match(text, index):
+            # Drop the text already scanned (keeping the character before the
+            # macro) so that splicing in the expansion of '#(...)' copies only
+            # the text from this macro onwards
+            base = start - 1 if start > pos else start
+            output.append(text[pos:base])
+            text = text[base:]
+            start, index, pos = start - base, index - base, 0
+            while RE_EXPAND.match(text, index):
+                end, expr = parse_strings(text, index + 1, 1)
+                text = text[:index] + expand_macros(writer, expr, *cwd) + text[end:]
 
         repf = writer.macros[marker]
         try:
@@ -436,9 +603,24 @@ def expand_macros(writer, text, *cwd):
             raise SkoolParsingError('Found unsupported macro: {}'.format(marker))
         except MacroParsingError as e:
             raise SkoolParsingError('Error while parsing {} macro: {}'.format(marker, e.args[0]))
-        text = text[:start] + rep + text[end:]
 
-    return text
+        if start > pos and text[start - 1] == '#' and rep[:1].isupper():
+            start -= 1
+            rep = '#' + rep
+        output.append(text[pos:start])
+        if rep.endswith('#') or RE_MACRO_END.search(rep):
+            # The replacement string may combine with what follows to form a
+            # macro (or a macro's parameters), so scan them together
+            text = rep + text[end:]
+            pos = 0
+        else:
+            if RE_MACRO.search(rep):
+                rep = expand_macros(writer, rep, *cwd)
+            output.append(rep)
+            pos = end
+
+    output.append(text[pos:])
+    return ''.join(output)
 
 def parse_call(text, index, writer, cwd=None):
     # #CALL:methodName(args)
@@ -687,12 +869,15 @@ def parse_peek(text, index, snapshot):
     end, addr = parse_ints(text, index, 1)
     return end, str(snapshot[addr & 65535])
 
-def parse_pokes(text, index, snapshot):
+def parse_pokes(text, index, snapshot, undo=None):
     # #POKESaddr,byte[,length,step][;addr,byte[,length,step];...]
     end = index - 1
     while end < index or (end < len(text) and text[end] == ';'):
         end, addr, byte, length, step = parse_ints(text, end + 1, 4, (1, 1))
-        snapshot[addr:addr + length * step:step] = [byte] * length
+        addr_range = slice(addr, addr + length * step, step)
+        if undo is not None:
+            undo.append((addr_range, snapshot[addr_range]))
+        snapshot[addr_range] = [byte & 255] * length
     return end, ''
 
 def parse_pops(text, index, writer):
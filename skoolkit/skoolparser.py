@@ -14,10 +14,13 @@
 # You should have received a copy of the GNU General Public License along with
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import html
+import os
+import pickle
 import re
 
-from skoolkit import SkoolParsingError, warn, wrap, get_int_param, parse_int, open_file
+from skoolkit import SkoolParsingError, VERSION, warn, wrap, get_int_param, parse_int, open_file
 from skoolkit.skoolmacro import DELIMITERS, INTEGER, ClosingBracketError, parse_brackets
 from skoolkit.textutils import partition_unquoted, split_quoted
 from skoolkit.z80 import assemble, convert_case, get_size, split_operation
@@ -220,6 +223,94 @@ def parse_address_comments(comments, html=False):
             instruction.set_comment(rowspan, address_comment)
         i += 1
 
+class _EntryPickler(pickle.Pickler):
+    # Entries refer to each other (via instructions, referrers and
+    # references), so pickling them in the normal way would recurse as deeply
+    # as the longest chain of references in the disassembly; instead, each
+    # entry is pickled by ID, and its state is pickled separately
+    def __init__(self, f):
+        pickle.Pickler.__init__(self, f, pickle.HIGHEST_PROTOCOL)
+        self.entries = []
+        self.entry_ids = {}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, SkoolEntry):
+            entry_id = self.entry_ids.get(id(obj))
+            if entry_id is None:
+                entry_id = self.entry_ids[id(obj)] = len(self.entries)
+                self.entries.append(obj)
+            return entry_id, obj.__class__
+        return None
+
+    def dump_parser(self, parser):
+        self.dump(parser)
+        i = 0
+        while i < len(self.entries):
+            self.dump(self.entries[i].__dict__)
+            i += 1
+
+class _EntryUnpickler(pickle.Unpickler):
+    def __init__(self, f):
+        pickle.Unpickler.__init__(self, f)
+        self.entries = {}
+
+    def persistent_load(self, pid):
+        entry_id, entry_class = pid
+        if entry_id not in self.entries:
+            self.entries[entry_id] = entry_class.__new__(entry_class)
+        return self.entries[entry_id]
+
+    def load_parser(self):
+        parser = self.load()
+        for i in range(len(self.entries)):
+            self.entries[i].__dict__.update(self.load())
+        return parser
+
+def parse_skool(skoolfile, cache_dir=None, **options):
+    """Parse a skool file, or load the result of parsing it from a cache.
+
+    :param skoolfile: The name of the skool file to parse.
+    :param cache_dir: The directory in which to cache the parser. If this is
+                      `None`, or `skoolfile` is '-' (standard input), no cache
+                      is used.
+    :param options: Keyword arguments to pass to the
+                    :class:`~skoolkit.skoolparser.SkoolParser` constructor.
+    :return: A :class:`~skoolkit.skoolparser.SkoolParser`.
+    """
+    if not cache_dir or skoolfile == '-':
+        return SkoolParser(skoolfile, **options)
+
+    # The cache key is determined by the contents of the skool file, the
+    # parser options and the SkoolKit version
+    with open_file(skoolfile, 'rb') as f:
+        key = hashlib.sha1(f.read())
+    key.update(repr((VERSION, sorted(options.items()))).encode())
+    cache_file = os.path.join(cache_dir, key.hexdigest() + '.pickle')
+
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                parser = _EntryUnpickler(f).load_parser()
+            parser.skoolfile = skoolfile
+            return parser
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # Ignore a corrupt or outdated cache file
+            pass
+
+    parser = SkoolParser(skoolfile, **options)
+    tmp_file = '{}.{}'.format(cache_file, os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_file, 'wb') as f:
+            _EntryPickler(f).dump_parser(parser)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        # Carry on without a cache if the cache directory is unusable
+        warn('Unable to write cache file {}: {}'.format(cache_file, e.strerror))
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+    return parser
+
 class SkoolParser:
     """Parses a skool file.
 
@@ -252,7 +343,7 @@ class SkoolParser:
         self.case = case
         self.base = base
 
-        self.snapshot = snapshot or [0] * 65536  # 64K of Spectrum memory
+        self.snapshot = snapshot or bytearray(65536)  # 64K of Spectrum memory
         self._instructions = {}                  # address -> [Instructions]
         self._entries = {}                       # address -> SkoolEntry
         self.memory_map = []                     # SkoolEntry instances
@@ -841,6 +932,10 @@ class Mode:
         return operation
 
 class Instruction:
+    __slots__ = ('ctl', 'addr_str', 'addr_base', 'address', 'operation', 'container', 'reference',
+                 'mid_block_comment', 'comment', 'referrers', 'asm_label', 'nolabel', 'org', 'sub', 'keep',
+                 'warn', 'ignoreua', 'ignoremrcua')
+
     def __init__(self, ctl, addr_str, operation):
         self.ctl = ctl
         if addr_str[0].isdigit():
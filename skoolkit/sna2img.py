@@ -82,7 +82,7 @@ def _write_image(frame, img_file, animated):
 def run(infile, outfile, options):
     if infile[-4:].lower() == '.scr':
         scr = read_bin_file(infile, 6912)
-        snapshot = [0] * 65536
+        snapshot = bytearray(65536)
         snapshot[16384:16384 + len(scr)] = scr
     elif infile[-4:].lower() in ('.sna', '.szx', '.z80'):
         snapshot = get_snapshot(infile)
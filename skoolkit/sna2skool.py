@@ -16,7 +16,7 @@
 
 import argparse
 
-from skoolkit import info, find_file, read_bin_file, VERSION
+from skoolkit import SkoolKitError, info, find_file, get_int_param, read_bin_file, VERSION
 from skoolkit.config import get_config, update_options
 from skoolkit.ctlparser import CtlParser
 from skoolkit.sftparser import SftParser
@@ -26,6 +26,12 @@ from skoolkit.snaskool import SkoolWriter, generate_ctls, write_ctl
 START = 16384
 END = 65536
 
+def _addresses(arg):
+    try:
+        return [get_int_param(a) for a in arg.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid address list: '{}'".format(arg))
+
 def run(snafile, options, config):
     # Read the snapshot file
     if snafile[-4:].lower() in ('.sna', '.szx', '.z80'):
@@ -37,12 +43,12 @@ def run(snafile, options, config):
             org = 65536 - len(ram)
         else:
             org = options.org
-        snapshot = [0] * org
+        snapshot = bytearray(org)
         snapshot.extend(ram)
         start = max(org, options.start)
     end = min(options.end, len(snapshot))
 
-    snapshot += [0] * (65536 - len(snapshot))
+    snapshot.extend(bytes(65536 - len(snapshot)))
 
     if options.sftfile:
         # Use a skool file template
@@ -53,7 +59,7 @@ def run(snafile, options, config):
 
     if options.genctlfile:
         # Generate a control file
-        ctls = generate_ctls(snapshot, start, end, options.code_map)
+        ctls = generate_ctls(snapshot, start, end, options.code_map, options.trace, options.jobs)
         write_ctl(options.genctlfile, ctls, options.ctl_hex)
         ctl_parser = CtlParser(ctls)
     elif options.ctlfile:
@@ -90,6 +96,8 @@ def main(args):
                        help=argparse.SUPPRESS)
     group.add_argument('-I', '--ini', dest='params', metavar='p=v', action='append', default=[],
                        help="Set the value of the configuration parameter 'p' to 'v'; this option may be used multiple times")
+    group.add_argument('--jobs', dest='jobs', metavar='N', type=int, default=config['Jobs'],
+                       help='Read a code execution log using N processes (default: {})'.format(config['Jobs']))
     group.add_argument('-l', '--defm-size', dest='defm_width', metavar='L', type=int, default=config['DefmSize'],
                        help=argparse.SUPPRESS)
     group.add_argument('-L', '--lower', dest='case', action='store_const', const=1, default=config['Case'],
@@ -114,6 +122,8 @@ def main(args):
                        help=argparse.SUPPRESS)
     group.add_argument('-T', '--sft', dest='sftfile', metavar='FILE',
                        help="Use FILE as the skool file template (may be '-' for standard input)")
+    group.add_argument('--trace', dest='trace', metavar='ADDR[,ADDR...]', type=_addresses,
+                       help='Trace the flow of execution from these entry points when generating a control file')
     group.add_argument('-V', '--version', action='version', version='SkoolKit {}'.format(VERSION),
                        help='Show SkoolKit version number and exit')
     group.add_argument('-w', '--line-width', dest='line_width', metavar='W', type=int, default=config['LineWidth'],
@@ -125,6 +135,8 @@ def main(args):
     snafile = namespace.snafile
     if unknown_args or snafile is None:
         parser.exit(2, parser.format_help())
+    if namespace.trace and not namespace.genctlfile:
+        raise SkoolKitError('--trace cannot be used without -g/--generate-ctl')
     if snafile[-4:].lower() in ('.bin', '.sna', '.szx', '.z80'):
         prefix = snafile[:-4]
     else:
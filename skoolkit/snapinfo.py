@@ -15,6 +15,7 @@
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 from skoolkit import SkoolKitError, get_dword, get_int_param, get_word, read_bin_file, VERSION
 from skoolkit.basic import BasicLister, VariableLister, get_char
@@ -360,50 +361,108 @@ def _get_address_ranges(specs, step=1):
         addr_ranges.append(values + [values[0], step][len(values) - 1:])
     return addr_ranges
 
-def _find(snapshot, byte_seq, base_addr=16384):
-    steps = '1'
-    if '-' in byte_seq:
-        byte_seq, steps = byte_seq.split('-', 1)
-    try:
-        byte_values = [get_int_param(i) for i in byte_seq.split(',')]
-    except ValueError:
-        raise SkoolKitError('Invalid byte sequence: {}'.format(byte_seq))
+def _search(snapshot, byte_values, step=1, start=16384):
+    # Return the addresses at which 'byte_values' occurs with 'step' between
+    # bytes, searching for each byte sequence with bytes.find() (in a copy of
+    # the snapshot that takes every 'step'th byte when step > 1)
+    end = 65536 - step * (len(byte_values) - 1)
+    addresses = []
+    for offset in range(step):
+        data = snapshot[start + offset::step] if step > 1 else snapshot[start:]
+        i = data.find(byte_values)
+        while 0 <= i:
+            a = start + offset + i * step
+            if a >= end:
+                break
+            addresses.append(a)
+            i = data.find(byte_values, i + 1)
+    return sorted(addresses)
+
+def _get_steps(steps):
     try:
         if '-' in steps:
             limits = [get_int_param(n) for n in steps.split('-', 1)]
-            steps = range(limits[0], limits[1] + 1)
         else:
-            steps = [get_int_param(steps)]
+            limits = [get_int_param(steps)] * 2
+        if limits[0] < 1:
+            raise ValueError
+        return range(limits[0], limits[1] + 1)
     except ValueError:
         raise SkoolKitError('Invalid distance: {}'.format(steps))
-    for step in steps:
-        offset = step * len(byte_values)
-        for a in range(base_addr, 65537 - offset):
-            if snapshot[a:a + offset:step] == byte_values:
-                print("{0}-{1}-{2} {0:04X}-{1:04X}-{2:X}: {3}".format(a, a + offset - step, step, byte_seq))
-
-def _find_tile(snapshot, coords):
-    steps = '1'
-    if '-' in coords:
-        coords, steps = coords.split('-', 1)
+
+def _get_byte_seqs(specs):
+    byte_seqs = []
+    for spec in specs:
+        byte_seq, sep, steps = spec.partition('-')
+        try:
+            byte_values = bytes([get_int_param(i) for i in byte_seq.split(',')])
+        except ValueError:
+            raise SkoolKitError('Invalid byte sequence: {}'.format(byte_seq))
+        byte_seqs.append((byte_seq, byte_values, _get_steps(steps if sep else '1')))
+    return byte_seqs
+
+def _find(snapshot, byte_seqs, base_addr=16384):
+    lines = []
+    for byte_seq, byte_values, steps in byte_seqs:
+        for step in steps:
+            offset = step * len(byte_values)
+            for a in _search(snapshot, byte_values, step, base_addr):
+                lines.append("{0}-{1}-{2} {0:04X}-{1:04X}-{2:X}: {3}".format(a, a + offset - step, step, byte_seq))
+    return lines
+
+def _get_tile(spec):
+    coords, sep, steps = spec.partition('-')
     try:
         x, y = [get_int_param(i) for i in coords.split(',', 1)]
         if not 0 <= x < 32 or not 0 <= y < 24:
             raise ValueError
     except ValueError:
         raise SkoolKitError('Invalid tile coordinates: {}'.format(coords))
+    return x, y, _get_steps(steps if sep else '1')
+
+def _find_tile(snapshot, tile):
+    x, y, steps = tile
     df_addr = 16384 + 2048 * (y // 8) + 32 * (y & 7) + x
-    byte_seq = snapshot[df_addr:df_addr + 2048:256]
-    for b in byte_seq:
-        print('|{:08b}|'.format(b).replace('0', ' ').replace('1', '*'))
-    _find(snapshot, '{}-{}'.format(','.join([str(b) for b in byte_seq]), steps), 23296)
-
-def _find_text(snapshot, text):
-    size = len(text)
-    byte_values = [ord(c) for c in text]
-    for a in range(16384, 65536 - size + 1):
-        if snapshot[a:a + size] == byte_values:
-            print("{0}-{1} {0:04X}-{1:04X}: {2}".format(a, a + size - 1, text))
+    byte_values = snapshot[df_addr:df_addr + 2048:256]
+    lines = ['|{:08b}|'.format(b).replace('0', ' ').replace('1', '*') for b in byte_values]
+    byte_seq = ','.join([str(b) for b in byte_values])
+    return lines + _find(snapshot, [(byte_seq, bytes(byte_values), steps)], 23296)
+
+def _find_text(snapshot, texts):
+    lines = []
+    for text in texts:
+        size = len(text)
+        try:
+            byte_values = text.encode('latin_1')
+        except UnicodeEncodeError:
+            continue
+        for a in _search(snapshot, byte_values):
+            lines.append("{0}-{1} {0:04X}-{1:04X}: {2}".format(a, a + size - 1, text))
+    return lines
+
+def _search_file(infile, byte_seqs, tile, texts):
+    snapshot = get_snapshot(infile)
+    if byte_seqs:
+        return _find(snapshot, byte_seqs)
+    if tile:
+        return _find_tile(snapshot, tile)
+    return _find_text(snapshot, texts)
+
+def _search_files(infiles, byte_seqs, tile, texts, jobs):
+    # Search each snapshot in a separate worker process if jobs > 1, and print
+    # the results in the order in which the snapshots were specified
+    if jobs > 1 and len(infiles) > 1:
+        with ProcessPoolExecutor(min(jobs, len(infiles))) as executor:
+            results = [executor.submit(_search_file, f, byte_seqs, tile, texts) for f in infiles]
+            results = [r.result() for r in results]
+    else:
+        results = [_search_file(f, byte_seqs, tile, texts) for f in infiles]
+    for infile, lines in zip(infiles, results):
+        for line in lines:
+            if len(infiles) > 1:
+                print('{}: {}'.format(infile, line))
+            else:
+                print(line)
 
 def _peek(snapshot, specs):
     for addr1, addr2, step in _get_address_ranges(specs):
@@ -420,20 +479,23 @@ def _word(snapshot, specs):
 
 def main(args):
     parser = argparse.ArgumentParser(
-        usage='snapinfo.py [options] file',
-        description="Analyse an SNA, SZX or Z80 snapshot.",
+        usage='snapinfo.py [options] file [file...]',
+        description="Analyse an SNA, SZX or Z80 snapshot. When searching (with --find, --find-text or --find-tile), "
+                    "two or more snapshots may be specified.",
         add_help=False
     )
-    parser.add_argument('infile', help=argparse.SUPPRESS, nargs='?')
+    parser.add_argument('infiles', help=argparse.SUPPRESS, nargs='*')
     group = parser.add_argument_group('Options')
     group.add_argument('-b', '--basic', action='store_true',
                        help='List the BASIC program')
-    group.add_argument('-f', '--find', metavar='A[,B...[-M[-N]]]',
-                       help='Search for the byte sequence A,B... with distance ranging from M to N (default=1) between bytes')
+    group.add_argument('-f', '--find', metavar='A[,B...[-M[-N]]]', action='append',
+                       help='Search for the byte sequence A,B... with distance ranging from M to N (default=1) between bytes; this option may be used multiple times')
+    group.add_argument('--jobs', dest='jobs', metavar='N', type=int, default=1,
+                       help='Search the snapshots using N processes (default: 1)')
     group.add_argument('-p', '--peek', metavar='A[-B[-C]]', action='append',
                        help='Show the contents of addresses A TO B STEP C; this option may be used multiple times')
-    group.add_argument('-t', '--find-text', dest='text', metavar='TEXT',
-                       help='Search for a text string')
+    group.add_argument('-t', '--find-text', dest='text', metavar='TEXT', action='append',
+                       help='Search for a text string; this option may be used multiple times')
     group.add_argument('-T', '--find-tile', dest='tile', metavar='X,Y[-M[-N]]',
                        help='Search for the graphic data of the tile at (X,Y) with distance ranging from M to N (default=1) between bytes')
     group.add_argument('-v', '--variables', action='store_true',
@@ -443,22 +505,28 @@ def main(args):
     group.add_argument('-w', '--word', metavar='A[-B[-C]]', action='append',
                        help='Show the words at addresses A TO B STEP C; this option may be used multiple times')
     namespace, unknown_args = parser.parse_known_args(args)
-    if unknown_args or namespace.infile is None:
+    infiles = namespace.infiles
+    search = any((namespace.find, namespace.tile, namespace.text))
+    if unknown_args or not infiles or (len(infiles) > 1 and not search):
         parser.exit(2, parser.format_help())
-    infile = namespace.infile
+    for infile in infiles:
+        if infile[-4:].lower() not in ('.sna', '.szx', '.z80'):
+            raise SkoolKitError('Unrecognised snapshot type')
+    infile = infiles[0]
     snapshot_type = infile[-4:].lower()
-    if snapshot_type not in ('.sna', '.szx', '.z80'):
-        raise SkoolKitError('Unrecognised snapshot type')
 
-    if any((namespace.find, namespace.tile, namespace.text, namespace.peek, namespace.word, namespace.basic, namespace.variables)):
-        snapshot = get_snapshot(infile)
+    if search:
+        byte_seqs = tile = texts = None
         if namespace.find:
-            _find(snapshot, namespace.find)
+            byte_seqs = _get_byte_seqs(namespace.find)
         elif namespace.tile:
-            _find_tile(snapshot, namespace.tile)
-        elif namespace.text:
-            _find_text(snapshot, namespace.text)
-        elif namespace.peek:
+            tile = _get_tile(namespace.tile)
+        else:
+            texts = namespace.text
+        _search_files(infiles, byte_seqs, tile, texts, namespace.jobs)
+    elif any((namespace.peek, namespace.word, namespace.basic, namespace.variables)):
+        snapshot = get_snapshot(infile)
+        if namespace.peek:
             _peek(snapshot, namespace.peek)
         elif namespace.word:
             _word(snapshot, namespace.word)
@@ -63,11 +63,11 @@ def _read_z80(z80file):
 def _write_z80(header, snapshot, fname):
     if len(header) == 30:
         header[12] |= 32
-        ram = make_z80_ram_block(snapshot[16384:], 0)[3:] + [0, 237, 237, 0]
+        ram = make_z80_ram_block(snapshot[16384:], 0)[3:] + bytes((0, 237, 237, 0))
     else:
         ram = make_z80v3_ram_blocks(snapshot[16384:])
     with open(fname, 'wb') as f:
-        f.write(bytearray(header + ram))
+        f.write(bytes(header) + ram)
 
 def run(infile, options, outfile):
     header, snapshot = _read_z80(infile)
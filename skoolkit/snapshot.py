@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License along with
 # SkoolKit. If not, see <http://www.gnu.org/licenses/>.
 
+import re
 import zlib
 
 from skoolkit import SkoolKitError, get_int_param, read_bin_file
@@ -50,6 +51,9 @@ Z80_REGISTERS = {
     'pc': 32
 }
 
+# A run of ED bytes, or a run of five or more identical bytes
+RE_Z80_RUN = re.compile(rb'\xed+|(.)\1{4,}', re.DOTALL)
+
 def get_snapshot(fname, page=None):
     ext = fname[-4:].lower()
     if ext not in ('.sna', '.z80', '.szx'):
@@ -63,7 +67,7 @@ def get_snapshot(fname, page=None):
         ram = _read_szx(data, page)
     if len(ram) != 49152:
         raise SnapshotError("RAM size is {0}".format(len(ram)))
-    mem = [0] * 16384
+    mem = bytearray(16384)
     mem.extend(ram)
     return mem
 
@@ -112,35 +116,37 @@ def set_z80_state(z80, *specs):
             raise SkoolKitError("Cannot parse integer: {}".format(spec))
 
 def make_z80_ram_block(data, page):
-    block = []
-    prev_b = None
-    count = 0
-    for b in data:
-        if b == prev_b or prev_b is None:
-            prev_b = b
-            if count < 255:
-                count += 1
-                continue
-        if count > 4 or (count > 1 and prev_b == 237):
-            block.extend((237, 237, count, prev_b))
-        elif prev_b == 237:
-            block.extend((237, b))
-            prev_b = None
-            count = 0
-            continue
+    # Find each run of ED bytes and each run of five or more identical bytes
+    # with a regular expression, and copy everything in between as it is
+    data = bytes(data)
+    block = bytearray()
+    i = 0
+    while 1:
+        match = RE_Z80_RUN.search(data, i)
+        if match is None:
+            break
+        start, end = match.span()
+        block.extend(data[i:start])
+        byte = data[start]
+        count = end - start
+        while count >= 255:
+            block.extend((237, 237, 255, byte))
+            count -= 255
+        i = end
+        if count > 4 or (count > 1 and byte == 237):
+            block.extend((237, 237, count, byte))
+        elif byte == 237 and count:
+            # A single ED is followed by the next byte as it is
+            block.extend(data[end - 1:end + 1])
+            i += 1
         else:
-            block.extend((prev_b,) * count)
-        prev_b = b
-        count = 1
-    if count > 4 or (count > 1 and prev_b == 237):
-        block.extend((237, 237, count, prev_b))
-    else:
-        block.extend((prev_b,) * count)
+            block.extend(data[end - count:end])
+    block.extend(data[i:])
     length = len(block)
-    return [length % 256, length // 256, page] + block
+    return bytearray((length % 256, length // 256, page)) + block
 
 def make_z80v3_ram_blocks(ram):
-    blocks = []
+    blocks = bytearray()
     for bank, data in ((5, ram[:16384]), (1, ram[16384:32768]), (2, ram[32768:49152])):
         blocks.extend(make_z80_ram_block(data, bank + 3))
     return blocks
@@ -151,7 +157,7 @@ def write_z80v3(fname, ram, registers, state):
     set_z80_registers(z80, 'i=63', 'iy=23610', *registers)
     set_z80_state(z80, 'iff=1', 'im=1', *state)
     with open(fname, 'wb') as f:
-        f.write(bytes(z80 + make_z80v3_ram_blocks(ram)))
+        f.write(bytes(z80) + make_z80v3_ram_blocks(ram))
 
 def move(snapshot, param_str):
     params = param_str.split(',', 2)
@@ -171,13 +177,13 @@ def poke(snapshot, param_str):
     try:
         if val.startswith('^'):
             value = get_int_param(val[1:])
-            poke_f = lambda b: b ^ value
+            poke_f = lambda b: (b ^ value) & 255
         elif val.startswith('+'):
             value = get_int_param(val[1:])
             poke_f = lambda b: (b + value) & 255
         else:
             value = get_int_param(val)
-            poke_f = lambda b: value
+            poke_f = lambda b: value & 255
     except ValueError:
         raise SkoolKitError('Invalid value in poke spec: {}'.format(param_str))
     try:
@@ -206,8 +212,10 @@ def _read_sna(data, page=None):
 def _read_z80(data, page=None):
     if sum(data[6:8]) > 0:
         version = 1
-    else:
+    elif data[30] == 23:
         version = 2
+    else:
+        version = 3
     if version == 1:
         header_size = 30
     else:
@@ -222,7 +230,7 @@ def _read_z80(data, page=None):
     if (version == 2 and machine_id < 2) or (version == 3 and machine_id in (0, 1, 3)):
         if data[37] & 128:
             banks = (5,) # 16K
-            extension = [0] * 32768
+            extension = bytearray(32768)
         else:
             banks = (5, 1, 2) # 48K
     else:
@@ -236,7 +244,7 @@ def _read_szx(data, page=None):
     machine_id = data[6]
     if machine_id == 0:
         banks = (5,) # 16K
-        extension = [0] * 32768
+        extension = bytearray(32768)
     elif machine_id == 1:
         banks = (5, 2, 0) # 48K
     else:
@@ -278,7 +286,7 @@ def _get_zxstblock(data, index, block_id):
     return index, block
 
 def _concatenate_pages(pages, banks, extension):
-    ram = []
+    ram = bytearray()
     for bank in banks:
         if pages[bank] is None:
             raise SnapshotError("Page {0} not found".format(bank))
@@ -305,24 +313,21 @@ def _decompress(ramz, banks, extension):
     return _concatenate_pages(pages, banks, extension)
 
 def _decompress_block(ramz):
-    block = []
+    # Find each 'ED ED' sequence, and copy everything in between as it is
+    ramz = bytes(ramz)
+    block = bytearray()
     i = 0
-    while i < len(ramz):
-        b = ramz[i]
-        i += 1
-        if b == 237:
-            c = ramz[i]
-            i += 1
-            if c == 237:
-                length, byte = ramz[i], ramz[i + 1]
-                if length == 0:
-                    raise SnapshotError("Found ED ED 00 {0:02X}".format(byte))
-                block += [byte] * length
-                i += 2
-            else:
-                block += [b, c]
-        else:
-            block.append(b)
+    while 1:
+        j = ramz.find(b'\xed\xed', i)
+        if j < 0:
+            break
+        block.extend(ramz[i:j])
+        length, byte = ramz[j + 2], ramz[j + 3]
+        if length == 0:
+            raise SnapshotError("Found ED ED 00 {0:02X}".format(byte))
+        block.extend(bytes((byte,)) * length)
+        i = j + 4
+    block.extend(ramz[i:])
     return block
 
 class SnapshotError(SkoolKitError):
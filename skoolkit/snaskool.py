@@ -16,6 +16,11 @@
 
 import sys
 import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import bisect
+import heapq
 
 from skoolkit import SkoolKitError, warn, write_line, wrap, parse_int, get_address_format, open_file, read_bin_file
 from skoolkit.ctlparser import CtlParser
@@ -33,6 +38,16 @@ MIN_INSTRUCTION_COMMENT_WIDTH = 10
 # fraction of the block length)
 UNIQUE_BYTES_MAX = 0.3
 
+# Translation tables that convert each byte of a Z80 map file into eight
+# ASCII '0' or '1' characters (one per address, lowest bit first), and each
+# byte of a SpecEmu map file into one
+Z80_MAP_BITS = [bytes(48 + ((b >> i) & 1) for i in range(8)) for b in range(256)]
+SPECEMU_MAP_BITS = bytes(48 + (b & 1) for b in range(256))
+
+# Regular expression that matches a run of executed addresses in a code map
+# converted by one of the translation tables above
+CODE_RUN = re.compile(b'1+')
+
 # The minimum allowed length of a text block
 MIN_LENGTH = 3
 # The minimum number of distinct characters that must be in a text block (as a
@@ -49,10 +64,16 @@ PUNC_CHARS = ',.'
 # will be joined
 TEXT_GAP_MAX = 8
 
+# The number of bytes of a code execution log to read and parse at a time
+LOG_CHUNK_SIZE = 1048576
+# The minimum number of bytes of a code execution log to parse in each process
+# when two or more are used
+PARALLEL_MIN_SIZE = 67108864
+
 class CodeMapError(SkoolKitError):
     pass
 
-def _get_code_blocks(snapshot, start, end, fname):
+def _get_code_blocks(snapshot, start, end, fname, jobs=1):
     if os.path.isdir(fname):
         raise SkoolKitError('{0} is a directory'.format(fname))
     try:
@@ -66,45 +87,47 @@ def _get_code_blocks(snapshot, start, end, fname):
         # Assume this is a Z80 map file
         sys.stderr.write('Reading {0}'.format(fname))
         sys.stderr.flush()
-        addresses = []
-        data = read_bin_file(fname)
-        address = start & 65528
-        for b in data[start // 8:end // 8 + 1]:
-            for i in range(8):
-                if b & 1 and start <= address < end:
-                    addresses.append(address)
-                b >>= 1
-                address += 1
+        code_map = b''.join([Z80_MAP_BITS[b] for b in read_bin_file(fname)])
     elif size == 65536:
         # Assume this is a SpecEmu map file
         sys.stderr.write('Reading {}'.format(fname))
         sys.stderr.flush()
-        addresses = []
-        data = read_bin_file(fname)
-        for address in range(start, end):
-            if data[address] & 1:
-                addresses.append(address)
+        code_map = read_bin_file(fname).translate(SPECEMU_MAP_BITS)
     else:
         sys.stderr.write('Reading {0}: '.format(fname))
         sys.stderr.flush()
-        with open_file(fname) as f:
-            addresses = _get_addresses(f, fname, size, start, end)
+        with open_file(fname, 'rb') as f:
+            code_map = _get_addresses(f, fname, size, start, end, jobs)
     sys.stderr.write('\n')
 
     code_blocks = []
     disassembler = Disassembler(snapshot)
-    for address in addresses:
-        size = disassembler.disassemble(address, address + 1)[0].size()
+    for match in CODE_RUN.finditer(code_map, start, end):
+        address, run_end = match.span()
         if code_blocks and address <= sum(code_blocks[-1]):
-            if address == sum(code_blocks[-1]):
-                code_blocks[-1][1] += size
+            address = sum(code_blocks[-1])
         else:
-            code_blocks.append([address, size])
+            code_blocks.append([address, 0])
+        while address < run_end:
+            size = disassembler.instruction_length(address)
+            code_blocks[-1][1] += size
+            address += size
 
     return code_blocks
 
-def _get_addresses(f, fname, size, start, end):
-    addresses = set()
+def _fuse_address(s_line):
+    return s_line[2:6]
+
+def _spud_address(s_line):
+    return s_line[5:9]
+
+def _specemu_address(s_line):
+    return s_line[:4]
+
+def _zero_address(s_line):
+    return s_line[:s_line.find('\t')]
+
+def _get_addresses(f, fname, size, start, end, jobs=1):
     base = 16
     i = 1
     rewind = True
@@ -116,66 +139,123 @@ def _get_addresses(f, fname, size, start, end):
         if not line:
             break
         i += 1
-        s_line = line.strip()
+        s_line = line.decode('latin-1').strip()
         if s_line:
             break
 
     if s_line.startswith('0x'):
         # Fuse profile
-        address_f = lambda s_line: s_line[2:6]
+        address_f = _fuse_address
     elif s_line.startswith('PC = '):
         # Spud log
-        address_f = lambda s_line: s_line[5:9]
+        address_f = _spud_address
     elif s_line.startswith('PC:'):
         # SpecEmu log
-        address_f = lambda s_line: s_line[:4]
+        address_f = _specemu_address
         ignore_prefixes = ('PC:', 'IX:', 'HL:', 'DE:', 'BC:', 'AF:')
         rewind = False
     elif s_line.endswith('decimal'):
         # Zero log
         if s_line.endswith('in decimal'):
             base = 10
-        address_f = lambda s_line: s_line[:s_line.find('\t')]
+        address_f = _zero_address
         rewind = False
     else:
         raise CodeMapError('{0}: Unrecognised format'.format(fname))
 
     if rewind:
-        f.seek(0)
+        offset = 0
         i = 1
+    else:
+        offset = f.tell()
+    log_format = (address_f, base, ignore_prefixes, start, end)
 
-    while 1:
-        line = f.readline()
-        if not line:
-            break
-        progress_msg = '{0}%'.format((100 * f.tell()) // size)
-        sys.stderr.write(progress_msg + chr(8) * len(progress_msg))
-        sys.stderr.flush()
-        s_line = line.strip()
-        if s_line:
-            address_str = address_f(s_line)
-            address = None
-            if address_str:
-                try:
-                    address = int(address_str, base)
-                except ValueError:
-                    if not (ignore_prefixes and s_line.startswith(ignore_prefixes)):
-                        raise CodeMapError('{0}, line {1}: Cannot parse address: {2}'.format(fname, i, s_line))
-                if address is not None:
-                    if address < 0 or address > 65535:
-                        raise CodeMapError('{0}, line {1}: Address out of range: {2}'.format(fname, i, s_line))
-                    if start <= address < end:
-                        addresses.add(address)
-        i += 1
-
-    return sorted(addresses)
-
-def _is_terminal_instruction(instruction):
-    data = instruction.bytes
+    t0 = time.time()
+    jobs = min(jobs, (size - offset) // PARALLEL_MIN_SIZE)
+    if jobs > 1:
+        code_map = _read_log_in_parallel(f, fname, size, offset, i, log_format, jobs)
+    else:
+        code_map, lines, error = _read_log(fname, offset, size, log_format, size)
+        if error:
+            _raise_code_map_error(fname, i + lines - 1, *error)
+    elapsed = max(time.time() - t0, 0.001)
+    _show_progress('100% ({:.1f}MB/s)'.format((size - offset) / elapsed / 1048576))
+    return code_map
+
+def _read_log_in_parallel(f, fname, size, offset, i, log_format, jobs):
+    # Split the log into one part per job, each part starting at the beginning
+    # of a line, and merge the code maps produced from the parts
+    offsets = [offset]
+    for n in range(1, jobs):
+        f.seek(offset + (size - offset) * n // jobs - 1)
+        f.readline()
+        offsets.append(max(f.tell(), offsets[-1]))
+    offsets.append(size)
+    code_map = 0
+    with ProcessPoolExecutor(jobs) as executor:
+        parts = [executor.submit(_read_log, fname, o1, o2, log_format) for o1, o2 in zip(offsets, offsets[1:])]
+        for part, end_offset in zip(parts, offsets[1:]):
+            part_map, lines, error = part.result()
+            if error:
+                _raise_code_map_error(fname, i + lines - 1, *error)
+            i += lines
+            code_map |= int.from_bytes(part_map, 'big')
+            _show_progress('{}%'.format((100 * end_offset) // size))
+    return code_map.to_bytes(65536, 'big')
+
+def _read_log(fname, offset, end_offset, log_format, size=0):
+    # Parse the part of a code execution log between two file offsets (each of
+    # which is at the beginning of a line) a chunk at a time, and return a code
+    # map of the addresses found, the number of lines read, and details of the
+    # first unparseable line (if any); if 'size' is given, show progress
+    address_f, base, ignore_prefixes, start, end = log_format
+    code_map = bytearray(b'0' * 65536)
+    i = 0
+    remainder = b''
+    with open(fname, 'rb') as f:
+        f.seek(offset)
+        while offset < end_offset:
+            data = f.read(min(LOG_CHUNK_SIZE, end_offset - offset))
+            if not data:
+                break
+            offset += len(data)
+            data = remainder + data
+            if offset < end_offset:
+                index = data.rfind(b'\n') + 1
+                data, remainder = data[:index], data[index:]
+            for s_line in data.decode('latin-1').split('\n'):
+                i += 1
+                s_line = s_line.strip()
+                if s_line:
+                    address_str = address_f(s_line)
+                    if address_str:
+                        try:
+                            address = int(address_str, base)
+                        except ValueError:
+                            if not (ignore_prefixes and s_line.startswith(ignore_prefixes)):
+                                return code_map, i, ('Cannot parse address', s_line)
+                            continue
+                        if address < 0 or address > 65535:
+                            return code_map, i, ('Address out of range', s_line)
+                        if start <= address < end:
+                            code_map[address] = 49
+            i -= 1
+            if size:
+                _show_progress('{}%'.format((100 * offset) // size))
+    return code_map, i, None
+
+def _raise_code_map_error(fname, i, error, s_line):
+    raise CodeMapError('{}, line {}: {}: {}'.format(fname, i, error, s_line))
+
+def _show_progress(msg):
+    sys.stderr.write(msg + chr(8) * len(msg))
+    sys.stderr.flush()
+
+def _is_terminal_instruction(data):
     if data[0] == 201:
         # RET
         return True
-    if data[0] == 237 and data[1] in (69, 77, 85, 93, 101, 109, 117, 125):
+    if data[0] == 237 and len(data) > 1 and data[1] in (69, 77, 85, 93, 101, 109, 117, 125):
         # RETN/RETI
         return True
     if data[0] == 233:
@@ -184,7 +264,7 @@ def _is_terminal_instruction(instruction):
     if len(data) == 2 and data[0] in (221, 253) and data[1] == 233:
         # JP (IX)/JP (IY)
         return True
-    if data[0] == 24 and data[1] > 0:
+    if data[0] == 24 and len(data) > 1 and data[1] > 0:
         # JR d (d != 0)
         return True
     if data[0] == 195:
@@ -193,24 +273,85 @@ def _is_terminal_instruction(instruction):
     return False
 
 def _find_terminal_instruction(disassembler, ctls, start, end=65536, ctl=None):
+    snapshot = disassembler.snapshot
     address = start
     while address < end:
-        instruction = disassembler.disassemble(address, address + 1)[0]
-        address = instruction.address + instruction.size()
+        i_addr = address
+        address += disassembler.instruction_length(address)
         if ctl is None:
-            for a in range(instruction.address, address):
+            for a in range(i_addr, address):
                 if a in ctls:
                     next_ctl = ctls[a]
                     del ctls[a]
             if ctls.get(address) == 'c':
                 break
-        if _is_terminal_instruction(instruction):
+        if _is_terminal_instruction(snapshot[i_addr:address]):
             if address < 65536 and address not in ctls:
                 ctls[address] = ctl or next_ctl
             break
     return address
 
-def _generate_ctls_with_code_map(snapshot, start, end, code_map):
+def _get_block_end(ctls, address):
+    # Return the address of the first ctl after 'address', or the address of
+    # the last ctl if there is none
+    for a in range(address + 1, 65537):
+        if a in ctls:
+            return a
+    return max(ctls)
+
+def _get_targets(entry):
+    targets = []
+    for instruction in entry.instructions:
+        operation = instruction.operation
+        if operation.upper().startswith(('DJ', 'JR', 'JP', 'CA', 'RS')):
+            addr_str = get_address(operation)
+            if addr_str:
+                targets.append(parse_int(addr_str))
+    return targets
+
+def _update_targets(targets, entry, delta):
+    # Adjust the counts of references to each address from 'c' entries
+    if entry.ctl != 'c':
+        return ()
+    entry_targets = _get_targets(entry)
+    for target in entry_targets:
+        targets[target] = targets.get(target, 0) + delta
+    return entry_targets
+
+def _ends_with_jump(entry):
+    last_instr = entry.instructions[-1].operation
+    return last_instr == 'RET' or (last_instr[:2] in ('JP', 'JR') and last_instr[3:].isdigit())
+
+def _jumps_to_next(entry):
+    next_address = str(entry.next.address)
+    for instruction in entry.instructions:
+        operation = instruction.operation
+        if operation[:2] in ('JR', 'JP') and operation[-5:] == next_address:
+            return True
+    return False
+
+def _join_entries(disassembly, ctls, entries, joinable, repeat=True):
+    # Join each entry that satisfies 'joinable' to the entry that follows it,
+    # re-disassembling only the address ranges affected; if 'repeat' is True,
+    # examine the joined entries again until no more joins can be made
+    while entries:
+        ranges = []
+        for entry in entries:
+            if entry.next and joinable(entry):
+                next_entry = entry.next
+                del ctls[next_entry.address]
+                r_end = next_entry.blocks[-1].end
+                if ranges and entry.address <= ranges[-1][1]:
+                    ranges[-1][1] = max(ranges[-1][1], r_end)
+                else:
+                    ranges.append([entry.address, r_end])
+        entries = []
+        for r_start, r_end in ranges:
+            entries.extend(disassembly.rebuild(r_start, r_end))
+        if not repeat:
+            break
+
+def _generate_ctls_with_code_map(snapshot, start, end, code_map, jobs):
     # (1) Use the code map to create an initial set of 'c' ctls, and mark all
     #     unexecuted blocks as 'U' (unknown)
     # (2) Where a 'c' block doesn't end with a RET/JP/JR, extend it up to the
@@ -228,7 +369,7 @@ def _generate_ctls_with_code_map(snapshot, start, end, code_map):
     # (1) Mark all executed blocks as 'c' and unexecuted blocks as 'U'
     # (unknown)
     ctls = {start: 'U', end: 'i'}
-    for address, length in _get_code_blocks(snapshot, start, end, code_map):
+    for address, length in _get_code_blocks(snapshot, start, end, code_map, jobs):
         ctls[address] = 'c'
         if address + length < end:
             ctls[address + length] = 'U'
@@ -236,75 +377,74 @@ def _generate_ctls_with_code_map(snapshot, start, end, code_map):
     # (2) Where a 'c' block doesn't end with a RET/JP/JR, extend it up to the
     # next RET/JP/JR in the following 'U' blocks, or up to the next 'c' block
     disassembler = Disassembler(snapshot)
-    while 1:
-        done = True
-        for ctl, b_start, b_end in _get_blocks(ctls):
-            if ctl == 'c':
-                if _is_terminal_instruction(disassembler.disassemble(b_start, b_end)[-1]):
-                    continue
-                if _find_terminal_instruction(disassembler, ctls, b_end, end) < end:
-                    done = False
-                    break
-        if done:
+    b_start = min(ctls)
+    while True:
+        b_end = _get_block_end(ctls, b_start)
+        if b_end <= b_start:
             break
+        if ctls[b_start] == 'c':
+            lengths = disassembler.lengths(b_start, b_end)
+            i_addr = b_start + sum(lengths[:-1])
+            if not _is_terminal_instruction(snapshot[i_addr:i_addr + lengths[-1]]):
+                if _find_terminal_instruction(disassembler, ctls, b_end, end) < end:
+                    # Examine the extended block again
+                    continue
+        b_start = _get_block_end(ctls, b_start)
 
     # (3) Mark entry points in 'U' blocks that are CALLed or JPed to from 'c'
     # blocks with 'c'
     ctl_parser = CtlParser(ctls)
     disassembly = Disassembly(snapshot, ctl_parser)
-    while 1:
-        disassembly.build(True)
-        done = True
-        for entry in disassembly.entries:
-            if entry.ctl == 'U':
-                for instruction in entry.instructions:
-                    for referrer in instruction.referrers:
-                        if ctls[referrer.address] == 'c':
-                            ctls[instruction.address] = 'c'
-                            if entry.next:
-                                e_end = entry.next.address
-                            else:
-                                e_end = 65536
-                            _find_terminal_instruction(disassembler, ctls, instruction.address, e_end, entry.ctl)
-                            disassembly.remove_entry(entry.address)
-                            done = False
-                            break
-                    if not done:
-                        break
-                if not done:
-                    break
-        if done:
-            break
+    targets = {}
+    for entry in disassembly.entries:
+        _update_targets(targets, entry, 1)
+    candidates = [e.address for e in disassembly.entries if e.ctl == 'U' and targets.get(e.address)]
+    while candidates:
+        address = heapq.heappop(candidates)
+        entry = disassembly.entry_map.get(address)
+        if entry is None or entry.ctl != 'U' or not targets.get(address):
+            continue
+        ctls[address] = 'c'
+        if entry.next:
+            e_end = entry.next.address
+        else:
+            e_end = 65536
+        next_address = _find_terminal_instruction(disassembler, ctls, address, e_end, entry.ctl)
+        r_end = _get_block_end(ctls, max(next_address, entry.blocks[-1].end) - 1)
+        old_entries = []
+        while entry and entry.address < r_end:
+            old_entries.append(entry)
+            _update_targets(targets, entry, -1)
+            entry = entry.next
+        for entry in disassembly.rebuild(address, r_end):
+            for target in _update_targets(targets, entry, 1):
+                if target in disassembly.entry_map:
+                    heapq.heappush(candidates, target)
+            if entry.ctl == 'U' and targets.get(entry.address):
+                heapq.heappush(candidates, entry.address)
 
     # (4) Split 'c' blocks on RET/JP/JR
     for ctl, b_address, b_end in _get_blocks(ctls):
         if ctl == 'c':
             next_address = _find_terminal_instruction(disassembler, ctls, b_address, b_end, 'c')
-            if next_address < b_end:
-                disassembly.remove_entry(b_address)
+            if next_address != b_end:
                 while next_address < b_end:
                     next_address = _find_terminal_instruction(disassembler, ctls, next_address, b_end, 'c')
+                disassembly.rebuild(b_address, _get_block_end(ctls, max(next_address, b_end) - 1))
 
     # (5) Scan the disassembly for pairs of adjacent blocks where the start
     # address of the second block is JRed or JPed to from the first block, and
     # join such pairs
-    while 1:
-        disassembly.build()
-        done = True
-        for entry in disassembly.entries[:-1]:
-            if entry.ctl == 'c':
-                for instruction in entry.instructions:
-                    operation = instruction.operation
-                    if operation[:2] in ('JR', 'JP') and operation[-5:] == str(entry.next.address):
-                        del ctls[entry.next.address]
-                        disassembly.remove_entry(entry.address)
-                        disassembly.remove_entry(entry.next.address)
-                        done = False
-                        break
-        if done:
-            break
+    _join_entries(disassembly, ctls, disassembly.entries, lambda e: e.ctl == 'c' and _jumps_to_next(e))
 
-    # (6) Examine the 'U' blocks for text/data
+    # (6) Examine the 'U' blocks for text/data, and (7) mark data blocks of
+    # all zeroes with 's'
+    _analyse_unknown_blocks(snapshot, ctls)
+
+    return ctls
+
+def _analyse_unknown_blocks(snapshot, ctls):
+    # Examine the 'U' blocks for text/data
     for ctl, b_start, b_end in _get_blocks(ctls):
         if ctl == 'U':
             ctls[b_start] = 'b'
@@ -313,7 +453,7 @@ def _generate_ctls_with_code_map(snapshot, start, end, code_map):
                 if t_end < b_end:
                     ctls[t_end] = 'b'
 
-    # (7) Mark data blocks of all zeroes with 's'
+    # Mark data blocks of all zeroes with 's'
     for ctl, b_start, b_end in _get_blocks(ctls):
         if ctl == 'b':
             z_end = b_start
@@ -324,6 +464,97 @@ def _generate_ctls_with_code_map(snapshot, start, end, code_map):
                 if z_end < b_end:
                     ctls[z_end] = 'b'
 
+def _get_branch_types():
+    # Derive from the disassembler's opcode table the type of operand (relative
+    # 'r' or word 'w' address, or RST address) of each unprefixed JR, DJNZ,
+    # JP, CALL and RST instruction, and whether it's a CALL or RST
+    branch_types = {}
+    for opcode, (decoder, template) in Disassembler.ops.items():
+        if decoder is Disassembler.jr_arg:
+            branch_types[opcode] = ('r', False)
+        elif decoder is Disassembler.word_arg and template.startswith(('JP', 'CALL')):
+            branch_types[opcode] = ('w', template.startswith('CALL'))
+        elif decoder is Disassembler.rst_arg:
+            branch_types[opcode] = (template, True)
+    return branch_types
+
+BRANCH_TYPES = _get_branch_types()
+
+def _get_branch(snapshot, address):
+    # Return the target address of the JR/DJNZ/JP/CALL/RST instruction at
+    # 'address' (or None), and whether the instruction is a CALL or RST
+    branch_type = BRANCH_TYPES.get(snapshot[address])
+    if branch_type is None:
+        return None, False
+    operand, call = branch_type
+    if operand == 'r':
+        offset = snapshot[(address + 1) & 65535]
+        target = address + 2 + offset - 256 * (offset > 127)
+    elif operand == 'w':
+        target = snapshot[(address + 1) & 65535] + 256 * snapshot[(address + 2) & 65535]
+    else:
+        target = operand
+    return target, call
+
+def _generate_ctls_with_trace(snapshot, start, end, entry_points, code_map, jobs):
+    # (1) Starting at each entry point (and at the start of each executed
+    #     block in the code map, if any), follow the flow of execution through
+    #     JR/DJNZ/JP/CALL/RST instructions, marking the start of every
+    #     instruction reached
+    # (2) In a single pass through the address range, mark the start of each
+    #     run of reached instructions with 'c', and split runs after each
+    #     RET/JP/JR and at each CALL/RST target or entry point, unless the
+    #     address is JRed or JPed to from earlier in the same block; mark
+    #     everything else 'U' (unknown)
+    # (3) Examine the 'U' blocks for text/data, and mark data blocks of all
+    #     zeroes with 's'
+
+    # (1) Follow the flow of execution from each entry point
+    disassembler = Disassembler(snapshot)
+    code = bytearray(65536)
+    calls = set(entry_points)
+    if code_map:
+        calls.update(a for a, length in _get_code_blocks(snapshot, start, end, code_map, jobs))
+    pending = list(calls)
+    while pending:
+        address = pending.pop()
+        while start <= address < end and not code[address]:
+            length = disassembler.instruction_length(address)
+            if address + length > end:
+                break
+            code[address] = 1
+            target, call = _get_branch(snapshot, address)
+            if target is not None:
+                pending.append(target)
+                if call:
+                    calls.add(target)
+            if _is_terminal_instruction(snapshot[address:address + length]):
+                break
+            address += length
+
+    # (2) Create the 'c' and 'U' blocks
+    ctls = {start: 'U', end: 'i'}
+    address = start
+    prev_ctl = None
+    while address < end:
+        if code[address]:
+            if prev_ctl != 'c' or ((split or address in calls) and address not in jumps):
+                ctls[address] = prev_ctl = 'c'
+                jumps = set()
+            length = disassembler.instruction_length(address)
+            target, call = _get_branch(snapshot, address)
+            if not call:
+                jumps.add(target)
+            split = _is_terminal_instruction(snapshot[address:address + length])
+            address += length
+        else:
+            if prev_ctl != 'U':
+                ctls[address] = prev_ctl = 'U'
+            address += 1
+
+    # (3) Examine the 'U' blocks for text/data
+    _analyse_unknown_blocks(snapshot, ctls)
+
     return ctls
 
 def _generate_ctls_without_code_map(snapshot, start, end):
@@ -346,50 +577,17 @@ def _generate_ctls_without_code_map(snapshot, start, end):
 
     # Scan the disassembly for pairs of adjacent blocks that overlap, and join
     # such pairs
-    while True:
-        done = True
-        for entry in disassembly.entries[:-1]:
-            if entry.bad_blocks:
-                del ctls[entry.next.address]
-                disassembly.remove_entry(entry.address)
-                disassembly.remove_entry(entry.next.address)
-                done = False
-        if done:
-            break
-        disassembly.build()
+    _join_entries(disassembly, ctls, disassembly.entries, lambda e: e.bad_blocks)
 
     # Scan the disassembly for blocks that don't end in a 'RET', 'JP nn' or
     # 'JR d' instruction, and join them to the next block
-    changed = False
-    for entry in disassembly.entries[:-1]:
-        last_instr = entry.instructions[-1].operation
-        if last_instr != 'RET' and not (last_instr[:2] in ('JP', 'JR') and last_instr[3:].isdigit()):
-            next_address = entry.next.address
-            if next_address < end:
-                del ctls[entry.next.address]
-                disassembly.remove_entry(entry.address)
-                disassembly.remove_entry(entry.next.address)
-                changed = True
-    if changed:
-        disassembly.build()
+    _join_entries(disassembly, ctls, disassembly.entries,
+                  lambda e: not _ends_with_jump(e) and e.next.address < end, False)
 
     # Scan the disassembly for pairs of adjacent blocks where the start address
     # of the second block is JRed or JPed to from the first block, and join
     # such pairs
-    while True:
-        done = True
-        for entry in disassembly.entries[:-1]:
-            for instruction in entry.instructions:
-                operation = instruction.operation
-                if operation[:2] in ('JR', 'JP') and operation[-5:] == str(entry.next.address):
-                    del ctls[entry.next.address]
-                    disassembly.remove_entry(entry.address)
-                    disassembly.remove_entry(entry.next.address)
-                    done = False
-                    break
-        if done:
-            break
-        disassembly.build()
+    _join_entries(disassembly, ctls, disassembly.entries, _jumps_to_next)
 
     # Mark any NOP sequences at the beginning of a block as a separate zero
     # block
@@ -516,7 +714,7 @@ def _analyse_blocks(disassembly, ctls):
     # terminal instruction as data
     disassembly.build()
     for entry in disassembly.entries:
-        if entry.bad_blocks or (ctls[entry.address] == 'c' and not _is_terminal_instruction(entry.instructions[-1])):
+        if entry.bad_blocks or (ctls[entry.address] == 'c' and not _is_terminal_instruction(entry.instructions[-1].bytes)):
             ctls[entry.address] = 'b'
 
     # Mark any NOP sequences at the beginning of a code block as a separate
@@ -531,9 +729,11 @@ def _analyse_blocks(disassembly, ctls):
                 if z_end < end:
                     ctls[z_end] = 'c'
 
-def generate_ctls(snapshot, start, end, code_map):
-    if code_map:
-        ctls = _generate_ctls_with_code_map(snapshot, start, end, code_map)
+def generate_ctls(snapshot, start, end, code_map, entry_points=None, jobs=1):
+    if entry_points:
+        ctls = _generate_ctls_with_trace(snapshot, start, end, entry_points, code_map, jobs)
+    elif code_map:
+        ctls = _generate_ctls_with_code_map(snapshot, start, end, code_map, jobs)
     else:
         ctls = _generate_ctls_without_code_map(snapshot, start, end)
 
@@ -600,6 +800,7 @@ class Disassembly:
         self.instructions = {}
         self.entries = []
         self._create_entries()
+        self._entry_addresses = [e.address for e in self.entries]
         if self.entries:
             self.org = self.entries[0].address
         else:
@@ -607,74 +808,102 @@ class Disassembly:
         if final:
             self._calculate_references()
 
+    def rebuild(self, start, end):
+        # Replace the entries from 'start' up to 'end' (which must be the
+        # address of an entry or the end of the last entry) with entries
+        # created from the blocks currently defined in that address range, so
+        # that merging or splitting blocks does not require a full build
+        i = bisect.bisect_left(self._entry_addresses, start)
+        j = bisect.bisect_left(self._entry_addresses, end)
+        for entry in self.entries[i:j]:
+            self.entry_map.pop(entry.address, None)
+            for instruction in entry.instructions:
+                self.instructions.pop(instruction.address, None)
+        new_entries = [self._create_entry(b) for b in self.ctl_parser.get_blocks(start, end)]
+        self.entries[i:j] = new_entries
+        self._entry_addresses[i:j] = [e.address for e in new_entries]
+        for k in range(max(i - 1, 0), i + len(new_entries)):
+            if k + 1 < len(self.entries):
+                self.entries[k].next = self.entries[k + 1]
+            else:
+                self.entries[k].next = None
+        if self.entries:
+            self.org = self.entries[0].address
+        else:
+            self.org = None
+        return new_entries
+
     def _create_entries(self):
         for block in self.ctl_parser.get_blocks():
             if block.start in self.entry_map:
                 entry = self.entry_map[block.start]
-                self.entries.append(entry)
                 for instruction in entry.instructions:
                     self.instructions[instruction.address] = instruction
-                continue
-            title = block.title
-            if not title:
-                ctl = block.ctl
-                if ctl != 'i' or block.description or block.registers or block.blocks[0].header:
-                    title = self.config.get('Title-' + ctl, '').format(address=self._address_str(block.start))
-            for sub_block in block.blocks:
-                address = sub_block.start
-                if sub_block.ctl in 'cBT':
-                    base = sub_block.sublengths[0][1]
-                    instructions = self.disassembler.disassemble(sub_block.start, sub_block.end, base)
-                elif sub_block.ctl in 'bgstuw':
-                    sublengths = sub_block.sublengths
-                    if sublengths[0][0]:
-                        if sub_block.ctl == 's':
-                            length = sublengths[0][0]
-                        else:
-                            length = sum([s[0] for s in sublengths])
-                    else:
-                        length = sub_block.end - sub_block.start
-                    instructions = []
-                    while address < sub_block.end:
-                        end = min(address + length, sub_block.end)
-                        if sub_block.ctl == 't':
-                            instructions += self.disassembler.defm_range(address, end, sublengths)
-                        elif sub_block.ctl == 'w':
-                            instructions += self.disassembler.defw_range(address, end, sublengths)
-                        elif sub_block.ctl == 's':
-                            instructions.append(self.disassembler.defs(address, end, sublengths))
-                        else:
-                            instructions += self.disassembler.defb_range(address, end, sublengths)
-                        address += length
-                else:
-                    instructions = self.disassembler.ignore(sub_block.start, sub_block.end)
-                sub_block.instructions = instructions
-                for instruction in instructions:
-                    self.instructions[instruction.address] = instruction
-                    instruction.asm_directives = sub_block.asm_directives.get(instruction.address, ())
-
-            sub_blocks = []
-            i = 0
-            while i < len(block.blocks):
-                sub_block = block.blocks[i]
-                i += 1
-                sub_blocks.append(sub_block)
-                if sub_block.multiline_comment is not None:
-                    end, sub_block.comment = sub_block.multiline_comment
-                    while i < len(block.blocks) and block.blocks[i].start < end:
-                        next_sub_block = block.blocks[i]
-                        sub_block.instructions += next_sub_block.instructions
-                        sub_block.end = next_sub_block.end
-                        i += 1
-
-            entry = Entry(title, block.description, block.ctl, sub_blocks,
-                          block.registers, block.end_comment, block.asm_directives,
-                          block.ignoreua_directives)
-            self.entry_map[entry.address] = entry
+            else:
+                entry = self._create_entry(block)
             self.entries.append(entry)
         for i, entry in enumerate(self.entries[1:]):
             self.entries[i].next = entry
 
+    def _create_entry(self, block):
+        title = block.title
+        if not title:
+            ctl = block.ctl
+            if ctl != 'i' or block.description or block.registers or block.blocks[0].header:
+                title = self.config.get('Title-' + ctl, '').format(address=self._address_str(block.start))
+        for sub_block in block.blocks:
+            address = sub_block.start
+            if sub_block.ctl in 'cBT':
+                base = sub_block.sublengths[0][1]
+                instructions = self.disassembler.disassemble(sub_block.start, sub_block.end, base)
+            elif sub_block.ctl in 'bgstuw':
+                sublengths = sub_block.sublengths
+                if sublengths[0][0]:
+                    if sub_block.ctl == 's':
+                        length = sublengths[0][0]
+                    else:
+                        length = sum([s[0] for s in sublengths])
+                else:
+                    length = sub_block.end - sub_block.start
+                instructions = []
+                while address < sub_block.end:
+                    end = min(address + length, sub_block.end)
+                    if sub_block.ctl == 't':
+                        instructions += self.disassembler.defm_range(address, end, sublengths)
+                    elif sub_block.ctl == 'w':
+                        instructions += self.disassembler.defw_range(address, end, sublengths)
+                    elif sub_block.ctl == 's':
+                        instructions.append(self.disassembler.defs(address, end, sublengths))
+                    else:
+                        instructions += self.disassembler.defb_range(address, end, sublengths)
+                    address += length
+            else:
+                instructions = self.disassembler.ignore(sub_block.start, sub_block.end)
+            sub_block.instructions = instructions
+            for instruction in instructions:
+                self.instructions[instruction.address] = instruction
+                instruction.asm_directives = sub_block.asm_directives.get(instruction.address, ())
+
+        sub_blocks = []
+        i = 0
+        while i < len(block.blocks):
+            sub_block = block.blocks[i]
+            i += 1
+            sub_blocks.append(sub_block)
+            if sub_block.multiline_comment is not None:
+                end, sub_block.comment = sub_block.multiline_comment
+                while i < len(block.blocks) and block.blocks[i].start < end:
+                    next_sub_block = block.blocks[i]
+                    sub_block.instructions += next_sub_block.instructions
+                    sub_block.end = next_sub_block.end
+                    i += 1
+
+        entry = Entry(title, block.description, block.ctl, sub_blocks,
+                      block.registers, block.end_comment, block.asm_directives,
+                      block.ignoreua_directives)
+        self.entry_map[entry.address] = entry
+        return entry
+
     def remove_entry(self, address):
         if address in self.entry_map:
             del self.entry_map[address]
@@ -100,7 +100,7 @@ def _load(snapshot, counters, blocks, param_str):
     counters[block_num] += length
 
 def _get_ram(blocks, options):
-    snapshot = [0] * 65536
+    snapshot = bytearray(65536)
 
     operations = []
     standard_load = True
@@ -222,7 +222,8 @@ def _print_block(index, data, info=(), block_id=None, header=None):
 
 def _list_basic(cur_block_num, data, block_num, address):
     if block_num == cur_block_num:
-        snapshot = [0] * address + list(data[1:-1])
+        snapshot = bytearray(address)
+        snapshot.extend(data[1:-1])
         print(BasicLister().list_basic(snapshot))
 
 def _get_basic_block(spec):
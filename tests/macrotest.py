@@ -1,3 +1,5 @@
+from types import MethodType
+
 from skoolkit import VERSION
 from skoolkit.skoolparser import BASE_10, BASE_16, CASE_LOWER, CASE_UPPER
 
@@ -899,6 +901,49 @@ class CommonSkoolMacroTest:
         if hasattr(writer, 'get_snapshot_name'):
             self.assertEqual(writer.get_snapshot_name(), name)
 
+    def test_macro_pushs_and_pokes(self):
+        writer = self._get_writer(snapshot=[0] * 8)
+        peeks = ','.join(['#PEEK{}'.format(a) for a in range(8)])
+        writer.expand('#POKES0,1,8')
+        writer.expand('#PUSHS')
+        writer.expand('#POKES0,2,4;6,3')
+        self.assertEqual(writer.expand(peeks), '2,2,2,2,1,1,3,1')
+        writer.expand('#PUSHS')
+        writer.expand('#POKES1,4,4,2#POKES2,5')
+        self.assertEqual(writer.expand(peeks), '2,4,5,4,1,4,3,4')
+        writer.expand('#POPS')
+        self.assertEqual(writer.expand(peeks), '2,2,2,2,1,1,3,1')
+        writer.expand('#POPS')
+        self.assertEqual(writer.expand(peeks), '1,1,1,1,1,1,1,1')
+
+    def test_macro_pushs_and_pokes_with_snapshot_modified_directly(self):
+        writer = self._get_writer(snapshot=[0] * 4)
+        writer.expand('#PUSHS')
+        writer.expand('#POKES0,1')
+        writer.expand('#PUSHS')
+        writer.expand('#POKES1,2')
+        writer.snapshot[2] = 3
+        writer.expand('#POKES3,4')
+        self.assertEqual([1, 2, 3, 4], writer.snapshot)
+        writer.expand('#POPS')
+        self.assertEqual([1, 0, 0, 0], writer.snapshot)
+        writer.expand('#POPS')
+        self.assertEqual([0, 0, 0, 0], writer.snapshot)
+
+    def test_macro_pushs_with_snapshot_reference_held(self):
+        writer = self._get_writer(snapshot=[0] * 4)
+        snapshot = writer.snapshot
+        writer.expand('#PUSHS')
+        snapshot[1] = 99
+        writer.expand('#POKES2,1')
+        writer.expand('#PUSHS')
+        snapshot[3] = 98
+        self.assertEqual([0, 99, 1, 98], writer.snapshot)
+        writer.expand('#POPS')
+        self.assertEqual([0, 99, 1, 0], writer.snapshot)
+        writer.expand('#POPS')
+        self.assertEqual([0, 0, 0, 0], writer.snapshot)
+
     def test_macro_r_invalid(self):
         writer = self._get_writer()
         prefix = ERROR_PREFIX.format('R')
@@ -1066,3 +1111,47 @@ class CommonSkoolMacroTest:
         writer = self._get_writer()
         output = writer.expand('#VERSION')
         self.assertEqual(output, VERSION)
+
+    def test_macros_in_replacement_text(self):
+        writer = self._get_writer()
+
+        # Macro in the replacement text takes parameters from the text after it
+        self.assertEqual(writer.expand('#IF(1)(#EVAL)12+1'), '12+1')
+        self.assertEqual(writer.expand('#IF(1)(#EVAL)(12+1)'), '13')
+
+        # Macro formed by the replacement text and the text after it
+        self.assertEqual(writer.expand('#IF(1)(#)EVAL(12+1)'), '13')
+
+        # Macro formed by the text before the replacement text and the
+        # replacement text itself
+        self.assertEqual(writer.expand('##IF(1)(EVAL)(12+1)'), '13')
+
+        # Replacement text ending with '#' that does not form a macro
+        self.assertEqual(writer.expand('#FOR1,3(n,#IF(n>1)(#)n)'), '1#2#3')
+
+        # Replacement text whose macros are complete is expanded on its own
+        self.assertEqual(writer.expand('#IF(1)(#EVAL(1)#EVAL(2))(3)'), '12(3)')
+        self.assertEqual(writer.expand('#FOR1,3(n,#IF(n>1)(#EVAL(n*2)))'), '46')
+
+        # Expansion of '#(...)' after text and macros already expanded
+        self.assertEqual(writer.expand('a #EVAL1 #EVAL#(#EVAL(2+3))b'), 'a 1 5b')
+        self.assertEqual(writer.expand('##IF(1)(EVAL)#((1+2))'), '3')
+
+    def test_cached_expansions_follow_snapshot_changes(self):
+        writer = self._get_writer(snapshot=[0] * 4)
+        self.assertEqual(writer.expand('#PEEK1'), '0')
+        self.assertEqual(writer.expand('#PEEK1'), '0')
+
+        writer.expand('#POKES1,1')
+        self.assertEqual(writer.expand('#PEEK1'), '1')
+
+        writer.expand('#PUSHS #POKES1,2')
+        self.assertEqual(writer.expand('#PEEK1'), '2')
+        writer.expand('#POPS')
+        self.assertEqual(writer.expand('#PEEK1'), '1')
+
+        def poke(w, *args):
+            w.snapshot[1] = 3
+        writer.poke = MethodType(poke, writer)
+        writer.expand('#CALL:poke()')
+        self.assertEqual(writer.expand('#PEEK1'), '3')
@@ -48,7 +48,7 @@ class Bin2SnaTest(SkoolKitTestCase):
         self.assertEqual(z80h[23] + 256 * z80h[24], 23610) # IY
         self.assertEqual(z80h[32] + 256 * z80h[33], pc)    # PC
 
-        snapshot = get_snapshot(z80file)
+        snapshot = list(get_snapshot(z80file))
         self.assertEqual(data, snapshot[org:org + len(data)])
 
     @patch.object(bin2sna, 'run', mock_run)
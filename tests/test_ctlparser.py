@@ -1737,5 +1737,22 @@ class CtlParserTest(SkoolKitTestCase):
         }
         self.assertEqual(exp_end_map, m_comment_end_map)
 
+    def test_get_blocks_in_address_range(self):
+        ctl = '\n'.join((
+            'c 30000',
+            'c 30010',
+            'B 30012,2',
+            'C 30014',
+            'b 30020',
+            'S 30021',
+            'c 30030',
+            'i 30040'
+        ))
+        blocks = self._get_ctl_parser(ctl).get_blocks(30010, 30030)
+        self._check_ctls({30010: 'c', 30020: 'b'}, blocks)
+        self._check_subctls({30010: 'c', 30012: 'b', 30014: 'c', 30020: 'b', 30021: 's'}, blocks)
+        self.assertEqual([(b.start, b.end) for b in blocks], [(30010, 30020), (30020, 30030)])
+        self.assertEqual([(s.start, s.end) for s in blocks[1].blocks], [(30020, 30021), (30021, 30030)])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1827,6 +1827,42 @@ class DisassemblerTest(SkoolKitTestCase):
             operations = tuple([inst.operation for inst in instructions])
             self.assertEqual(operations, ops)
 
+    def test_instruction_length(self):
+        sna_prefix = [0] * 16384
+        for hex_bytes, ops in ASM.items():
+            snapshot = sna_prefix + [int(hex_bytes[i:i + 2], 16) for i in range(0, len(hex_bytes), 2)]
+            disassembler = self._get_disassembler(snapshot)
+            exp_length = disassembler.disassemble(len(sna_prefix), len(sna_prefix) + 1)[0].size()
+            self.assertEqual(disassembler.instruction_length(len(sna_prefix)), exp_length, hex_bytes)
+
+    def test_instruction_length_at_end_of_memory(self):
+        for data in ((62,), (1, 0), (221, 54, 0), (237, 67), (253, 203, 6), (221, 237, 67, 0)):
+            start = 65536 - len(data)
+            disassembler = self._get_disassembler(self._get_snapshot(start, data))
+            self.assertEqual(disassembler.instruction_length(start), disassembler.disassemble(start)[0].size(), data)
+
+    def test_lengths(self):
+        data = (
+            0,                # 32768 NOP
+            62, 1,            # 32769 LD A,1
+            33, 0, 0,         # 32771 LD HL,0
+            203, 71,          # 32774 BIT 0,A
+            237, 176,         # 32776 LDIR
+            237, 0,           # 32778 DEFB 237,0
+            221, 0,           # 32780 DEFB 221
+                              # 32781 NOP
+            253, 54, 1, 2,    # 32782 LD (IY+1),2
+            221, 203, 1, 70,  # 32786 BIT 0,(IX+1)
+            221, 203, 1, 71,  # 32790 DEFB 221,203,1,71
+            237, 99, 0, 0,    # 32794 DEFB 237,99,0,0
+            201               # 32798 RET
+        )
+        snapshot = self._get_snapshot(32768, data)
+        disassembler = self._get_disassembler(snapshot)
+        exp_lengths = [i.size() for i in disassembler.disassemble(32768, 32799)]
+        self.assertEqual(disassembler.lengths(32768, 32799), exp_lengths)
+        self.assertEqual(exp_lengths, [1, 2, 3, 2, 2, 2, 1, 1, 4, 4, 4, 4, 1])
+
     def test_ld1(self):
         # 65535 LD A,n
         self.defbs_equal(62)
@@ -2020,6 +2056,21 @@ class DisassemblerTest(SkoolKitTestCase):
         self.assertEqual(disassembler.num_str(10, 2), '$000A')
         self.assertEqual(disassembler.num_str(256, 2), '$0100')
 
+    def test_operands_in_different_bases(self):
+        snapshot = self._get_snapshot(0, (62, 65, 33, 65, 0, 221, 54, 255, 65))
+        disassembler = self._get_disassembler(snapshot)
+        exp_operations = (
+            (None, ('LD A,65', 'LD HL,65', 'LD (IX-1),65')),
+            ('h', ('LD A,$41', 'LD HL,$0041', 'LD (IX-$01),$41')),
+            ('b', ('LD A,%01000001', 'LD HL,%0000000001000001', 'LD (IX-%00000001),%01000001')),
+            ('c', ('LD A,"A"', 'LD HL,"A"', 'LD (IX-1),"A"')),
+            ('nc', ('LD A,65', 'LD HL,65', 'LD (IX-1),"A"')),
+            (None, ('LD A,65', 'LD HL,65', 'LD (IX-1),65')),
+        )
+        for base, exp_ops in exp_operations:
+            instructions = disassembler.disassemble(0, 9, base)
+            self.assertEqual(tuple([i.operation for i in instructions]), exp_ops, 'base={}'.format(base))
+
     def test_lower_case_conversion_with_character_operands(self):
         snapshot = [
             62, 65,          # 00000 LD A,"A"
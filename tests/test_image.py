@@ -6,7 +6,8 @@ from io import BytesIO
 from skoolkittest import SkoolKitTestCase
 from skoolkit.image import (ImageWriter, DEFAULT_FORMAT,
                             PNG_COMPRESSION_LEVEL, PNG_ENABLE_ANIMATION,
-                            PNG_ALPHA, GIF_ENABLE_ANIMATION, GIF_TRANSPARENCY)
+                            PNG_ALPHA, GIF_ENABLE_ANIMATION, GIF_TRANSPARENCY,
+                            TILE_CACHE_SIZE)
 from skoolkit.graphics import Udg, Frame
 
 TRANSPARENT = [0, 254, 0]
@@ -113,11 +114,48 @@ class ImageWriterOptionsTest(SkoolKitTestCase):
         self.assertEqual(image_writer.options[PNG_ALPHA], 255)
         self.assertEqual(image_writer.options[GIF_ENABLE_ANIMATION], 1)
         self.assertEqual(image_writer.options[GIF_TRANSPARENCY], 0)
+        self.assertEqual(image_writer.options[TILE_CACHE_SIZE], 4096)
 
     def test_invalid_option_value(self):
         image_writer = ImageWriter(options={PNG_COMPRESSION_LEVEL: 'NaN'})
         self.assertEqual(image_writer.options[PNG_COMPRESSION_LEVEL], 9)
 
+    def _write_image(self, image_writer, udg_array, img_format, scale=1, mask=0):
+        img_stream = BytesIO()
+        image_writer.write_image([Frame(udg_array, scale, mask)], img_stream, img_format)
+        return img_stream.getvalue()
+
+    def test_tile_cache(self):
+        udg1 = Udg(56, (170,) * 8)
+        udg2 = Udg(49, (15,) * 8, (240,) * 8)
+        udg_array1 = [[udg1, udg2, udg1], [udg2, udg1, udg2]]
+        udg_array2 = [[udg2, udg1], [udg1, udg1]]
+        for img_format in ('png', 'gif'):
+            for scale, mask in ((1, 0), (2, 1), (3, 2)):
+                image_writer = ImageWriter()
+                self._write_image(image_writer, udg_array1, img_format, scale, mask)
+                tile_cache = image_writer.tile_cache
+                self.assertGreater(tile_cache.hits, 0)
+                hits = tile_cache.hits
+                img_bytes = self._write_image(image_writer, udg_array2, img_format, scale, mask)
+                self.assertGreater(tile_cache.hits, hits)
+                self.assertEqual(self._write_image(ImageWriter(), udg_array2, img_format, scale, mask), img_bytes)
+
+    def test_tile_cache_size(self):
+        image_writer = ImageWriter(options={TILE_CACHE_SIZE: 2})
+        udg_array = [[Udg(56, (n,) * 8) for n in range(4)]] * 2
+        self._write_image(image_writer, udg_array, 'png')
+        self.assertEqual(len(image_writer.tile_cache._entries), 2)
+
+    def test_tile_cache_disabled(self):
+        image_writer = ImageWriter(options={TILE_CACHE_SIZE: 0})
+        udg_array = [[Udg(56, (170,) * 8)] * 2]
+        img_bytes = self._write_image(image_writer, udg_array, 'png')
+        self.assertEqual(image_writer.tile_cache.hits, 0)
+        self.assertEqual(image_writer.tile_cache.misses, 0)
+        self.assertEqual(len(image_writer.tile_cache._entries), 0)
+        self.assertEqual(self._write_image(ImageWriter(), udg_array, 'png'), img_bytes)
+
 class ImageWriterTest:
     def _get_num(self, stream, index):
         return index + 1, stream[index]
@@ -820,6 +858,53 @@ class ImageWriterTest:
         frames = [frame1, frame2, frame3]
         self._test_animated_image(frames)
 
+    def test_animation_delta_frames(self):
+        # 3 frames, 24x16; frame 2 differs from frame 1 only in the middle
+        # tile of the bottom row, and frame 3 is the same as frame 2
+        udg1 = Udg(56, (170,) * 8)
+        udg2 = Udg(56, (15,) * 8)
+        udg3 = Udg(49, (240,) * 8)
+        frame1 = Frame([[udg1, udg2, udg1], [udg2, udg1, udg2]], delay=10)
+        frame2 = Frame([[udg1, udg2, udg1], [udg2, udg3, udg2]], delay=20)
+        frame3 = Frame([[udg1, udg2, udg1], [udg2, udg3, udg2]], delay=30)
+        frames = [frame1, frame2, frame3]
+        exp_deltas = [None, (8, 8, 8, 8), (0, 0, 8, 8)]
+        self._test_animated_image(frames, exp_deltas=exp_deltas)
+
+    def test_animation_delta_frames_scaled(self):
+        # 2 frames, 48x48 at scale 2; frame 2 differs from frame 1 in two
+        # tiles at opposite corners of a 2x2 block
+        udg1 = Udg(56, (170,) * 8)
+        udg2 = Udg(2, (60,) * 8)
+        frame1 = Frame([[udg1] * 3] * 3, scale=2)
+        frame2 = Frame([[udg1] * 3, [udg1, udg2, udg1], [udg1, udg1, udg2]], scale=2)
+        frames = [frame1, frame2]
+        exp_deltas = [None, (16, 16, 32, 32)]
+        self._test_animated_image(frames, exp_deltas=exp_deltas)
+
+    def test_animation_delta_frames_cropped(self):
+        # 2 frames, 12x10 cropped from 24x16; frame 2 differs from frame 1 in
+        # the top-right tile, which is partly visible
+        udg1 = Udg(56, (170,) * 8)
+        udg2 = Udg(2, (60,) * 8)
+        frame1 = Frame([[udg1] * 3] * 2, x=5, y=3, width=12, height=10)
+        frame2 = Frame([[udg1, udg1, udg2], [udg1] * 3], x=5, y=3, width=12, height=10)
+        frames = [frame1, frame2]
+        exp_deltas = [None, (11, 0, 1, 5)]
+        self._test_animated_image(frames, exp_deltas=exp_deltas)
+
+    def test_animation_delta_frames_masked(self):
+        # 2 frames, transparency; frame 2 differs from frame 1 in the right
+        # tile
+        iw_args = {'options': self.alpha_option}
+        udg1 = Udg(49, (64,) * 8, (243,) * 8)
+        udg2 = Udg(49, (8,) * 8, (63,) * 8)
+        frame1 = Frame([[udg1, udg1]], mask=1)
+        frame2 = Frame([[udg1, udg2]], mask=1)
+        frames = [frame1, frame2]
+        exp_deltas = [None, (8, 0, 8, 8)]
+        self._test_animated_image(frames, iw_args, exp_deltas)
+
 class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
     def setUp(self):
         SkoolKitTestCase.setUp(self)
@@ -1068,18 +1153,24 @@ class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
         # IEND
         self.assertEqual(img_bytes[i:], IEND_CHUNK)
 
-    def _test_animated_image(self, frames, iw_args=None):
+    def _test_animated_image(self, frames, iw_args=None, exp_deltas=()):
         image_writer = ImageWriter(**(iw_args or {}))
         img_bytes = self._get_animated_image_data(image_writer, frames, 'png')
 
         exp_palette = []
         frame_data = []
         has_trans = 0
-        for frame in frames:
+        for n, frame in enumerate(frames):
             x, y, width, height = frame.x, frame.y, frame.width, frame.height
             frame_palette, f_has_trans, pixels, pixels2, frame2_xy = self._get_pixels_from_udg_array(frame.udgs, frame.scale, frame.mask, x, y, width, height)
             has_trans = has_trans or f_has_trans
-            frame_data.append((width, height, pixels, frame.delay))
+            x_offset = y_offset = 0
+            if n < len(exp_deltas) and exp_deltas[n]:
+                # Only the part of the frame that differs from the previous
+                # frame is expected
+                x_offset, y_offset, width, height = exp_deltas[n]
+                pixels = [row[x_offset:x_offset + width] for row in pixels[y_offset:y_offset + height]]
+            frame_data.append((width, height, pixels, frame.delay, x_offset, y_offset))
             for c in frame_palette:
                 if c not in exp_palette:
                     exp_palette.append(c)
@@ -1112,8 +1203,8 @@ class PngWriterTest(SkoolKitTestCase, ImageWriterTest):
 
         # Frames
         seq_num = 0
-        for exp_width, exp_height, exp_pixels, exp_delay in frame_data:
-            i = self._check_fctl(img_bytes, i, seq_num, exp_width, exp_height, exp_delay=exp_delay)
+        for exp_width, exp_height, exp_pixels, exp_delay, exp_x_offset, exp_y_offset in frame_data:
+            i = self._check_fctl(img_bytes, i, seq_num, exp_width, exp_height, exp_x_offset, exp_y_offset, exp_delay)
             seq_num += 1
             if seq_num == 1:
                 i = self._check_idat(img_bytes, i, exp_bit_depth, palette, exp_pixels, exp_width)
@@ -1346,7 +1437,7 @@ class GifWriterTest(SkoolKitTestCase, ImageWriterTest):
         # GIF trailer
         self.assertEqual(img_bytes[i], GIF_TRAILER)
 
-    def _test_animated_image(self, frames, iw_args=None):
+    def _test_animated_image(self, frames, iw_args=None, exp_deltas=()):
         if iw_args is None:
             iw_args = {}
         options = iw_args.setdefault('options', {})
@@ -1356,11 +1447,17 @@ class GifWriterTest(SkoolKitTestCase, ImageWriterTest):
         exp_palette = []
         frame_data = []
         has_trans = 0
-        for frame in frames:
+        for n, frame in enumerate(frames):
             x, y, width, height = frame.x, frame.y, frame.width, frame.height
             frame_palette, f_has_trans, pixels, pixels2, frame2_xy = self._get_pixels_from_udg_array(frame.udgs, frame.scale, frame.mask, x, y, width, height)
             has_trans = has_trans or f_has_trans
-            frame_data.append((width, height, pixels, frame.delay))
+            x_offset = y_offset = 0
+            if n < len(exp_deltas) and exp_deltas[n]:
+                # Only the part of the frame that differs from the previous
+                # frame is expected
+                x_offset, y_offset, width, height = exp_deltas[n]
+                pixels = [row[x_offset:x_offset + width] for row in pixels[y_offset:y_offset + height]]
+            frame_data.append((width, height, pixels, frame.delay, x_offset, y_offset))
             for c in frame_palette:
                 if c not in exp_palette:
                     exp_palette.append(c)
@@ -1391,9 +1488,9 @@ class GifWriterTest(SkoolKitTestCase, ImageWriterTest):
         i += aeb_len
 
         # Frames
-        for exp_width, exp_height, exp_pixels, exp_delay in frame_data:
+        for exp_width, exp_height, exp_pixels, exp_delay, exp_x_offset, exp_y_offset in frame_data:
             i = self._check_gce(img_bytes, i, t_flag, exp_delay)
-            i = self._check_image_descriptor(img_bytes, i, exp_width, exp_height)
+            i = self._check_image_descriptor(img_bytes, i, exp_width, exp_height, exp_x_offset, exp_y_offset)
             i = self._check_image_data(img_bytes, i, exp_width, exp_height, palette, exp_min_code_size, exp_pixels)
 
         # GIF trailer
@@ -75,6 +75,21 @@ class RefParserTest(SkoolKitTestCase):
         self.assertIn('baz', dict2)
         self.assertEqual(dict2['baz'], 'qux')
 
+    def test_get_all_sections(self):
+        ref = '\n'.join((
+            '[Section2]',
+            'Foo',
+            '  Bar',
+            '',
+            '[Section1]',
+            'Baz'
+        ))
+        ref_parser = self._get_parser(ref)
+        sections = ref_parser.get_all_sections()
+        self.assertEqual(sections, [('Section2', ['Foo', '  Bar']), ('Section1', ['Baz'])])
+        sections[0][1].append('Qux')
+        self.assertEqual(ref_parser.get_section('Section2', lines=True, trim=False), ['Foo', '  Bar'])
+
     def test_get_section(self):
         ref = '\n'.join((
             '[Apple]',
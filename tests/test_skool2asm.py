@@ -71,6 +71,7 @@ class Skool2AsmTest(SkoolKitTestCase):
         self.assertEqual(options.end, 65536)
         self.assertEqual(options.properties, [])
         self.assertEqual(options.params, [])
+        self.assertEqual(options.cache_dir, '')
 
     @patch.object(skool2asm, 'SkoolParser', MockSkoolParser)
     @patch.object(skool2asm, 'AsmWriter', MockAsmWriter)
@@ -100,6 +101,7 @@ class Skool2AsmTest(SkoolKitTestCase):
         ini = '\n'.join((
             '[skool2asm]',
             'Base=16',
+            'CacheDir=cache',
             'Case=1',
             'CreateLabels=1',
             'Quiet=1',
@@ -123,6 +125,7 @@ class Skool2AsmTest(SkoolKitTestCase):
         self.assertEqual(options.start, 0)
         self.assertEqual(options.end, 65536)
         self.assertEqual(sorted(options.properties), ['bullet=-', 'indent=4'])
+        self.assertEqual(options.cache_dir, 'cache')
 
     @patch.object(skool2asm, 'run', mock_run)
     def test_invalid_option_values_read_from_file(self):
@@ -381,6 +384,22 @@ class Skool2AsmTest(SkoolKitTestCase):
             mock_skool_parser.create_labels = None
             mock_asm_writer.wrote = False
 
+    @patch.object(skool2asm, 'get_config', mock_config)
+    def test_option_cache_dir(self):
+        skool = '\n'.join((
+            '; Routine at 32768',
+            'c32768 LD A,B  ; Comment',
+            ' 32769 JP 32768',
+        ))
+        skoolfile = self.write_text_file(skool, suffix='.skool')
+        cache_dir = self.make_directory()
+        exp_output, error = self.run_skool2asm('-q {}'.format(skoolfile))
+        for i in range(2):
+            output, error = self.run_skool2asm('-q --cache-dir {} {}'.format(cache_dir, skoolfile))
+            self.assertEqual(error, '')
+            self.assertEqual(output, exp_output)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
     @patch.object(skool2asm, 'get_config', mock_config)
     def test_writer(self):
         skool = '\n'.join((
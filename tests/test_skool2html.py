@@ -1,5 +1,6 @@
 import re
 import os.path
+import multiprocessing
 import unittest
 from unittest.mock import patch, Mock
 
@@ -31,6 +32,9 @@ class TestHtmlWriter(HtmlWriter):
         self.add_call('write_logo_image', args)
         return True
 
+    def set_image_jobs(self, *args):
+        self.add_call('set_image_jobs', args)
+
     def write_asm_entries(self, *args):
         self.add_call('write_asm_entries', args)
 
@@ -180,6 +184,10 @@ class Skool2HtmlTest(SkoolKitTestCase):
         self.assertEqual(options.pages, [])
         self.assertEqual(options.output_dir, '.')
         self.assertEqual(options.params, [])
+        self.assertEqual(options.cache_dir, '')
+        self.assertEqual(options.jobs, 1)
+        self.assertEqual(options.image_jobs, 1)
+        self.assertFalse(options.incremental)
 
     @patch.object(skool2html, 'run', mock_run)
     def test_config_read_from_file(self):
@@ -189,8 +197,12 @@ class Skool2HtmlTest(SkoolKitTestCase):
             'AsmLabels=1',
             'AsmOnePage=1',
             'Base=16',
+            'CacheDir=cache',
             'Case=-1',
             'CreateLabels=1',
+            'ImageJobs=3',
+            'Incremental=1',
+            'Jobs=4',
             'JoinCss=css.css',
             'OutputDir=' + output_dir,
             'Quiet=1',
@@ -219,6 +231,10 @@ class Skool2HtmlTest(SkoolKitTestCase):
         self.assertEqual(options.files, 'dimoP')
         self.assertEqual(options.pages, [])
         self.assertEqual(options.output_dir, output_dir)
+        self.assertEqual(options.cache_dir, 'cache')
+        self.assertEqual(options.jobs, 4)
+        self.assertEqual(options.image_jobs, 3)
+        self.assertTrue(options.incremental)
 
     @patch.object(skool2html, 'run', mock_run)
     def test_invalid_option_values_read_from_file(self):
@@ -872,7 +888,7 @@ class Skool2HtmlTest(SkoolKitTestCase):
         self._test_option_w('--write', 'm', 'write_map', exp_arg_list)
 
     def test_option_w_d(self):
-        self._test_option_w('-w', 'd', 'write_asm_entries')
+        self._test_option_w('-w', 'd', 'write_asm_entries', [(1,)])
 
     def test_option_w_P(self):
         exp_pages = ('Bugs', 'Changelog', 'Facts', 'Glossary', 'GraphicGlitches', 'Pokes', 'CustomPage1', 'CustomPage2')
@@ -882,7 +898,25 @@ class Skool2HtmlTest(SkoolKitTestCase):
         self._test_option_w('-w', 'o', 'write_map', [('other-Index',)])
 
     def test_option_w_o_entries(self):
-        self._test_option_w('--write', 'o', 'write_entries', [('other', 'other/other.html')])
+        self._test_option_w('--write', 'o', 'write_entries', [('other', 'other/other.html', 1)])
+
+    def test_option_jobs(self):
+        self._test_option_w('--jobs 3 -w', 'd', 'write_asm_entries', [(3,)])
+        self._test_option_w('--jobs 3 -w', 'd', 'set_image_jobs', [(1,)])
+        self._test_option_w('--jobs 2 -w', 'o', 'write_entries', [('other', 'other/other.html', 2)])
+
+    def test_option_image_jobs(self):
+        self._test_option_w('--image-jobs 3 -w', 'd', 'set_image_jobs', [(3,)])
+        self._test_option_w('--image-jobs 3 -w', 'd', 'write_asm_entries', [(1,)])
+
+    def test_option_image_jobs_with_error(self):
+        skool = '; Routine\nc32768 RET'
+        ref = '[Page:P1]\nPageContent=#UDG32768 #UDG32768(4'
+        skoolfile = self.write_text_file(skool, suffix='.skool')
+        self.write_text_file(ref, '{}.ref'.format(skoolfile[:-6]))
+        with self.assertRaisesRegex(SkoolKitError, 'No closing bracket'):
+            self.run_skool2html('--image-jobs 2 -w P -d {} {}'.format(self.odir, skoolfile))
+        self.assertEqual(multiprocessing.active_children(), [])
 
     def test_option_w_i(self):
         self._test_option_w('-w', 'i', 'write_index')
@@ -922,6 +956,9 @@ class Skool2HtmlTest(SkoolKitTestCase):
             done = output[-1]
             search = re.search(pattern, done)
             self.assertIsNot(search, None, '"{0}" is not of the form "{1}"'.format(done, pattern))
+            self.assertRegex(output[-4], '^  Macro expansion cache: [0-9]+ hits, [0-9]+ misses$')
+            self.assertEqual(output[-3], '  Image files: 0 encoded, 0 copied')
+            self.assertEqual(output[-2], '  Image tile cache: 0 hits, 0 misses')
 
     @patch.object(skool2html, 'get_class', Mock(return_value=TestHtmlWriter))
     @patch.object(skool2html, 'SkoolParser', MockSkoolParser)
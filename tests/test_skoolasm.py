@@ -274,6 +274,12 @@ class AsmWriterTest(SkoolKitTestCase, CommonSkoolMacroTest):
         self.assertEqual(self.err.getvalue(), 'WARNING: Could not convert address 24577 to label\n')
         self.clear_streams()
 
+        # Warning is repeated when the same text is expanded again
+        output = writer.expand('#R24577')
+        self.assertEqual(output, '24577')
+        self.assertEqual(self.err.getvalue(), 'WARNING: Could not convert address 24577 to label\n')
+        self.clear_streams()
+
         # Hexadecimal address between instructions
         output = writer.expand('#R$6001')
         self.assertEqual(output, '6001')
@@ -1,5 +1,7 @@
+import os
 from os.path import basename, isfile
 from posixpath import join
+import time
 import unittest
 from unittest.mock import patch
 
@@ -185,12 +187,18 @@ class MockFileInfo:
         self.mode = mode
         return StringIO()
 
+    def open_image_file(self, image_path):
+        return self.open_file(image_path, mode='wb')
+
     def add_image(self, image_path):
         return
 
     def need_image(self, image_path):
         return True
 
+    def file_exists(self, fname):
+        return False
+
 class TestImageWriter(ImageWriter):
     def write_image(self, frames, img_file, img_format):
         self.frames = frames
@@ -556,6 +564,56 @@ class MethodTest(HtmlWriterTestCase):
         with self.assertRaisesRegex(SkoolKitError, 'Unsupported image file format: {}'.format(image_path)):
             writer.write_image(image_path, udgs)
 
+    def test_write_image_identical_contents(self):
+        writer = self._get_writer()
+        writer.image_writer = ImageWriter()
+        udgs = [[Udg(56, (170,) * 8)]]
+        writer.write_image('images/udgs/a.png', udgs)
+        writer.write_image('images/udgs/b.png', udgs)
+        writer.write_image('images/udgs/c.gif', udgs)
+        writer.write_image('images/udgs/d.png', [[Udg(56, (85,) * 8)]])
+        self.assertEqual(writer.images_encoded, 3)
+        self.assertEqual(writer.images_copied, 1)
+        with open(join(self.odir, GAMEDIR, 'images/udgs/a.png'), 'rb') as f:
+            png = f.read()
+        with open(join(self.odir, GAMEDIR, 'images/udgs/b.png'), 'rb') as f:
+            self.assertEqual(f.read(), png)
+
+        # The contents of a.png change, so it is no longer a copy source
+        writer.write_image('images/udgs/a.png', [[Udg(56, (0,) * 8)]])
+        writer.write_image('images/udgs/e.png', udgs)
+        self.assertEqual(writer.images_encoded, 5)
+        self.assertEqual(writer.images_copied, 1)
+        with open(join(self.odir, GAMEDIR, 'images/udgs/e.png'), 'rb') as f:
+            self.assertEqual(f.read(), png)
+
+    def test_write_images_in_background(self):
+        frames = {}
+        for jobs in (1, 2):
+            writer = self._get_writer()
+            writer.image_writer = ImageWriter()
+            writer.set_image_jobs(jobs)
+            udgs = [[Udg(56, (170,) * 8)]]
+            frame1 = Frame(udgs, delay=10)
+            frame2 = Frame([[Udg(56, (85,) * 8)]])
+            writer.write_image('images/udgs/a{}.png'.format(jobs), udgs)
+            writer.write_image('images/udgs/b{}.png'.format(jobs), udgs)
+            writer.write_animated_image('images/udgs/c{}.gif'.format(jobs), [frame1, frame2])
+            frame1.delay = 20
+            writer.write_animated_image('images/udgs/d{}.gif'.format(jobs), [frame1, frame2])
+            self.assertFalse(writer.need_image('images/udgs/a{}.png'.format(jobs)))
+            writer.finish_images()
+            self.assertEqual(writer.images_encoded, 3)
+            self.assertEqual(writer.images_copied, 1)
+            for name in 'abcd':
+                fname = '{}{}.{}'.format(name, jobs, 'png' if name in 'ab' else 'gif')
+                with open(join(self.odir, GAMEDIR, 'images/udgs', fname), 'rb') as f:
+                    frames.setdefault(name, []).append(f.read())
+        for name, images in frames.items():
+            self.assertEqual(images[0], images[1], name)
+        self.assertEqual(frames['a'][0], frames['b'][0])
+        self.assertNotEqual(frames['c'][0], frames['d'][0])
+
     def test_write_animated_image_png(self):
         writer = self._get_writer(mock_file_info=True)
         image_writer = writer.image_writer
@@ -607,6 +665,19 @@ class MethodTest(HtmlWriterTestCase):
         output = writer.format_template('foo', {'bar': 'baz'})
         self.assertEqual(output, '!!baz!!')
 
+    def test_format_template_on_different_pages(self):
+        ref = '\n'.join((
+            '[Template:Page1-foo]',
+            '!!{bar}!!',
+            '[Template:foo]',
+            '{bar}',
+        ))
+        writer = self._get_writer(ref=ref)
+        for page_id, exp_output in (('Page1', '!!baz!!'), ('Page2', 'baz'), ('Page1', '!!baz!!')):
+            writer.skoolkit['page_id'] = page_id
+            output = writer.format_template('foo', {'bar': 'baz'})
+            self.assertEqual(output, exp_output)
+
     def test_format_template_unused_default(self):
         ref = '\n'.join((
             '[Template:foo]',
@@ -628,6 +699,11 @@ class MethodTest(HtmlWriterTestCase):
         with self.assertRaisesRegex(SkoolKitError, "^Unknown field 'bar' in 'foo' template$"):
             writer.format_template('foo', {'notbar': 'baz'})
 
+    def test_format_template_invalid(self):
+        writer = self._get_writer(ref='[Template:foo]\n{bar')
+        with self.assertRaisesRegex(SkoolKitError, "^Invalid 'foo' template: expected '}' before end of string$"):
+            writer.format_template('foo', {'bar': 'baz'})
+
     def test_format_template_nonexistent_template(self):
         writer = self._get_writer()
         with self.assertRaisesRegex(SkoolKitError, "^'non-existent' template does not exist$"):
@@ -2542,6 +2618,28 @@ class SkoolMacroTest(HtmlWriterTestCase, CommonSkoolMacroTest):
         for macro, params in (('#FOO', 'xyz'), ('#BAR', '1,2(baz)'), ('#UDGS', '#r1'), ('#LINKS', '')):
             self._assert_error(writer, macro + params, 'Found unknown macro: {}'.format(macro))
 
+    def test_expansion_cache(self):
+        writer = self._get_writer(snapshot=[0] * 4)
+        writer.expand('#PEEK1', 'asm')
+        writer.expand('#PEEK1', 'asm')
+        self.assertEqual((writer.expand_cache_hits, writer.expand_cache_misses), (1, 1))
+
+        # Text that contains no macros is not looked up
+        writer.expand('No macros', 'asm')
+        self.assertEqual((writer.expand_cache_hits, writer.expand_cache_misses), (1, 1))
+
+        # The current working directory and page ID are part of the key
+        writer.expand('#PEEK1', 'maps')
+        writer.skoolkit['page_id'] = 'Other'
+        writer.expand('#PEEK1', 'asm')
+        self.assertEqual((writer.expand_cache_hits, writer.expand_cache_misses), (1, 3))
+
+        # Text that contains an impure macro is not cached
+        writer.test_call = self._test_call
+        writer.expand('#CALL:test_call(1,2)', 'asm')
+        writer.expand('#CALL:test_call(1,2)', 'asm')
+        self.assertEqual((writer.expand_cache_hits, writer.expand_cache_misses), (1, 5))
+
 class HtmlWriterOutputTestCase(HtmlWriterTestCase):
     def setUp(self):
         HtmlWriterTestCase.setUp(self)
@@ -3692,6 +3790,303 @@ class HtmlOutputTest(HtmlWriterOutputTestCase):
         }
         self._assert_files_equal(join(ASMDIR, '30000.html'), subs)
 
+    def _write_asm_entries(self, skool, jobs):
+        writer = self._get_writer(ref='[Game]\nGame=Test', skool=skool, mock_write_file=False)
+        writer.write_asm_entries(jobs)
+        files = {}
+        for root, dirs, fnames in os.walk(self.odir):
+            for fname in fnames:
+                with open(os.path.join(root, fname)) as f:
+                    files[os.path.relpath(os.path.join(root, fname), self.odir)] = f.read()
+        return writer, files
+
+    def test_write_asm_entries_in_parallel(self):
+        skool = '\n'.join(['; Routine at {0}\nc{0} JP {1}  ; #UDG39144\n'.format(a, 50000 + (a + 1) % 10) for a in range(50000, 50010)])
+        writer, exp_files = self._write_asm_entries(skool, 1)
+        self.assertEqual(len(exp_files), 11)
+        for jobs in (2, 3, 16):
+            writer, files = self._write_asm_entries(skool, jobs)
+            self.assertEqual(files, exp_files)
+            self.assertEqual(writer.file_info.images, {'images/udgs/udg39144_56x4.png'})
+
+    def test_write_asm_entries_in_parallel_with_conflicting_image_names(self):
+        # Entries 3 and 4 write different images with the same name; entry 3
+        # (the earlier one) is slow to write, so that the worker that writes
+        # entry 4 gets there first
+        skool = '\n'.join(['; Routine at {}\nc{} RET\n'.format(a, a) for a in range(50000, 50008)])
+        skool = skool.replace('c50003', ';\n; #UDGARRAY2,56;39144-39145(arr)\nc50003')
+        skool = skool.replace('c50004', ';\n; #UDGARRAY2,7;39144-39145(arr)\nc50004')
+        for replace_images in (False, True):
+            exp_files = None
+            for jobs in (1, 2):
+                writer = self._get_writer(ref='[Game]\nGame=Test', skool=skool, mock_write_file=False)
+                writer.image_writer = ImageWriter()
+                writer.file_info.replace_images = replace_images
+                write_entry = writer.write_entry
+                def _write_entry(cwd, index, map_file):
+                    if index == 3:
+                        time.sleep(0.5)
+                    write_entry(cwd, index, map_file)
+                writer.write_entry = _write_entry
+                writer.write_asm_entries(jobs)
+                files = {}
+                for root, dirs, fnames in os.walk(self.odir):
+                    for fname in fnames:
+                        with open(os.path.join(root, fname), 'rb') as f:
+                            files[os.path.relpath(os.path.join(root, fname), self.odir)] = f.read()
+                self.assertEqual(writer.file_info.images, {'images/udgs/arr.png'})
+                if exp_files is None:
+                    exp_files = files
+                    self.assertEqual(len(exp_files), 9)
+                else:
+                    self.assertEqual(files, exp_files, 'replace_images={}'.format(replace_images))
+
+    def test_write_asm_entries_in_parallel_with_snapshot_modified(self):
+        skool = '\n'.join((
+            '; Routine at 40000',
+            ';',
+            '; #POKES40000,1',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            ';',
+            '; #PEEK40000',
+            'c40001 RET',
+        ))
+        writer, exp_files = self._write_asm_entries(skool, 1)
+        writer, files = self._write_asm_entries(skool, 2)
+        self.assertEqual(files, exp_files)
+        self.assertEqual(writer.snapshot[40000], 1)
+
+    def test_write_asm_entries_in_parallel_with_frame_defined_in_another_entry(self):
+        skool = '\n'.join((
+            '; Routine at 40000',
+            ';',
+            '; #UDG40000(*foo)',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            ';',
+            '; #UDGARRAY*foo(bar)',
+            'c40001 RET',
+        ))
+        writer, exp_files = self._write_asm_entries(skool, 1)
+        writer, files = self._write_asm_entries(skool, 2)
+        self.assertEqual(files, exp_files)
+        self.assertEqual(writer.file_info.images, {'images/udgs/bar.png'})
+
+    def test_write_asm_entries_in_parallel_with_worker_killed(self):
+        skool = '\n'.join(['; Routine at {0}\nc{0} RET\n'.format(a) for a in range(50000, 50004)])
+        writer, exp_files = self._write_asm_entries(skool, 1)
+        writer = self._get_writer(ref='[Game]\nGame=Test', skool=skool, mock_write_file=False)
+        pid = os.getpid()
+        write_entry = writer.write_entry
+        def _write_entry(cwd, index, map_file):
+            if index == 3 and os.getpid() != pid:
+                os._exit(1)
+            write_entry(cwd, index, map_file)
+        writer.write_entry = _write_entry
+        writer.write_asm_entries(2)
+        for fname, contents in exp_files.items():
+            with open(os.path.join(self.odir, fname)) as f:
+                self.assertEqual(f.read(), contents)
+
+    def test_write_asm_entries_in_parallel_with_warnings(self):
+        for modify in (False, True):
+            skool = '\n'.join(['; Routine at {0}\nc{0} RET\n'.format(a) for a in range(50000, 50004)])
+            if modify:
+                skool += '\n; Routine at 50004\n;\n; #POKES50004,1\nc50004 RET\n'
+            writer = self._get_writer(ref='[Game]\nGame=Test', skool=skool, mock_write_file=False)
+            write_entry = writer.write_entry
+            def _write_entry(cwd, index, map_file):
+                skoolhtml.warn('Writing entry {}'.format(index))
+                write_entry(cwd, index, map_file)
+            writer.write_entry = _write_entry
+            start = len(self.err.getvalue())
+            writer.write_asm_entries(2)
+            warnings = self.err.getvalue()[start:].split('\n')[:-1]
+            num_entries = 5 if modify else 4
+            self.assertEqual(warnings, ['WARNING: Writing entry {}'.format(i) for i in range(num_entries)])
+
+    def _write_asm_entries_incrementally(self, skool, odir, jobs=1, replace_images=False):
+        skoolfile = self.write_text_file(skool, '{}/game.skool'.format(odir))
+        skool_parser = SkoolParser(skoolfile, html=True)
+        writer = HtmlWriter(skool_parser, RefParser(), FileInfo(odir, GAMEDIR, replace_images, True))
+        written = []
+        write_file = writer.write_file
+        def _write_file(fname, contents):
+            written.append(fname)
+            write_file(fname, contents)
+        writer.write_file = _write_file
+        writer.write_asm_entries(jobs)
+        return sorted(written)
+
+    def test_write_asm_entries_incrementally(self):
+        skool = [
+            '; Routine at 40000',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            'c40001 RET',
+            '',
+            '; Routine at 40002',
+            'c40002 RET  ; Comment',
+            '',
+            '; Routine at 40003',
+            'c40003 RET',
+            '',
+            '; Data block at 40004',
+            'b40004 DEFB 0',
+        ]
+        odir = self.make_directory()
+        exp_files = ['asm/{}.html'.format(a) for a in range(40000, 40005)]
+        self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir), exp_files)
+        self.assertTrue(isfile(os.path.join(odir, GAMEDIR, skoolhtml.MANIFEST)))
+        self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir), [])
+
+        # Changing an instruction comment rebuilds only that entry's page
+        skool[7] = 'c40002 RET  ; New comment'
+        self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir), ['asm/40002.html'])
+
+        # Changing an entry title also rebuilds its neighbours' pages
+        skool[3] = '; Subroutine at 40001'
+        self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir), exp_files[:3])
+
+        # A missing page is rebuilt
+        os.remove(os.path.join(odir, GAMEDIR, 'asm', '40004.html'))
+        self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir), ['asm/40004.html'])
+
+        # Changing the snapshot rebuilds every page
+        skool[-1] = 'b40004 DEFB 1'
+        self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir), exp_files)
+
+    def test_write_asm_entries_incrementally_with_shared_state(self):
+        skool = '\n'.join((
+            '; Routine at 40000',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            'c40001 RET',
+            '',
+            '; Routine at 40002',
+            'c40002 RET',
+            '',
+            '; Routine at 40003',
+            ';',
+            '; #UDG30000(*foo)',
+            'c40003 RET',
+            '',
+            '; Routine at 40004',
+            'c40004 RET',
+            '',
+            '; Routine at 40005',
+            'c40005 RET',
+        ))
+        odir = self.make_directory()
+        exp_files = ['asm/{}.html'.format(a) for a in range(40000, 40006)]
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), exp_files)
+
+        # Pages that use shared state (or whose prev/next links do) are
+        # always rebuilt, as is every page after them
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), exp_files[2:])
+
+    def test_write_asm_entries_incrementally_with_missing_image(self):
+        skool = '\n'.join((
+            '; Routine at 40000',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            'c40001 RET',
+            '',
+            '; Routine at 40002',
+            ';',
+            '; #UDG40002(foo)',
+            'c40002 RET',
+            '',
+            '; Routine at 40003',
+            ';',
+            '; #UDG40002(foo)',
+            'c40003 RET',
+        ))
+        odir = self.make_directory()
+        exp_files = ['asm/{}.html'.format(a) for a in range(40000, 40004)]
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), exp_files)
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), [])
+
+        # A page that uses a missing image is rebuilt (as is the page of any
+        # entry whose description it includes), and so is the image
+        image = os.path.join(odir, GAMEDIR, 'images', 'udgs', 'foo.png')
+        os.remove(image)
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), exp_files[1:])
+        self.assertTrue(isfile(image))
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), [])
+
+        # The same goes for a parallel build
+        os.remove(image)
+        self._write_asm_entries_incrementally(skool, odir, 2)
+        self.assertTrue(isfile(image))
+        self.assertEqual(self._write_asm_entries_incrementally(skool, odir), [])
+
+    def test_write_asm_entries_incrementally_with_replace_images(self):
+        skool = '\n'.join((
+            '; Routine at 40000',
+            ';',
+            '; #UDG40000(foo)',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            'c40001 RET',
+        ))
+        exp_files = ['asm/{}.html'.format(a) for a in range(40000, 40002)]
+        for jobs in (1, 2):
+            odir = self.make_directory()
+            self.assertEqual(self._write_asm_entries_incrementally(skool, odir), exp_files)
+            image = os.path.join(odir, GAMEDIR, 'images', 'udgs', 'foo.png')
+            with open(image, 'rb') as f:
+                image_data = f.read()
+
+            # Every page, and so every image it uses, is rebuilt when images
+            # are being replaced
+            with open(image, 'wb') as f:
+                f.write(b'old')
+            written = self._write_asm_entries_incrementally(skool, odir, jobs, True)
+            if jobs == 1:
+                self.assertEqual(written, exp_files)
+            with open(image, 'rb') as f:
+                self.assertEqual(f.read(), image_data)
+
+    def test_write_asm_entries_incrementally_after_snapshot_modified(self):
+        skool = [
+            '; Routine at 40000',
+            ';',
+            '; #POKES30000,1',
+            'c40000 RET',
+            '',
+            '; Routine at 40001',
+            'c40001 RET',
+            '',
+            '; Routine at 40002',
+            'c40002 RET',
+            '',
+            '; Routine at 40003',
+            ';',
+            '; Value: #PEEK30000',
+            'c40003 RET',
+        ]
+        for jobs in (1, 2):
+            odir = self.make_directory()
+            page = os.path.join(odir, GAMEDIR, 'asm', '40003.html')
+            exp_files = ['asm/{}.html'.format(a) for a in range(40000, 40004)]
+            skool[2] = '; #POKES30000,1'
+            self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir, jobs), exp_files)
+            with open(page) as f:
+                self.assertIn('Value: 1', f.read())
+
+            skool[2] = '; #POKES30000,2'
+            self.assertEqual(self._write_asm_entries_incrementally('\n'.join(skool), odir, jobs), exp_files)
+            with open(page) as f:
+                self.assertIn('Value: 2', f.read())
+
     def test_write_asm_entries_on_single_page(self):
         ref = '[Game]\nAsmSinglePageTemplate=AsmAllInOne'
         skool = '\n'.join((
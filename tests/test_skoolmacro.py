@@ -3,7 +3,7 @@ import unittest
 
 from skoolkittest import SkoolKitTestCase
 from skoolkit.skoolmacro import (parse_ints, parse_strings, parse_brackets, parse_image_macro,
-                                 parse_address_range, MacroParsingError, NoParametersError, MissingParameterError,
+                                 parse_address_range, evaluate, MacroParsingError, NoParametersError, MissingParameterError,
                                  TooManyParametersError)
 
 class SkoolMacroTest(SkoolKitTestCase):
@@ -492,5 +492,39 @@ class SkoolMacroTest(SkoolKitTestCase):
             self.assertEqual(end, len(spec), spec)
             self.assertEqual(exp_addresses, addresses)
 
+    def test_evaluate(self):
+        expressions = (
+            ('1', 1),
+            ('$FF', 255),
+            (' 1 + 2 * 3 ', 7),
+            ('(1 + 2) * 3', 9),
+            ('7/2', 3),
+            ('-7/2', -4),
+            ('7%3', 1),
+            ('2**3**2', 512),
+            ('-2**2', -4),
+            ('2**-1', 0),
+            ('2**-1*4', 2),
+            ('1<<4|1', 17),
+            ('6&3^1', 3),
+            ('1<2<3', 1),
+            ('3>2>2', 0),
+            ('1==1&&2!=2', 0),
+            ('0||3', 3),
+            ('2&&3', 3),
+            ('0&&1/0', 0),
+            ('1||a', 1),
+            ('1e3', 1000),
+            ('0b101', 5),
+            ('00', 0)
+        )
+        for param, exp_value in expressions:
+            self.assertEqual(evaluate(param), exp_value, param)
+
+    def test_evaluate_invalid(self):
+        for param in ('', ' ', '()', '1/0', '01', '1 2', '1//2', '1<>2', '!1', '1=1', '1\t+1', 'a', '1&&a', '$', '1.5', '9e999', '1<<1e1', 'x'):
+            with self.assertRaises(ValueError, msg=param):
+                evaluate(param)
+
 if __name__ == '__main__':
     unittest.main()
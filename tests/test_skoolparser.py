@@ -1,9 +1,10 @@
+import os
 import unittest
 import re
 
 from skoolkittest import SkoolKitTestCase
 from skoolkit import SkoolParsingError
-from skoolkit.skoolparser import SkoolParser, TableParser, set_bytes, BASE_10, BASE_16, CASE_LOWER, CASE_UPPER
+from skoolkit.skoolparser import SkoolParser, TableParser, parse_skool, set_bytes, BASE_10, BASE_16, CASE_LOWER, CASE_UPPER
 
 TEST_BASE_CONVERSION_SKOOL = r"""
 c30000 LD A,%11101011
@@ -1617,9 +1618,9 @@ class SkoolParserTest(SkoolKitTestCase):
             ' 24616 DEFS 2'
         ))
         parser = self._get_parser(skool)
-        self.assertEqual(parser.snapshot[24591:24600], [1, 44, 1, 97, 98, 99, 7, 7, 7])
-        self.assertEqual(parser.snapshot[24600:24609], [160, 44, 129, 97, 98, 17, 170, 170, 170])
-        self.assertEqual(parser.snapshot[24609:24618], [15, 99, 15, 170, 240, 98, 99, 0, 0])
+        self.assertEqual(list(parser.snapshot[24591:24600]), [1, 44, 1, 97, 98, 99, 7, 7, 7])
+        self.assertEqual(list(parser.snapshot[24600:24609]), [160, 44, 129, 97, 98, 17, 170, 170, 170])
+        self.assertEqual(list(parser.snapshot[24609:24618]), [15, 99, 15, 170, 240, 98, 99, 0, 0])
 
     def test_nested_braces(self):
         skool = '\n'.join((
@@ -1705,8 +1706,8 @@ class SkoolParserTest(SkoolKitTestCase):
         parser = self._get_parser(skool)
         self.assertEqual(len(parser.memory_map), 0)
         snapshot = parser.snapshot
-        self.assertEqual(snapshot[30000:30003], [1, 2, 3])
-        self.assertEqual(snapshot[50000:50003], [3, 2, 1])
+        self.assertEqual(list(snapshot[30000:30003]), [1, 2, 3])
+        self.assertEqual(list(snapshot[50000:50003]), [3, 2, 1])
 
     def test_remote_entry(self):
         skool = '\n'.join((
@@ -1925,7 +1926,7 @@ class SkoolParserTest(SkoolKitTestCase):
         set_bytes(snapshot, 0, 'DEFB 1,2,3')
         self.assertEqual(snapshot[:3], [1, 2, 3])
         set_bytes(snapshot, 2, 'DEFB 5, "AB"')
-        self.assertEqual(snapshot[2:5], [5, 65, 66])
+        self.assertEqual(list(snapshot[2:5]), [5, 65, 66])
 
         # DEFM
         snapshot = [0] * 10
@@ -1934,12 +1935,12 @@ class SkoolParserTest(SkoolKitTestCase):
         set_bytes(snapshot, 0, 'DEFM "\\"A\\""')
         self.assertEqual(snapshot[:3], [34, 65, 34])
         set_bytes(snapshot, 5, 'DEFM "C:\\\\",12')
-        self.assertEqual(snapshot[5:9], [67, 58, 92, 12])
+        self.assertEqual(list(snapshot[5:9]), [67, 58, 92, 12])
 
         # DEFW
         snapshot = [0] * 10
         set_bytes(snapshot, 3, 'DEFW 1,258')
-        self.assertEqual(snapshot[3:7], [1, 0, 2, 1])
+        self.assertEqual(list(snapshot[3:7]), [1, 0, 2, 1])
 
         # DEFS
         snapshot = [8] * 10
@@ -2910,7 +2911,7 @@ class SkoolParserTest(SkoolKitTestCase):
             ' 30004 LD A,3'
         ))
         snapshot = self._get_parser(skool, html=True).snapshot
-        self.assertEqual([0, 0, 62, 2, 0, 0], snapshot[30000:30006])
+        self.assertEqual([0, 0, 62, 2, 0, 0], list(snapshot[30000:30006]))
 
     def test_html_mode_assemble_bad_values(self):
         skool = '\n'.join((
@@ -2924,7 +2925,7 @@ class SkoolParserTest(SkoolKitTestCase):
             ' 40006 LD A,7'
         ))
         snapshot = self._get_parser(skool, html=True).snapshot
-        self.assertEqual([62, 4, 62, 5, 0, 0, 0, 0], snapshot[40000:40008])
+        self.assertEqual([62, 4, 62, 5, 0, 0, 0, 0], list(snapshot[40000:40008]))
 
     def test_asm_mode_rem(self):
         skool = '\n'.join((
@@ -3409,8 +3410,72 @@ class SkoolParserTest(SkoolKitTestCase):
         self.assertEqual(parser.mode.html, clone.mode.html)
         self.assertEqual(parser.mode.create_labels, clone.mode.create_labels)
         self.assertEqual(parser.mode.asm_labels, clone.mode.asm_labels)
-        self.assertEqual([1, 2, 3, 4, 5, 6, 7, 8], parser.snapshot[40000:40008])
-        self.assertEqual([1, 2, 9, 10, 11, 12, 7, 8], clone.snapshot[40000:40008])
+        self.assertEqual([1, 2, 3, 4, 5, 6, 7, 8], list(parser.snapshot[40000:40008]))
+        self.assertEqual([1, 2, 9, 10, 11, 12, 7, 8], list(clone.snapshot[40000:40008]))
+
+    def test_parse_skool_with_cache(self):
+        skool = '\n'.join((
+            '; Routine',
+            'c30000 CALL 30010',
+            '',
+            '; Routine',
+            'c30010 JR 30000',
+            '',
+            '; Data',
+            '@label=DATA',
+            'b30012 DEFB 1,2,3'
+        ))
+        skoolfile = self.write_text_file(skool, suffix='.skool')
+        cache_dir = self.make_directory()
+        parser1 = parse_skool(skoolfile, cache_dir, create_labels=True)
+        cache_files = os.listdir(cache_dir)
+        self.assertEqual(len(cache_files), 1)
+
+        parser2 = parse_skool(skoolfile, cache_dir, create_labels=True)
+        self.assertEqual(os.listdir(cache_dir), cache_files)
+        self.assertIsNot(parser2, parser1)
+        self.assertEqual([e.address for e in parser2.memory_map], [30000, 30010, 30012])
+        entry1, entry2, entry3 = parser2.memory_map
+        self.assertIs(parser2.get_entry(30010), entry2)
+        self.assertIs(entry1.instructions[0].container, entry1)
+        self.assertIs(entry1.instructions[0].reference.entry, entry2)
+        self.assertEqual(entry1.instructions[0].referrers, [entry2])
+        self.assertEqual(entry2.referrers, [entry1])
+        self.assertEqual(parser2.get_asm_label(30012), 'DATA')
+        self.assertEqual(list(parser2.snapshot[30012:30015]), [1, 2, 3])
+
+        parse_skool(skoolfile, cache_dir, create_labels=False)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_parse_skool_with_corrupt_cache_file(self):
+        skoolfile = self.write_text_file('b40000 DEFB 1', suffix='.skool')
+        cache_dir = self.make_directory()
+        parse_skool(skoolfile, cache_dir)
+        cache_file = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        self.write_text_file('junk', cache_file)
+        parser = parse_skool(skoolfile, cache_dir)
+        self.assertEqual(parser.snapshot[40000], 1)
+        self.assertEqual(parse_skool(skoolfile, cache_dir).snapshot[40000], 1)
+
+    def test_parse_skool_with_truncated_cache_file(self):
+        skoolfile = self.write_text_file('b40000 DEFB 2', suffix='.skool')
+        cache_dir = self.make_directory()
+        parse_skool(skoolfile, cache_dir)
+        cache_file = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        with open(cache_file, 'rb') as f:
+            data = f.read()
+        with open(cache_file, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        self.assertEqual(parse_skool(skoolfile, cache_dir).snapshot[40000], 2)
+
+    def test_parse_skool_with_unusable_cache_dir(self):
+        skoolfile = self.write_text_file('b40000 DEFB 3', suffix='.skool')
+        cache_dir = self.write_text_file()
+        parser = parse_skool(skoolfile, cache_dir)
+        self.assertEqual(parser.snapshot[40000], 3)
+        warnings = self.err.getvalue().split('\n')[:-1]
+        self.assertEqual(len(warnings), 1)
+        self.assertTrue(warnings[0].startswith('WARNING: Unable to write cache file {}'.format(cache_dir)))
 
 class TableParserTest(SkoolKitTestCase):
     class MockWriter:
@@ -3,7 +3,7 @@ import unittest
 from unittest.mock import patch, Mock
 
 from skoolkittest import SkoolKitTestCase
-from skoolkit import sna2skool, SkoolKitError, VERSION
+from skoolkit import sna2skool, snaskool, SkoolKitError, VERSION
 from skoolkit.config import COMMANDS
 
 # Binary data designed to test the default static code analysis algorithm:
@@ -393,6 +393,8 @@ class OptionsTest(SkoolKitTestCase):
         self.assertEqual(options.line_width, 79)
         self.assertFalse(options.zfill)
         self.assertEqual(options.params, [])
+        self.assertIsNone(options.trace)
+        self.assertEqual(options.jobs, 1)
 
     @patch.object(sna2skool, 'run', mock_run)
     def test_config_read_from_file(self):
@@ -405,6 +407,7 @@ class OptionsTest(SkoolKitTestCase):
             'DefbSize=12',
             'DefbZfill=1',
             'DefmSize=92',
+            'Jobs=3',
             'LineWidth=119',
             'ListRefs=2',
             'Text=1',
@@ -431,6 +434,7 @@ class OptionsTest(SkoolKitTestCase):
         self.assertEqual(options.defb_mod, 8)
         self.assertEqual(options.line_width, 119)
         self.assertTrue(options.zfill)
+        self.assertEqual(options.jobs, 3)
         self.assertEqual(config.get('Title-b'), 'Data at {address}')
         self.assertEqual(config.get('Title-c'), 'Code at {address}')
 
@@ -710,6 +714,28 @@ class OptionsTest(SkoolKitTestCase):
         self.assertEqual(['c 30000', 'c 30003', 'i 30005'], gen_ctl)
         self.assertTrue(mock_skool_writer.wrote_skool)
 
+    @patch.object(sna2skool, 'CtlParser', MockCtlParser)
+    @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
+    def test_options_g_and_M_with_unaligned_address_range(self):
+        ctlfile = self.write_text_file()
+        data = [
+            175,          # 30003 XOR A
+            201,          # 30004 RET
+            33, 0, 0,     # 30005 LD HL,0
+            1, 0, 0,      # 30008 LD BC,0
+            201,          # 30011 RET
+            62, 1,        # 30012 LD A,1
+            201           # 30014 RET
+        ]
+        binfile = self.write_bin_file(data)
+        mapfile = self.write_bin_file(self._create_z80_map([30003, 30004, 30005, 30008, 30009, 30011, 30012, 30014]))
+        output, error = self.run_sna2skool('-g {} -M {} -o 30003 -s 30004 -e 30014 {}'.format(ctlfile, mapfile, binfile))
+        self.assertEqual(error, 'Reading {}\n'.format(mapfile))
+        with open(ctlfile, 'r') as f:
+            gen_ctl = [line.rstrip() for line in f]
+        self.assertEqual(['c 30004', 'c 30005', 'c 30012', 'i 30014'], gen_ctl)
+        self.assertTrue(mock_skool_writer.wrote_skool)
+
     @patch.object(sna2skool, 'CtlParser', MockCtlParser)
     @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
     def test_options_g_and_M_with_end_address_65536(self):
@@ -727,6 +753,75 @@ class OptionsTest(SkoolKitTestCase):
         self.assertEqual(['c 65533'], gen_ctl)
         self.assertTrue(mock_skool_writer.wrote_skool)
 
+    @patch.object(sna2skool, 'CtlParser', MockCtlParser)
+    @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
+    def test_options_g_and_trace(self):
+        ctlfile = self.write_text_file()
+        data = [
+            205, 56, 117, # 30000 CALL 30008
+            24, 3,        # 30003 JR 30008
+            1, 2, 3,      # 30005 DEFB 1,2,3
+            175,          # 30008 XOR A
+            201,          # 30009 RET
+            0, 0,         # 30010 DEFB 0,0
+            62, 1,        # 30012 LD A,1
+            201           # 30014 RET
+        ]
+        binfile = self.write_bin_file(data)
+        self.run_sna2skool('-g {} --trace 30000,$753C -o 30000 {}'.format(ctlfile, binfile))
+        with open(ctlfile, 'r') as f:
+            gen_ctl = [line.rstrip() for line in f]
+        exp_ctl = ['c 30000', 'b 30005', 'c 30008', 's 30010', 'c 30012', 'i 30015']
+        self.assertEqual(exp_ctl, gen_ctl)
+        self.assertTrue(mock_skool_writer.wrote_skool)
+
+    @patch.object(sna2skool, 'CtlParser', MockCtlParser)
+    @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
+    def test_options_g_and_trace_with_jump_into_block(self):
+        ctlfile = self.write_text_file()
+        data = [
+            6, 3,    # 40000 LD B,3
+            205, 71, # 40002 CALL 40007
+            156,
+            16, 251, # 40005 DJNZ 40002
+            201,     # 40007 RET
+        ]
+        binfile = self.write_bin_file(data)
+        self.run_sna2skool('-g {} --trace 40000 -o 40000 {}'.format(ctlfile, binfile))
+        with open(ctlfile, 'r') as f:
+            gen_ctl = [line.rstrip() for line in f]
+        self.assertEqual(['c 40000', 'c 40007', 'i 40008'], gen_ctl)
+        self.assertTrue(mock_skool_writer.wrote_skool)
+
+    @patch.object(sna2skool, 'CtlParser', MockCtlParser)
+    @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
+    def test_options_g_M_and_trace(self):
+        ctlfile = self.write_text_file()
+        data = [
+            195, 83, 195, # 50000 JP 50003
+            62, 1,        # 50003 LD A,1
+            201,          # 50005 RET
+            62, 2,        # 50006 LD A,2
+            201           # 50008 RET
+        ]
+        binfile = self.write_bin_file(data)
+        mapfile = self.write_bin_file(self._create_z80_map([50006, 50008]))
+        self.run_sna2skool('-g {} -M {} --trace 50000 -o 50000 {}'.format(ctlfile, mapfile, binfile))
+        with open(ctlfile, 'r') as f:
+            gen_ctl = [line.rstrip() for line in f]
+        self.assertEqual(['c 50000', 'c 50006', 'i 50009'], gen_ctl)
+        self.assertTrue(mock_skool_writer.wrote_skool)
+
+    def test_option_trace_without_option_g(self):
+        binfile = self.write_bin_file([201], suffix='.bin')
+        with self.assertRaisesRegex(SkoolKitError, '^--trace cannot be used without -g/--generate-ctl$'):
+            self.run_sna2skool('--trace 65535 {}'.format(binfile))
+
+    def test_option_trace_invalid_address_list(self):
+        with self.assertRaises(SystemExit) as cm:
+            self.run_sna2skool('-g test.ctl --trace 30000,x test.bin')
+        self.assertEqual(cm.exception.args[0], 2)
+
     @patch.object(sna2skool, 'CtlParser', MockCtlParser)
     @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
     def _test_option_M(self, code_map, option, map_file=False):
@@ -737,7 +832,7 @@ class OptionsTest(SkoolKitTestCase):
             exp_error = 'Reading {}\n'.format(code_map_file)
         else:
             code_map_file = self.write_text_file('\n'.join(code_map), suffix='.log')
-            exp_error = 'Reading {}: .*100%\x08\x08\x08\x08\n'.format(code_map_file)
+            exp_error = r'Reading {}: .*100% \(\d+\.\d+MB/s\)\x08+\n'.format(code_map_file)
         output, error = self.run_sna2skool('-g {} {} {} -o {} {}'.format(ctlfile, option, code_map_file, TEST_MAP_BIN_ORG, binfile), out_lines=False)
         match = re.match(exp_error, error)
         if match is None or match.group() != error:
@@ -768,12 +863,43 @@ class OptionsTest(SkoolKitTestCase):
     def test_option_M_zero_hexadecimal(self):
         self._test_option_M(self._create_zero_log(TEST_MAP, False), '--map')
 
+    def test_option_M_log_read_in_chunks(self):
+        for chunk_size in (1, 7, 64):
+            with patch.object(snaskool, 'LOG_CHUNK_SIZE', chunk_size):
+                self._test_option_M(self._create_fuse_profile(TEST_MAP), '-M')
+                self._test_option_M(self._create_specemu_log(TEST_MAP), '-M')
+                self._test_option_M(self._create_spud_log(TEST_MAP), '-M')
+                self._test_option_M(self._create_zero_log(TEST_MAP, False), '-M')
+
+    @patch.object(snaskool, 'LOG_CHUNK_SIZE', 64)
+    @patch.object(snaskool, 'PARALLEL_MIN_SIZE', 1)
+    def test_option_M_log_read_in_parallel(self):
+        code_maps = (
+            self._create_fuse_profile(TEST_MAP),
+            self._create_specemu_log(TEST_MAP),
+            self._create_spud_log(TEST_MAP),
+            self._create_zero_log(TEST_MAP, False)
+        )
+        for jobs in (2, 3):
+            for code_map in code_maps:
+                read_log_in_parallel = Mock(wraps=snaskool._read_log_in_parallel)
+                with patch.object(snaskool, '_read_log_in_parallel', read_log_in_parallel):
+                    self._test_option_M(code_map, '--jobs {} -M'.format(jobs))
+                self.assertEqual(read_log_in_parallel.call_count, 1)
+
+    @patch.object(snaskool, 'PARALLEL_MIN_SIZE', 1)
+    def test_option_M_log_not_read_in_parallel_by_default(self):
+        read_log_in_parallel = Mock(wraps=snaskool._read_log_in_parallel)
+        with patch.object(snaskool, '_read_log_in_parallel', read_log_in_parallel):
+            self._test_option_M(self._create_fuse_profile(TEST_MAP), '-M')
+        read_log_in_parallel.assert_not_called()
+
     @patch.object(sna2skool, 'read_bin_file', Mock(return_value=[]))
-    def _test_option_M_invalid_map(self, code_map, line_no, invalid_line, error):
+    def _test_option_M_invalid_map(self, code_map, line_no, invalid_line, error, options=''):
         ctlfile = self.write_text_file()
         code_map_file = self.write_text_file('\n'.join(code_map), suffix='.log')
         with self.assertRaisesRegex(SkoolKitError, '{}, line {}: {}: {}'.format(code_map_file, line_no, error, invalid_line)):
-            self.run_sna2skool('-g {} -M {} test-invalid-map.bin'.format(ctlfile, code_map_file))
+            self.run_sna2skool('-g {} {} -M {} test-invalid-map.bin'.format(ctlfile, options, code_map_file))
 
     def test_option_M_unparseable_address(self):
         invalid_line = '0xABCG,4'
@@ -785,6 +911,33 @@ class OptionsTest(SkoolKitTestCase):
         code_map = ['All numbers are in hexadecimal', '8000\t11111\tNOP', invalid_line, '8002\t11117\tNOP']
         self._test_option_M_invalid_map(code_map, 3, invalid_line, 'Address out of range')
 
+    @patch.object(snaskool, 'LOG_CHUNK_SIZE', 32)
+    def test_option_M_invalid_line_in_later_chunk(self):
+        invalid_line = '0xABCG,4'
+        code_map = ['0x{:X},1'.format(a) for a in range(40000, 40100)]
+        code_map.insert(77, invalid_line)
+        self._test_option_M_invalid_map(code_map, 78, invalid_line, 'Cannot parse address')
+
+        invalid_line = '12345\t11113\tNOP'
+        code_map = ['All numbers are in hexadecimal', '']
+        code_map.extend('{:x}\t11111\tNOP'.format(a) for a in range(40000, 40100))
+        code_map.insert(63, invalid_line)
+        self._test_option_M_invalid_map(code_map, 64, invalid_line, 'Address out of range')
+
+    @patch.object(snaskool, 'LOG_CHUNK_SIZE', 32)
+    @patch.object(snaskool, 'PARALLEL_MIN_SIZE', 1)
+    def test_option_M_invalid_line_in_later_part_read_in_parallel(self):
+        invalid_line = '0xABCG,4'
+        code_map = ['0x{:X},1'.format(a) for a in range(40000, 40100)]
+        code_map.insert(77, invalid_line)
+        self._test_option_M_invalid_map(code_map, 78, invalid_line, 'Cannot parse address', '--jobs 3')
+
+        invalid_line = '12345\t11113\tNOP'
+        code_map = ['All numbers are in hexadecimal', '']
+        code_map.extend('{:x}\t11111\tNOP'.format(a) for a in range(40000, 40100))
+        code_map.insert(63, invalid_line)
+        self._test_option_M_invalid_map(code_map, 64, invalid_line, 'Address out of range', '--jobs 3')
+
     @patch.object(sna2skool, 'read_bin_file', Mock(return_value=[]))
     def test_option_M_unrecognised_format(self):
         ctlfile = self.write_text_file()
@@ -869,6 +1022,14 @@ class OptionsTest(SkoolKitTestCase):
         options = run_args[1]
         self.assertEqual(options.text, 0)
 
+    @patch.object(sna2skool, 'run', mock_run)
+    @patch.object(sna2skool, 'get_config', mock_config)
+    def test_option_jobs(self):
+        for spec in ('--jobs 4', '-I Jobs=4'):
+            self.run_sna2skool('{} test.sna'.format(spec))
+            options = run_args[1]
+            self.assertEqual(options.jobs, 4)
+
     @patch.object(sna2skool, 'get_snapshot', mock_get_snapshot)
     @patch.object(sna2skool, 'CtlParser', MockCtlParser)
     @patch.object(sna2skool, 'SkoolWriter', MockSkoolWriter)
@@ -1041,7 +1202,7 @@ class OptionsTest(SkoolKitTestCase):
         data = [1, 2, 3]
         binfile = self.write_bin_file(data, suffix='.qux')
         self.run_sna2skool(binfile)
-        self.assertEqual(data, mock_skool_writer.snapshot[65533:65536])
+        self.assertEqual(data, list(mock_skool_writer.snapshot[65533:65536]))
         self.assertTrue(mock_skool_writer.wrote_skool)
 
     @patch.object(sna2skool, 'run', mock_run)
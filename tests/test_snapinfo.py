@@ -770,7 +770,7 @@ class SnapinfoTest(SkoolKitTestCase):
             output, error = self.run_snapinfo('{} {}'.format(option, snafile))
             self.assertEqual(error, '')
             self.assertEqual(['BASIC DONE!'], output)
-            self.assertEqual(exp_snapshot, mock_basic_lister.snapshot)
+            self.assertEqual(exp_snapshot, list(mock_basic_lister.snapshot))
             mock_basic_lister.snapshot = None
 
     @patch.object(snapinfo, 'VariableLister', MockVariableLister)
@@ -782,7 +782,7 @@ class SnapinfoTest(SkoolKitTestCase):
             output, error = self.run_snapinfo('{} {}'.format(option, snafile))
             self.assertEqual(error, '')
             self.assertEqual(['VARIABLES DONE!'], output)
-            self.assertEqual(exp_snapshot, mock_variable_lister.snapshot)
+            self.assertEqual(exp_snapshot, list(mock_variable_lister.snapshot))
             mock_variable_lister.snapshot = None
 
     @patch.object(snapinfo, 'BasicLister', MockBasicLister)
@@ -795,8 +795,8 @@ class SnapinfoTest(SkoolKitTestCase):
             output, error = self.run_snapinfo('{} {}'.format(option, snafile))
             self.assertEqual(error, '')
             self.assertEqual(['BASIC DONE!', 'VARIABLES DONE!'], output)
-            self.assertEqual(exp_snapshot, mock_basic_lister.snapshot)
-            self.assertEqual(exp_snapshot, mock_variable_lister.snapshot)
+            self.assertEqual(exp_snapshot, list(mock_basic_lister.snapshot))
+            self.assertEqual(exp_snapshot, list(mock_variable_lister.snapshot))
             mock_basic_lister.snapshot = None
             mock_variable_lister.snapshot = None
 
@@ -868,8 +868,52 @@ class SnapinfoTest(SkoolKitTestCase):
         self._test_bad_spec('--find', '1,2,3-x', exp_error.format('x'), False)
         self._test_bad_spec('-f', '4,5,6-1-y', exp_error.format('1-y'), False)
         self._test_bad_spec('--find', '7,8,9-z-5', exp_error.format('z-5'), False)
+        self._test_bad_spec('--find', '7,8,9-0', exp_error.format('0'), False)
+        self._test_bad_spec('-f', '7,8,9-0-2', exp_error.format('0-2'), False)
         self._test_bad_spec('-f', '10,11,12-q-?', exp_error.format('q-?'), False)
 
+    def test_option_find_multiple(self):
+        ram = [0] * 49152
+        ram[41234 - 16384:41234 - 16384 + 3] = (1, 2, 3)
+        ram[51234 - 16384:51234 - 16384 + 5:2] = (4, 5, 6)
+        ram[61234 - 16384:61234 - 16384 + 3] = (4, 5, 6)
+        exp_output = [
+            '41234-41236-1 A112-A114-1: 1,2,3',
+            '61234-61236-1 EF32-EF34-1: 4,5,6',
+            '51234-51238-2 C822-C826-2: 4,5,6'
+        ]
+        self._test_sna(ram, exp_output, '-f 1,2,3 --find 4,5,6-1-2')
+
+    def test_option_find_at_end_of_ram(self):
+        ram = [0] * 49152
+        ram[-5:] = (7, 1, 8, 1, 9)
+        ram[-11:-6:2] = (7, 8, 9)
+        exp_output = [
+            '65525-65529-2 FFF5-FFF9-2: 7,8,9',
+            '65531-65535-2 FFFB-FFFF-2: 7,8,9'
+        ]
+        self._test_sna(ram, exp_output, '-f 7,8,9-2')
+
+    def test_option_find_with_multiple_snapshots(self):
+        snafiles = []
+        exp_output = []
+        for addr in (34567, 45678, 56789):
+            ram = [0] * 49152
+            ram[addr - 16384:addr - 16384 + 2] = (1, 99)
+            snafile = self.write_bin_file([0] * 27 + ram, suffix='.sna')
+            snafiles.append(snafile)
+            exp_output.append('{0}: {1}-{2}-1 {1:04X}-{2:04X}-1: 1,99'.format(snafile, addr, addr + 1))
+        for jobs in (1, 2):
+            output, error = self.run_snapinfo('--jobs {} -f 1,99 {}'.format(jobs, ' '.join(snafiles)))
+            self.assertEqual(error, '')
+            self.assertEqual(exp_output, output)
+
+    def test_multiple_snapshots_without_search_option(self):
+        snafile = self.write_bin_file([0] * 49179, suffix='.sna')
+        output, error = self.run_snapinfo('-p 32768 {0} {0}'.format(snafile), catch_exit=2)
+        self.assertEqual(len(output), 0)
+        self.assertTrue(error.startswith('usage: snapinfo.py'))
+
     def test_option_p_with_single_address(self):
         ram = [0] * 49152
         address = 31759
@@ -1103,6 +1147,13 @@ class SnapinfoTest(SkoolKitTestCase):
         exp_output = []
         self._test_sna(ram, exp_output, '-t nowhere')
 
+    def test_option_find_text_multiple(self):
+        ram = [0] * 49152
+        ram[43210 - 16384:43210 - 16384 + 3] = [ord(c) for c in 'baz']
+        ram[32109 - 16384:32109 - 16384 + 3] = [ord(c) for c in 'qux']
+        exp_output = ['43210-43212 A8CA-A8CC: baz', '32109-32111 7D6D-7D6F: qux']
+        self._test_sna(ram, exp_output, '-t baz --find-text qux')
+
     def test_option_T(self):
         ram = [0] * 49152
         tile_addr = 54212
@@ -1181,6 +1232,8 @@ class SnapinfoTest(SkoolKitTestCase):
         self._test_bad_spec('--find-tile', '2,3-x', exp_error.format('x'), False)
         self._test_bad_spec('-T', '5,6-1-y', exp_error.format('1-y'), False)
         self._test_bad_spec('--find-tile', '8,9-z-5', exp_error.format('z-5'), False)
+        self._test_bad_spec('--find-tile', '8,9-0', exp_error.format('0'), False)
+        self._test_bad_spec('-T', '8,9-0-2', exp_error.format('0-2'), False)
         self._test_bad_spec('-T', '11,12-q-?', exp_error.format('q-?'), False)
 
     def test_option_V(self):
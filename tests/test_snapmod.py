@@ -53,7 +53,7 @@ class SnapmodTest(SkoolKitTestCase):
         self.assertEqual(error, '')
         z80_header = list(read_bin_file(outfile, len(exp_header)))
         self.assertEqual(exp_header, z80_header)
-        z80_ram = get_snapshot(outfile)[16384:]
+        z80_ram = list(get_snapshot(outfile)[16384:])
         self.assertEqual(exp_ram, z80_ram)
 
     def _test_move(self, option, src, block, dest, version, compress, base16=False):
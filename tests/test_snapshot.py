@@ -1,7 +1,7 @@
 import unittest
 
 from skoolkittest import SkoolKitTestCase
-from skoolkit.snapshot import get_snapshot, make_z80_ram_block, SnapshotError
+from skoolkit.snapshot import get_snapshot, make_z80_ram_block, write_z80v3, SnapshotError, _decompress_block
 
 class SnapshotTest(SkoolKitTestCase):
     def _check_ram(self, ram, exp_ram, model, out_7ffd, pages, page):
@@ -39,7 +39,7 @@ class SNATest(SnapshotTest):
         sna = header + exp_ram
         tmp_sna = self.write_bin_file(sna, suffix='.sna')
         snapshot = get_snapshot(tmp_sna)
-        ram = snapshot[16384:]
+        ram = list(snapshot[16384:])
         self.assertEqual(len(ram), 49152)
         self.assertEqual(ram, exp_ram)
 
@@ -50,7 +50,7 @@ class SNATest(SnapshotTest):
         sna = header + exp_ram + tail
         tmp_sna = self.write_bin_file(sna, suffix='.sna')
         snapshot = get_snapshot(tmp_sna)
-        ram = snapshot[16384:]
+        ram = list(snapshot[16384:])
         self.assertEqual(len(ram), 49152)
         self.assertEqual(ram, exp_ram)
 
@@ -70,7 +70,7 @@ class SNATest(SnapshotTest):
         sna = header + page5 + page2 + page6 + config + page0 + page1 + page3 + page4 + page7
         tmp_sna = self.write_bin_file(sna, suffix='.sna')
         snapshot = get_snapshot(tmp_sna, 1)
-        ram = snapshot[16384:]
+        ram = list(snapshot[16384:])
         self.assertEqual(len(ram), 49152)
         self.assertEqual(ram, page5 + page2 + page1)
 
@@ -90,7 +90,7 @@ class SNATest(SnapshotTest):
         sna = header + page5 + page2 + page3 + config + page0 + page1 + page4 + page6 + page7
         tmp_sna = self.write_bin_file(sna, suffix='.sna')
         snapshot = get_snapshot(tmp_sna, 5)
-        ram = snapshot[16384:]
+        ram = list(snapshot[16384:])
         self.assertEqual(len(ram), 49152)
         self.assertEqual(ram, page5 + page2 + page5)
 
@@ -98,7 +98,7 @@ class Z80Test(SnapshotTest):
     def _test_z80(self, exp_ram, version, compress, machine_id=0, modify=False, out_7ffd=0, pages={}, page=None):
         model, tmp_z80 = self.write_z80(exp_ram, version, compress, machine_id, modify, out_7ffd, pages)
         snapshot = get_snapshot(tmp_z80, page)
-        self._check_ram(snapshot[16384:], exp_ram, model, out_7ffd, pages, page)
+        self._check_ram(list(snapshot[16384:]), exp_ram, model, out_7ffd, pages, page)
 
     def test_z80v1(self):
         exp_ram = [n & 255 for n in range(49152)]
@@ -139,6 +139,10 @@ class Z80Test(SnapshotTest):
         exp_ram += [193] * (49152 - len(exp_ram))
         self._test_z80(exp_ram, 3, True)
 
+    def test_z80v3_48k_mgt(self):
+        exp_ram = [(n + 64) & 255 for n in range(49152)]
+        self._test_z80(exp_ram, 3, False, machine_id=3)
+
     def test_z80v3_128k(self):
         exp_ram = [(n + 37) & 255 for n in range(49152)]
         self._test_z80(exp_ram, 3, False, machine_id=4)
@@ -159,29 +163,62 @@ class Z80Test(SnapshotTest):
         with self.assertRaisesRegex(SnapshotError, 'Found ED ED 00 0B'):
             get_snapshot(z80_file)
 
+    def test_z80v3_compressed_bank_ending_with_ED(self):
+        exp_ram = [0] * 16383 + [237] + [0] * 32767 + [237]
+        z80file = self.write_bin_file(suffix='.z80')
+        write_z80v3(z80file, exp_ram, (), ())
+        self.assertEqual(exp_ram, list(get_snapshot(z80file)[16384:]))
+
 class Z80CompressionTest(SkoolKitTestCase):
     def test_single_ED_followed_by_five_identical_values(self):
         data = [237, 1, 1, 1, 1, 1]
         block = make_z80_ram_block(data, 0)
         exp_data = [len(data), 0, 0] + data
-        self.assertEqual(exp_data, block)
+        self.assertEqual(exp_data, list(block))
 
     def test_single_ED_followed_by_six_identical_values(self):
         data = [237, 2, 2, 2, 2, 2, 2]
         block = make_z80_ram_block(data, 0)
         exp_data = [6, 0, 0, 237, 2, 237, 237, 5, 2]
-        self.assertEqual(exp_data, block)
+        self.assertEqual(exp_data, list(block))
 
     def test_block_ending_with_single_ED(self):
         data = [0, 237]
         exp_data = [2, 0, 0, 0, 237]
-        self.assertEqual(exp_data, make_z80_ram_block(data, 0))
+        self.assertEqual(exp_data, list(make_z80_ram_block(data, 0)))
+
+    def test_runs_longer_than_255_bytes(self):
+        data = [0] * 257 + [237] * 256 + [1] * 255 + [237] * 2
+        exp_data = [
+            237, 237, 255, 0, 0, 0,
+            237, 237, 255, 237, 237, 1,
+            237, 237, 254, 1,
+            237, 237, 2, 237
+        ]
+        block = make_z80_ram_block(data, 5)
+        self.assertEqual([len(exp_data), 0, 5] + exp_data, list(block))
+
+    def test_round_trip(self):
+        corpus = (
+            [],
+            [237],
+            [237, 237],
+            [237, 237, 237, 0, 237],
+            [1, 237, 237, 1, 1, 1, 1, 1, 237],
+            [237, 0] * 100,
+            [n & 255 for n in range(1000)],
+            [0] * 1000 + [237] * 600 + [7] * 3
+        )
+        for data in corpus:
+            block = make_z80_ram_block(data, 0)
+            self.assertEqual(len(block) - 3, block[0] + 256 * block[1])
+            self.assertEqual(data, list(_decompress_block(block[3:])))
 
 class SZXTest(SnapshotTest):
     def _test_szx(self, exp_ram, compress, machine_id=1, ch7ffd=0, pages={}, page=None):
         tmp_szx = self.write_szx(exp_ram, compress, machine_id, ch7ffd, pages)
         snapshot = get_snapshot(tmp_szx, page)
-        self._check_ram(snapshot[16384:], exp_ram, machine_id, ch7ffd, pages, page)
+        self._check_ram(list(snapshot[16384:]), exp_ram, machine_id, ch7ffd, pages, page)
 
     def test_szx_16k(self):
         exp_ram = [(n + 13) & 255 for n in range(16384)]
@@ -437,6 +437,38 @@ class DisassemblyTest(SkoolKitTestCase):
         self.assertEqual(len(disassembly.entries), 0)
         self.assertIsNone(disassembly.org)
 
+    def test_rebuild(self):
+        snapshot = [0] * 65536
+        snapshot[32768:32775] = [
+            175,        # 32768 XOR A
+            201,        # 32769 RET
+            62, 1,      # 32770 LD A,1
+            24, 0,      # 32772 JR 32774
+            201         # 32774 RET
+        ]
+        ctls = {32768: 'c', 32770: 'c', 32772: 'c', 32774: 'c', 32775: 'i'}
+        disassembly = Disassembly(snapshot, CtlParser(ctls))
+        first_entry = disassembly.entries[0]
+        last_entry = disassembly.entries[-1]
+
+        del ctls[32772]
+        del ctls[32774]
+        new_entries = disassembly.rebuild(32770, 32775)
+        self.assertEqual([e.address for e in new_entries], [32770])
+        self.assertEqual([e.address for e in disassembly.entries], [32768, 32770])
+        self.assertIs(disassembly.entries[0], first_entry)
+        self.assertIs(first_entry.next, new_entries[0])
+        self.assertIsNone(new_entries[0].next)
+        self.assertEqual([i.address for i in new_entries[0].instructions], [32770, 32772, 32774])
+        self.assertNotIn(last_entry.address, disassembly.entry_map)
+
+        ctls[32772] = 'b'
+        new_entries = disassembly.rebuild(32770, 32775)
+        self.assertEqual([e.address for e in disassembly.entries], [32768, 32770, 32772])
+        self.assertEqual(new_entries[1].instructions[0].operation, 'DEFB 24,0,201')
+        self.assertIs(disassembly.instructions[32772], new_entries[1].instructions[0])
+        self.assertNotIn(32774, disassembly.instructions)
+
     def test_referrers(self):
         snapshot = [
             201,       # 00000 RET
@@ -24,7 +24,7 @@ def mock_make_z80(*args):
 
 def mock_write_z80(ram, namespace, z80):
     global snapshot
-    snapshot = [0] * 16384 + ram
+    snapshot = [0] * 16384 + list(ram)
 
 class Tap2SnaTest(SkoolKitTestCase):
     def _write_tap(self, blocks, zip_archive=False, tap_name=None):
@@ -64,7 +64,7 @@ class Tap2SnaTest(SkoolKitTestCase):
         self.assertEqual(len(output), 1)
         self.assertEqual(output[0], 'Writing {}'.format(z80file))
         self.assertEqual(error, '')
-        return get_snapshot(z80file)
+        return list(get_snapshot(z80file))
 
     def _test_bad_spec(self, option, exp_error):
         odir = self.make_directory()
@@ -183,7 +183,7 @@ class Tap2SnaTest(SkoolKitTestCase):
         z80file = self.write_bin_file(suffix='.z80')
         output, error = self.run_tap2sna('--force {} {}'.format(tapfile, z80file))
         self.assertEqual(error, '')
-        snapshot = get_snapshot(z80file)
+        snapshot = list(get_snapshot(z80file))
         self.assertEqual(basic_data, snapshot[23755:23755 + len(basic_data)])
         self.assertEqual(code, snapshot[code_start:code_start + len(code)])
 
@@ -200,7 +200,7 @@ class Tap2SnaTest(SkoolKitTestCase):
         z80file = self.write_bin_file(suffix='.z80')
         output, error = self.run_tap2sna('--force {} {}'.format(tapfile, z80file))
         self.assertEqual(error, '')
-        snapshot = get_snapshot(z80file)
+        snapshot = list(get_snapshot(z80file))
         self.assertEqual(code, snapshot[code_start:code_start + len(code)])
 
     def test_standard_load_ignores_truncated_header_block(self):
@@ -216,7 +216,7 @@ class Tap2SnaTest(SkoolKitTestCase):
         z80file = self.write_bin_file(suffix='.z80')
         output, error = self.run_tap2sna('--force {} {}'.format(tapfile, z80file))
         self.assertEqual(error, '')
-        snapshot = get_snapshot(z80file)
+        snapshot = list(get_snapshot(z80file))
         self.assertEqual([0] * length, snapshot[code_start:code_start + length])
 
     def test_standard_load_with_unknown_block_type(self):
@@ -248,7 +248,7 @@ class Tap2SnaTest(SkoolKitTestCase):
         z80file = self.write_bin_file(suffix='.z80')
         output, error = self.run_tap2sna('--force {} {}'.format(tzxfile, z80file))
         self.assertEqual(error, '')
-        snapshot = get_snapshot(z80file)
+        snapshot = list(get_snapshot(z80file))
         self.assertEqual(basic_data, snapshot[23755:23755 + len(basic_data)])
         self.assertEqual(code, snapshot[code_start:code_start + len(code)])
 
@@ -394,7 +394,7 @@ class Tap2SnaTest(SkoolKitTestCase):
         self.assertEqual(output[0], 'Extracting {}'.format(tap_name))
         self.assertEqual(output[1], 'Writing {}'.format(z80file))
         self.assertEqual(error, '')
-        snapshot = get_snapshot(z80file)
+        snapshot = list(get_snapshot(z80file))
         self.assertEqual(data, snapshot[start:start + len(data)])
 
     def test_invalid_tzx_file(self):
@@ -499,7 +499,7 @@ class TapinfoTest(SkoolKitTestCase):
         output, error = self.run_tapinfo('-B 1 {}'.format(tapfile))
         self.assertEqual(error, '')
         self.assertEqual(['BASIC DONE!'], output)
-        self.assertEqual(exp_snapshot, mock_basic_lister.snapshot)
+        self.assertEqual(exp_snapshot, list(mock_basic_lister.snapshot))
 
     @patch.object(tapinfo, 'BasicLister', MockBasicLister)
     def test_option_basic_tzx_with_address(self):
@@ -513,7 +513,7 @@ class TapinfoTest(SkoolKitTestCase):
         output, error = self.run_tapinfo('--basic 1,{} {}'.format(address, tzxfile))
         self.assertEqual(error, '')
         self.assertEqual(['BASIC DONE!'], output)
-        self.assertEqual(exp_snapshot, mock_basic_lister.snapshot)
+        self.assertEqual(exp_snapshot, list(mock_basic_lister.snapshot))
 
     def test_option_B_with_invalid_block_spec(self):
         exp_error = 'Invalid block specification'
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import shutil
+import subprocess
+import tempfile
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+
+def write(line):
+    print(line)
+
+def peak_rss(*args):
+    # Run a command in a fresh process so that its peak RSS can be measured
+    # on its own
+    code = "import sys; sys.path.insert(0, {!r}); import resource; sys.argv[0] = {!r}; exec(open(sys.argv[0]).read()); " \
+           "sys.stderr.write('RSS:{{}}\\n'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))"
+    script = os.path.join(SKOOLKIT_HOME, args[0])
+    cmd = [sys.executable, '-c', code.format(SKOOLKIT_HOME, script)] + list(args[1:])
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    for line in proc.stderr.splitlines():
+        if line.startswith('RSS:'):
+            return proc.stdout, int(line[4:]) // 1024
+    sys.stderr.write(proc.stderr)
+    sys.exit(1)
+
+def show_usage():
+    sys.stderr.write("""Usage: {} SNAPSHOT
+
+  Measure the peak RSS of sna2skool.py and skool2html.py (in the current
+  development version of SkoolKit) when disassembling SNAPSHOT (a 48K SNA, SZX
+  or Z80 file) with a generated control file, and then building an HTML
+  disassembly from the resultant skool file.
+""".format(os.path.basename(sys.argv[0])))
+    sys.exit()
+
+###############################################################################
+# Begin
+###############################################################################
+args = sys.argv[1:]
+if len(args) != 1 or args[0].startswith('-'):
+    show_usage()
+snafile = os.path.abspath(args[0])
+tmpdir = tempfile.mkdtemp()
+try:
+    skoolfile = os.path.join(tmpdir, 'game.skool')
+    ctlfile = os.path.join(tmpdir, 'game.ctl')
+    write('Peak RSS:')
+    skool, rss = peak_rss('sna2skool.py', '-g', ctlfile, snafile)
+    write('  sna2skool.py : {}MiB'.format(rss))
+    with open(skoolfile, 'w') as f:
+        f.write(skool)
+    write('  skool2html.py: {}MiB'.format(peak_rss('skool2html.py', '-q', '-d', tmpdir, skoolfile)[1]))
+finally:
+    shutil.rmtree(tmpdir)
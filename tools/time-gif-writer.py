@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import time
+import gc
+import random
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit.gifwriter import GifWriter
+from skoolkit.graphics import Frame, Udg
+from skoolkit.image import ImageWriter
+
+BINSTR = [['{:0{}b}'.format(n, width) for n in range(2 ** width)] for width in range(13)]
+
+def write(line):
+    print(line)
+
+def clock(method, *args):
+    elapsed = []
+    for n in range(5):
+        gc.collect()
+        start = time.time()
+        method(*args)
+        elapsed.append(time.time() - start)
+    return min(elapsed)
+
+def compress_binstr(self, pixels, min_code_size):
+    # The previous implementation of GifWriter._compress(), which keys the
+    # dictionary on strings and accumulates the output bits in a string of
+    # '0' and '1' characters
+    init_d = {chr(i): i for i in range(1 << min_code_size)}
+    clear_code = 1 << min_code_size
+    stop_code = clear_code + 1
+    init_d[clear_code] = 0
+    init_d[stop_code] = 0
+
+    d = init_d.copy()
+    d_size = len(d) - 1
+    code_size = min_code_size + 1
+    d_limit = 1 << code_size
+    output = []
+    bit_buf = BINSTR[code_size][clear_code]
+    i = 0
+    num_p = len(pixels)
+    while 1:
+        if d_size == 4095:
+            bit_buf = BINSTR[-1][clear_code] + bit_buf
+            d = init_d.copy()
+            code_size = min_code_size + 1
+            d_limit = 1 << code_size
+
+        new_substr = ''
+        while i < num_p:
+            new_substr += pixels[i]
+            if new_substr in d:
+                substr = new_substr
+                i += 1
+            else:
+                break
+        bit_buf = BINSTR[code_size][d[substr]] + bit_buf
+
+        k = len(bit_buf)
+        if k > 1023:
+            while k > 31:
+                value = int(bit_buf[k - 32:k], 2)
+                output.extend((value & 255, (value >> 8) & 255, (value >> 16) & 255, value >> 24))
+                k -= 32
+            bit_buf = bit_buf[:k]
+
+        if new_substr not in d:
+            d_size = len(d)
+            if d_size == d_limit:
+                code_size += 1
+                d_limit *= 2
+            d[new_substr] = d_size
+        else:
+            break
+
+    bit_buf = BINSTR[code_size][stop_code] + bit_buf
+    while bit_buf:
+        output.append(int(bit_buf[-8:], 2))
+        bit_buf = bit_buf[:-8]
+
+    return output
+
+def get_frames(num_frames, scale):
+    # Build an animation of screen-sized frames, each containing a mixture of
+    # blank space, solid blocks and noise in various colours
+    random.seed(0)
+    frames = []
+    for n in range(num_frames):
+        udgs = []
+        for y in range(24):
+            row = []
+            for x in range(32):
+                kind = random.randrange(4)
+                if kind == 0:
+                    data = [0] * 8
+                elif kind == 1:
+                    data = [255] * 8
+                else:
+                    data = [random.randrange(256) for i in range(8)]
+                row.append(Udg(random.choice((56, 7, 66, 120, 23)), data))
+            udgs.append(row)
+        frames.append(Frame(udgs, scale))
+    return frames
+
+def write_gif(image_writer, frames):
+    f = io.BytesIO()
+    image_writer.write_image(frames, f, 'gif')
+    return f.getvalue()
+
+def show_usage():
+    sys.stderr.write("""Usage: {} [N [SCALE]]
+
+  Time the creation of an animated GIF of N screen-sized frames (default: 10)
+  at scale SCALE (default: 2) by the current development version of SkoolKit,
+  and by the previous implementation of the LZW compressor in GifWriter (which
+  builds its dictionary on strings and accumulates the output bits in a string
+  of '0' and '1' characters).
+""".format(os.path.basename(sys.argv[0])))
+    sys.exit()
+
+###############################################################################
+# Begin
+###############################################################################
+args = sys.argv[1:]
+if len(args) > 2 or any([not a.isdigit() for a in args]):
+    show_usage()
+num_frames = int(args[0]) if args else 10
+scale = int(args[1]) if len(args) > 1 else 2
+image_writer = ImageWriter()
+frames = get_frames(num_frames, scale)
+num_pixels = sum([f.width * f.height for f in frames])
+write('Writing a {}-frame GIF ({} pixels):'.format(num_frames, num_pixels))
+gif = write_gif(image_writer, frames)
+elapsed = clock(write_gif, image_writer, frames)
+write('  Current : {:.3f}s ({:.0f} pixels/s)'.format(elapsed, num_pixels / elapsed))
+compress = GifWriter._compress
+GifWriter._compress = compress_binstr
+if bytes(write_gif(image_writer, frames)) != gif:
+    sys.stderr.write('Output differs; aborting\n')
+    sys.exit(1)
+elapsed = clock(write_gif, image_writer, frames)
+write('  Previous: {:.3f}s ({:.0f} pixels/s)'.format(elapsed, num_pixels / elapsed))
+GifWriter._compress = compress
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import gc
+import tempfile
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit import SkoolParsingError, skoolhtml, skoolmacro
+from skoolkit.refparser import RefParser
+from skoolkit.skoolhtml import HtmlWriter, FileInfo
+from skoolkit.skoolparser import SkoolParser
+
+# A paragraph of [Page:*] content that uses a representative mix of macros
+PARAGRAPH = """<p>
+The routine at #R{0} (#N{0}) is called from #R{1}, and stores #N(#PEEK{0}) at
+#N({0}+1). #IF({0}>32800)(It is one of the later routines.)(It is one of the
+earlier routines.) #FOR1,4(n,#N(n*{0}),, ) #LINK:Changelog(see the changelog).
+</p>
+"""
+
+def write(line):
+    print(line)
+
+def clock(method, *args):
+    elapsed = []
+    for n in range(5):
+        gc.collect()
+        start = time.time()
+        method(*args)
+        elapsed.append((time.time() - start) * 1000)
+    return min(elapsed)
+
+def expand(writer, text, cwd):
+    # Start with an empty expansion cache so that every run does the same work
+    writer._expansions.clear()
+    return writer.expand(text, cwd)
+
+def expand_macros_rescan(writer, text, *cwd):
+    # The previous implementation of skoolmacro.expand_macros(), which
+    # rebuilds the text and searches it from the beginning after each macro is
+    # expanded
+    skoolmacro._writer = writer
+    skoolmacro._cwd = cwd
+
+    if text.find('#') < 0:
+        return text
+
+    while 1:
+        search = skoolmacro.RE_MACRO.search(text)
+        if not search:
+            break
+        marker = search.group()
+        if marker not in writer.macros:
+            raise SkoolParsingError('Found unknown macro: {}'.format(marker))
+        start, index = search.span()
+
+        while skoolmacro.RE_EXPAND.match(text, index):
+            end, expr = skoolmacro.parse_strings(text, index + 1, 1)
+            text = text[:index] + expand_macros_rescan(writer, expr, *cwd) + text[end:]
+
+        repf = writer.macros[marker]
+        try:
+            end, rep = repf(text, index, *cwd)
+        except skoolmacro.UnsupportedMacroError:
+            raise SkoolParsingError('Found unsupported macro: {}'.format(marker))
+        except skoolmacro.MacroParsingError as e:
+            raise SkoolParsingError('Error while parsing {} macro: {}'.format(marker, e.args[0]))
+        text = text[:start] + rep + text[end:]
+
+    return text
+
+def get_writer(num_entries):
+    skool = ['@start']
+    for i in range(num_entries):
+        address = 32768 + i * 4
+        skool.extend(('; Routine {}'.format(i), 'c{} LD A,{}'.format(address, i % 256), ' {} RET'.format(address + 3), ''))
+    with tempfile.NamedTemporaryFile('w', suffix='.skool') as f:
+        f.write('\n'.join(skool))
+        f.flush()
+        skool_parser = SkoolParser(f.name, html=True)
+    writer = HtmlWriter(skool_parser, RefParser(), FileInfo('.', 'game', False))
+    return writer, writer._set_cwd('Changelog')[1]
+
+def get_page(num_entries):
+    page = []
+    for i in range(num_entries):
+        address = 32768 + i * 4
+        page.append(PARAGRAPH.format(address, 32768 + ((i + 1) % num_entries) * 4))
+    return ''.join(page)
+
+def show_usage():
+    sys.stderr.write("""Usage: {} [N]
+
+  Time the expansion of the skool macros in a [Page:*] section containing N
+  paragraphs (default: 1000) by the current development version of SkoolKit,
+  and by the previous implementation of the macro expansion engine (which
+  rescans the text from the beginning after each macro is expanded).
+""".format(os.path.basename(sys.argv[0])))
+    sys.exit()
+
+###############################################################################
+# Begin
+###############################################################################
+args = sys.argv[1:]
+if len(args) > 1 or (args and not args[0].isdigit()):
+    show_usage()
+num_entries = int(args[0]) if args else 1000
+writer, cwd = get_writer(num_entries)
+page = get_page(num_entries)
+write('Expanding {} characters of [Page:*] content:'.format(len(page)))
+expand_macros = skoolmacro.expand_macros
+output = expand(writer, page, cwd)
+write('  Single pass: {:.1f}ms'.format(clock(expand, writer, page, cwd)))
+skoolhtml.expand_macros = expand_macros_rescan
+if expand(writer, page, cwd) != output:
+    sys.stderr.write('Output differs; aborting\n')
+    sys.exit(1)
+write('  Rescanning : {:.1f}ms'.format(clock(expand, writer, page, cwd)))
+skoolhtml.expand_macros = expand_macros
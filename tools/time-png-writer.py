@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import io
+import time
+import gc
+import random
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit.graphics import Frame, Udg
+from skoolkit.image import ImageWriter
+
+def write(line):
+    print(line)
+
+def clock(method, *args):
+    elapsed = []
+    for n in range(5):
+        gc.collect()
+        start = time.time()
+        method(*args)
+        elapsed.append((time.time() - start) * 1000)
+    return min(elapsed)
+
+def get_udgs(attrs, masked):
+    # Build a screen-sized array of tiles, each containing blank space, a solid
+    # block or noise
+    random.seed(0)
+    udgs = []
+    for y in range(24):
+        row = []
+        for x in range(32):
+            kind = random.randrange(4)
+            if kind == 0:
+                data = [0] * 8
+            elif kind == 1:
+                data = [255] * 8
+            else:
+                data = [random.randrange(256) for i in range(8)]
+            if masked:
+                mask = [b ^ 255 for b in data]
+            else:
+                mask = None
+            row.append(Udg(random.choice(attrs), data, mask))
+        udgs.append(row)
+    return udgs
+
+def write_png(image_writer, frames):
+    f = io.BytesIO()
+    image_writer.write_image(frames, f, 'png')
+    return f.getvalue()
+
+WORKLOADS = (
+    # Description, attributes, mask, cropped, number of frames
+    ('2 colours', (56,), 0, False, 1),
+    ('4 colours', (56, 7), 0, False, 1),
+    ('16 colours', (56, 7, 66, 120, 23, 41), 0, False, 1),
+    ('4 colours, masked', (56, 7), 1, False, 1),
+    ('16 colours, cropped', (56, 7, 66, 120, 23, 41), 0, True, 1),
+    ('16 colours, 4 frames', (56, 7, 66, 120, 23, 41), 0, False, 4)
+)
+
+def show_usage():
+    sys.stderr.write("""Usage: {} [SCALES]
+
+  Time the creation of screen-sized PNG images of various kinds by the current
+  development version of SkoolKit at each scale in SCALES (a comma-separated
+  list; default: 1,2,3,4).
+""".format(os.path.basename(sys.argv[0])))
+    sys.exit()
+
+###############################################################################
+# Begin
+###############################################################################
+args = sys.argv[1:]
+if len(args) > 1 or (args and not all([s.isdigit() for s in args[0].split(',')])):
+    show_usage()
+scales = [int(s) for s in args[0].split(',')] if args else (1, 2, 3, 4)
+image_writer = ImageWriter()
+write('Image (scale)' + ''.join(['{:>10}'.format(s) for s in scales]))
+for desc, attrs, mask, cropped, num_frames in WORKLOADS:
+    udgs = get_udgs(attrs, mask)
+    timings = []
+    for scale in scales:
+        if cropped:
+            frames = [Frame(udgs, scale, mask, scale, scale, 254 * scale, 190 * scale)]
+        else:
+            frames = [Frame(udgs, scale, mask) for i in range(num_frames)]
+        timings.append('{:8.1f}ms'.format(clock(write_png, image_writer, frames)))
+    write(desc.ljust(24) + ''.join(timings))
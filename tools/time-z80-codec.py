@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import gc
+import random
+
+# Use the current development version of SkoolKit
+SKOOLKIT_HOME = os.environ.get('SKOOLKIT_HOME')
+if not SKOOLKIT_HOME:
+    sys.stderr.write('SKOOLKIT_HOME is not set; aborting\n')
+    sys.exit(1)
+if not os.path.isdir(SKOOLKIT_HOME):
+    sys.stderr.write('SKOOLKIT_HOME={}; directory not found\n'.format(SKOOLKIT_HOME))
+    sys.exit(1)
+sys.path.insert(0, SKOOLKIT_HOME)
+
+from skoolkit import snapshot
+
+def write(line):
+    print(line)
+
+def clock(method, *args):
+    elapsed = []
+    for n in range(5):
+        gc.collect()
+        start = time.time()
+        method(*args)
+        elapsed.append(time.time() - start)
+    return min(elapsed)
+
+def make_z80_ram_block_bytewise(data, page):
+    # The previous implementation of snapshot.make_z80_ram_block(), which
+    # examines one byte at a time
+    block = []
+    prev_b = None
+    count = 0
+    for b in data:
+        if b == prev_b or prev_b is None:
+            prev_b = b
+            if count < 255:
+                count += 1
+                continue
+        if count > 4 or (count > 1 and prev_b == 237):
+            block.extend((237, 237, count, prev_b))
+        elif prev_b == 237:
+            block.extend((237, b))
+            prev_b = None
+            count = 0
+            continue
+        else:
+            block.extend((prev_b,) * count)
+        prev_b = b
+        count = 1
+    if count > 4 or (count > 1 and prev_b == 237):
+        block.extend((237, 237, count, prev_b))
+    else:
+        block.extend((prev_b,) * count)
+    length = len(block)
+    return [length % 256, length // 256, page] + block
+
+def decompress_block_bytewise(ramz):
+    # The previous implementation of snapshot._decompress_block(), which
+    # examines one byte at a time
+    block = []
+    i = 0
+    while i < len(ramz):
+        b = ramz[i]
+        i += 1
+        if b == 237:
+            c = ramz[i]
+            i += 1
+            if c == 237:
+                length, byte = ramz[i], ramz[i + 1]
+                block += [byte] * length
+                i += 2
+            else:
+                block += [b, c]
+        else:
+            block.append(b)
+    return block
+
+def get_banks(num_banks):
+    # Build 16K banks that contain a mix of empty space, long runs, ED bytes
+    # and noise (standing in for code and graphic data)
+    random.seed(0)
+    banks = []
+    for n in range(num_banks):
+        bank = []
+        while len(bank) < 16384:
+            kind = random.randrange(4)
+            if kind == 0:
+                bank.extend([0] * random.randrange(1, 600))
+            elif kind == 1:
+                bank.extend([random.randrange(256)] * random.randrange(1, 20))
+            elif kind == 2:
+                bank.extend([237, random.randrange(256)] * random.randrange(1, 4))
+            else:
+                bank.extend([random.randrange(256) for i in range(random.randrange(1, 200))])
+        banks.append(bytes(bank[:16384]))
+    return banks
+
+def encode(make_block, banks):
+    return [make_block(bank, n + 3)[3:] for n, bank in enumerate(banks)]
+
+def decode(decompress, blocks):
+    return [decompress(block) for block in blocks]
+
+def show_usage():
+    sys.stderr.write("""Usage: {}
+
+  Time the compression and decompression of the RAM banks of 48K and 128K Z80
+  snapshots by the current development version of SkoolKit, and by the
+  previous (byte-at-a-time) implementation of the Z80 RLE codec.
+""".format(os.path.basename(sys.argv[0])))
+    sys.exit()
+
+###############################################################################
+# Begin
+###############################################################################
+if len(sys.argv) > 1:
+    show_usage()
+for desc, num_banks in (('48K', 3), ('128K', 8)):
+    banks = get_banks(num_banks)
+    size = 16384 * num_banks
+    blocks = encode(snapshot.make_z80_ram_block, banks)
+    if [list(b) for b in blocks] != encode(make_z80_ram_block_bytewise, banks):
+        sys.stderr.write('Compressed data differs; aborting\n')
+        sys.exit(1)
+    if [bytes(b) for b in decode(snapshot._decompress_block, blocks)] != banks:
+        sys.stderr.write('Round trip failed; aborting\n')
+        sys.exit(1)
+    write('{} ({} bytes, compressed to {} bytes):'.format(desc, size, sum([len(b) for b in blocks])))
+    for name, make_block, decompress in (
+            ('Current   ', snapshot.make_z80_ram_block, snapshot._decompress_block),
+            ('Bytewise  ', make_z80_ram_block_bytewise, decompress_block_bytewise)
+    ):
+        enc_time = clock(encode, make_block, banks)
+        dec_time = clock(decode, decompress, blocks)
+        write('  {}: compress {:6.1f}ms ({:5.1f}MB/s), decompress {:6.1f}ms ({:5.1f}MB/s)'.format(
+            name, enc_time * 1000, size / enc_time / 1e6, dec_time * 1000, size / dec_time / 1e6))